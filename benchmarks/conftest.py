@@ -0,0 +1,82 @@
+import csv
+import pathlib
+import random
+
+import pytest
+
+from plane_spotter.geolocator import Geolocator
+from plane_spotter.package import airport_code_path
+from tests.conftest import DEFAULT_AIRPORT_CSV
+
+# Roughly the size of OurAirports' airport-codes.csv
+SYNTHETIC_AIRPORTS = 75_000
+# Share of synthetic airports inside CONTINENTAL_US, which like the real data
+# holds most of the world's airports
+US_SHARE = 0.4
+CONTINENTAL_US = ((24.5, 49.0), (-124.7, -67.0))
+AIRPORT_TYPES = (
+    ("small_airport", 0.55),
+    ("heliport", 0.2),
+    ("closed", 0.1),
+    ("medium_airport", 0.08),
+    ("seaplane_base", 0.02),
+    ("large_airport", 0.01),
+    ("balloonport", 0.04),
+)
+
+
+def write_synthetic_airport_csv(path: pathlib.Path, rows: int, seed: int = 0) -> None:
+    """Writes an airport-codes.csv shaped file of `rows` random airports. The
+    same seed always gives the same file."""
+    rng = random.Random(seed)
+    types, weights = zip(*AIRPORT_TYPES)
+    with path.open("w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(DEFAULT_AIRPORT_CSV.splitlines()[0].split(","))
+        for i in range(rows):
+            if rng.random() < US_SHARE:
+                (lat_min, lat_max), (lon_min, lon_max) = CONTINENTAL_US
+                lat = rng.uniform(lat_min, lat_max)
+                lon = rng.uniform(lon_min, lon_max)
+                country, region = "US", "US-TX"
+            else:
+                lat = rng.uniform(-60, 75)
+                lon = rng.uniform(-180, 180)
+                country, region = "ZZ", "ZZ-U-A"
+            ident = f"X{i:06d}"
+            writer.writerow(
+                [
+                    ident,
+                    rng.choices(types, weights)[0],
+                    f"Synthetic Airport {i}",
+                    str(rng.randint(0, 10000)),
+                    "NA",
+                    country,
+                    region,
+                    "Somewhere",
+                    ident,
+                    "",
+                    ident,
+                    f"{lat}, {lon}",
+                ]
+            )
+
+
+@pytest.fixture(scope="session")
+def airport_csv(tmp_path_factory) -> pathlib.Path:
+    """
+    The package's airport-codes.csv, copied so its compiled database can be
+    built and removed freely. Without one, a synthetic file of the same size
+    stands in, so results are comparable between checkouts.
+    """
+    path = tmp_path_factory.mktemp("airports") / "airport-codes.csv"
+    if airport_code_path().exists():
+        path.write_bytes(airport_code_path().read_bytes())
+    else:
+        write_synthetic_airport_csv(path, SYNTHETIC_AIRPORTS)
+    return path
+
+
+@pytest.fixture(scope="session")
+def geolocator(airport_csv) -> Geolocator:
+    return Geolocator(airport_code_file=airport_csv)
@@ -0,0 +1,51 @@
+import pytest
+
+from plane_spotter.airport_db import default_database_path
+from plane_spotter.geolocator import Geolocator
+
+LOCATIONS = {
+    # Chicago, among the densest airport clusters in the world
+    "dense": (41.88, -87.63),
+    # The middle of the Pacific, nowhere near an airport
+    "sparse": (0.0, -150.0),
+}
+
+
+def test_load_from_csv(benchmark, airport_csv):
+    """Startup when the CSV hasn't been compiled yet."""
+
+    def remove_database():
+        default_database_path(airport_csv).unlink(missing_ok=True)
+
+    benchmark.pedantic(
+        Geolocator,
+        kwargs={"airport_code_file": airport_csv},
+        setup=remove_database,
+        rounds=3,
+    )
+
+
+def test_load_compiled(benchmark, airport_csv):
+    """Startup from the compiled database, the usual case."""
+    Geolocator(airport_code_file=airport_csv)
+    benchmark(Geolocator, airport_code_file=airport_csv)
+
+
+@pytest.mark.parametrize("max_distance", [10, 100, 1000])
+@pytest.mark.parametrize("location", LOCATIONS)
+def test_lookup_airport(benchmark, geolocator, location, max_distance):
+    benchmark(
+        geolocator.lookup_airport,
+        coordinates=LOCATIONS[location],
+        max_distance=max_distance,
+    )
+
+
+@pytest.mark.parametrize("location", LOCATIONS)
+def test_lookup_airports(benchmark, geolocator, location):
+    """A fleet of 100 aircraft resolved in one batch."""
+    benchmark(
+        geolocator.lookup_airports,
+        coords=[LOCATIONS[location]] * 100,
+        max_distance=100,
+    )
@@ -0,0 +1,37 @@
+import pytest
+from pytest_httpserver import HTTPServer
+
+from plane_spotter.adsb import ADSBExchange
+from plane_spotter.loop import main_loop
+from tests.conftest import NotificationStub
+
+from benchmarks.test_geolocator import LOCATIONS
+
+ADSB_DATA = {
+    # Parked at an airport
+    "dense": {"alt_baro": "ground", "gs": 0, "lat": 41.88, "lon": -87.63},
+    # Cruising over the Pacific
+    "sparse": {"alt_baro": 43000, "gs": 480, "lat": 0.0, "lon": -150.0},
+}
+assert ADSB_DATA.keys() == LOCATIONS.keys()
+
+
+@pytest.mark.parametrize("location", ADSB_DATA)
+def test_main_loop_cycle(benchmark, geolocator, httpserver: HTTPServer, location):
+    """One cycle of main_loop: fetch, geolocate, update and notify."""
+    httpserver.expect_request("/v2/hex/A835AF/").respond_with_json(ADSB_DATA[location])
+    notification_backend = NotificationStub()
+    with ADSBExchange(
+        key="foo", hostname="localhost", port=httpserver.port, https=False
+    ) as adsb:
+        benchmark(
+            main_loop,
+            adsb_backend=adsb,
+            geolocator=geolocator,
+            notification_backend=notification_backend,
+            # notify's default
+            search_radius=1000,
+            icao_hex_id="A835AF",
+            loop_interval=0,
+            num_loops=1,
+        )
@@ -0,0 +1,23 @@
+import datetime
+
+from plane_spotter.geolocator import Airport, AirportDiscovery
+from plane_spotter.notification import plane_landed_message
+from plane_spotter.loop import HASHTAGS
+
+
+def test_plane_landed_message(benchmark):
+    now = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+    source = AirportDiscovery(
+        airport=Airport(ident="KAUS", name="Austin Bergstrom", iso_region="US-TX"),
+        discovery_time=now,
+    )
+    destination = AirportDiscovery(
+        airport=Airport(ident="KSJC", name="San Jose", iso_region="US-CA"),
+        discovery_time=now + datetime.timedelta(hours=3, minutes=27),
+    )
+    benchmark(
+        plane_landed_message,
+        source=source,
+        destination=destination,
+        hashtags=HASHTAGS,
+    )
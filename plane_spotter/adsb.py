@@ -1,19 +1,143 @@
+import asyncio
+import email.utils
+import functools
+import random
+import time
+
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import TYPE_CHECKING, Any, Optional
+from urllib3.util.retry import Retry
+
+from plane_spotter.metrics import ADSB_REQUEST_SECONDS, ADSB_RESPONSES
+
+if TYPE_CHECKING:
+    # httpx is only imported once an AsyncADSBExchange is created, it is slow
+    # to import and single aircraft polling doesn't need it
+    import httpx
+
+    from plane_spotter.adsb_cache import AsyncResponseCache, ResponseCache
+    from plane_spotter.replay import TraceRecorder
+
+# Statuses worth retrying: rate limiting and transient server-side failures
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+DEFAULT_HOSTNAME = "adsbexchange-com1.p.rapidapi.com"
+# Upper bound on the hex ids requested at once, keeping URLs a sane length
+MAX_HEX_IDS_PER_REQUEST = 100
+
+
+def backoff_delay(
+    retry: int, backoff_factor: float, backoff_jitter: float, backoff_max: float
+) -> float:
+    """Seconds to wait before retry number `retry` (starting at 1). This is the
+    same schedule urllib3's Retry uses for ADSBExchange."""
+    if retry <= 1:
+        return 0.0
+    delay = backoff_factor * 2 ** (retry - 1) + random.random() * backoff_jitter
+    return max(0.0, min(backoff_max, delay))
+
+
+def retry_after(response: "httpx.Response") -> float | None:
+    """Parses a Retry-After header given either in seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def position_time(adsb_data: dict[str, Any]) -> float | None:
+    """
+    When the position in adsb_data was received, in seconds since the epoch:
+    the response's ctime, in milliseconds, less seen_pos (or seen) seconds.
+    Polls answered from ADSBExchange's own cache repeat the same position
+    time. None if adsb_data lacks the fields.
+    """
+    try:
+        seen = adsb_data["seen_pos"] if "seen_pos" in adsb_data else adsb_data["seen"]
+        # Rounded so float error doesn't tell equal times apart
+        return round(adsb_data["ctime"] / 1000 - seen, 1)
+    except (KeyError, TypeError):
+        return None
 
 
 class ADSBExchange:
     def __init__(
         self,
         key: str,
-        hostname: str = "adsbexchange-com1.p.rapidapi.com",
+        hostname: str = DEFAULT_HOSTNAME,
         port=443,
         https: bool = True,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        backoff_jitter: float = 0.5,
+        backoff_max: float = 60.0,
+        pool_maxsize: int = 10,
+        recorder: "TraceRecorder | None" = None,
+        cache: "ResponseCache[requests.Response] | None" = None,
     ):
+        """
+        Requests go through a persistent session so the TCP and TLS connection
+        to the API is kept alive between polls. pool_maxsize bounds how many
+        connections are kept open for concurrent callers.
+
+        Requests that fail to connect, or that get a status in RETRY_STATUSES,
+        are retried up to `retries` times. The first retry is immediate;
+        retry n waits backoff_factor * 2 ** (n - 1) seconds plus up to
+        backoff_jitter seconds of random jitter, capped at backoff_max. A
+        Retry-After header on the response takes precedence over the computed
+        delay.
+
+        If recorder is given, every response is written to it so the session
+        can be replayed later with ReplayADSBExchange.
+
+        If cache is given, responses are served from it while fresh, and
+        concurrent identical requests share one API request. Only requests
+        without extra headers are cached.
+        """
         self._hostname = hostname
         self._key = key
         protocol = "https" if https else "http"
         self._base_url = f"{protocol}://{self._hostname}:{port}/v2/"
+        self._timeout = (connect_timeout, read_timeout)
+        self._recorder = recorder
+        self._cache = cache
+
+        retry = Retry(
+            total=retries,
+            allowed_methods=frozenset(("GET",)),
+            status_forcelist=RETRY_STATUSES,
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            backoff_max=backoff_max,
+            respect_retry_after_header=True,
+            # Hand the last response back to the caller rather than raising
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry
+        )
+        self._session = requests.Session()
+        self._session.mount(f"{protocol}://", adapter)
+        self._session.headers.update(self._headers())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self._session.close()
 
     def _headers(self) -> dict:
         return {
@@ -25,12 +149,24 @@ class ADSBExchange:
         return self._base_url + "/".join(path) + "/"
 
     def GET(self, path: list[str], headers: Optional[dict] = None) -> requests.Response:
-        if headers is None:
-            headers = dict()
+        if self._cache is not None and headers is None:
+            return self._cache.get(path, functools.partial(self._fetch, path, None))
+        return self._fetch(path, headers)
 
-        return requests.request(
-            "GET", self._url(path=path), headers={**self._headers(), **headers}
-        )
+    def _fetch(self, path: list[str], headers: Optional[dict]) -> requests.Response:
+        endpoint = path[0]
+        try:
+            with ADSB_REQUEST_SECONDS.labels(endpoint=endpoint).time():
+                response = self._session.get(
+                    self._url(path=path), headers=headers, timeout=self._timeout
+                )
+        except requests.RequestException:
+            ADSB_RESPONSES.labels(endpoint=endpoint, status="error").inc()
+            raise
+        ADSB_RESPONSES.labels(endpoint=endpoint, status=response.status_code).inc()
+        if self._recorder is not None:
+            self._recorder.record(path, response.status_code, response.text)
+        return response
 
     def position_by_registration(self, registration: str) -> requests.Response:
         return self.GET(path=["registration", registration])
@@ -40,3 +176,147 @@ class ADSBExchange:
 
     def aircraft_last_position_by_hex_id(self, hex_id: str) -> requests.Response:
         return self.GET(path=["hex", hex_id])
+
+    def aircraft_by_hex_ids(self, hex_ids: list[str]) -> requests.Response:
+        """Every aircraft in hex_ids, returned as a list under "ac"."""
+        return self.GET(path=["hex", ",".join(hex_ids)])
+
+    def aircraft_in_area(
+        self, lat: float, lon: float, dist: float
+    ) -> requests.Response:
+        """Every aircraft within dist nautical miles of (lat, lon), under "ac"."""
+        return self.GET(path=["lat", str(lat), "lon", str(lon), "dist", str(dist)])
+
+
+class AsyncADSBExchange:
+    """
+    asyncio counterpart of ADSBExchange with the same lookup methods, timeout
+    and retry behavior. Connections are pooled by an httpx.AsyncClient, which
+    must be closed with aclose() or by using the object as an async context
+    manager.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        hostname: str = DEFAULT_HOSTNAME,
+        port=443,
+        https: bool = True,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        backoff_jitter: float = 0.5,
+        backoff_max: float = 60.0,
+        pool_maxsize: int = 10,
+        recorder: "TraceRecorder | None" = None,
+        cache: "AsyncResponseCache[httpx.Response] | None" = None,
+    ):
+        import httpx
+
+        self._hostname = hostname
+        self._key = key
+        protocol = "https" if https else "http"
+        self._base_url = f"{protocol}://{self._hostname}:{port}/v2/"
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._backoff_jitter = backoff_jitter
+        self._backoff_max = backoff_max
+        self._recorder = recorder
+        self._cache = cache
+        self._client = httpx.AsyncClient(
+            headers=self._headers(),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize
+            ),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _headers(self) -> dict:
+        return {
+            "X-RapidAPI-Key": self._key,
+            "X-RapidAPI-Host": self._hostname,
+        }
+
+    def _url(self, path: list[str]) -> str:
+        return self._base_url + "/".join(path) + "/"
+
+    async def GET(
+        self, path: list[str], headers: Optional[dict] = None
+    ) -> "httpx.Response":
+        if self._cache is not None and headers is None:
+            return await self._cache.get(
+                path, functools.partial(self._fetch, path, None)
+            )
+        return await self._fetch(path, headers)
+
+    async def _fetch(
+        self, path: list[str], headers: Optional[dict]
+    ) -> "httpx.Response":
+        import httpx
+
+        endpoint = path[0]
+        try:
+            with ADSB_REQUEST_SECONDS.labels(endpoint=endpoint).time():
+                response = await self._get(path, headers)
+        except httpx.TransportError:
+            ADSB_RESPONSES.labels(endpoint=endpoint, status="error").inc()
+            raise
+        ADSB_RESPONSES.labels(endpoint=endpoint, status=response.status_code).inc()
+        return response
+
+    async def _get(self, path: list[str], headers: Optional[dict]) -> "httpx.Response":
+        import httpx
+
+        url = self._url(path=path)
+        retry = 0
+        while True:
+            try:
+                response = await self._client.get(url, headers=headers)
+            except httpx.TransportError:
+                if retry >= self._retries:
+                    raise
+                delay = None
+            else:
+                if response.status_code not in RETRY_STATUSES or retry >= self._retries:
+                    # Only the response acted on is recorded, like ADSBExchange
+                    if self._recorder is not None:
+                        await response.aread()
+                        self._recorder.record(path, response.status_code, response.text)
+                    return response
+                delay = retry_after(response)
+                await response.aclose()
+            retry += 1
+            if delay is None:
+                delay = backoff_delay(
+                    retry, self._backoff_factor, self._backoff_jitter, self._backoff_max
+                )
+            await asyncio.sleep(delay)
+
+    async def position_by_registration(self, registration: str) -> "httpx.Response":
+        return await self.GET(path=["registration", registration])
+
+    async def aircraft_by_callsign(self, callsign: str) -> "httpx.Response":
+        return await self.GET(path=["callsign", callsign])
+
+    async def aircraft_last_position_by_hex_id(self, hex_id: str) -> "httpx.Response":
+        return await self.GET(path=["hex", hex_id])
+
+    async def aircraft_by_hex_ids(self, hex_ids: list[str]) -> "httpx.Response":
+        return await self.GET(path=["hex", ",".join(hex_ids)])
+
+    async def aircraft_in_area(
+        self, lat: float, lon: float, dist: float
+    ) -> "httpx.Response":
+        return await self.GET(
+            path=["lat", str(lat), "lon", str(lon), "dist", str(dist)]
+        )
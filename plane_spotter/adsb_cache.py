@@ -0,0 +1,169 @@
+"""
+Response caches for ADSBExchange and AsyncADSBExchange, cutting down on paid
+API requests. Responses are kept for a few seconds keyed by request path, and
+identical requests made while one is already in flight wait for its response
+instead of making their own.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from plane_spotter.metrics import ADSB_CACHE_LOOKUPS
+
+Response = TypeVar("Response")
+
+_HITS = ADSB_CACHE_LOOKUPS.labels(result="hit")
+_MISSES = ADSB_CACHE_LOOKUPS.labels(result="miss")
+_COALESCED = ADSB_CACHE_LOOKUPS.labels(result="coalesced")
+
+
+def _cacheable(response: Any) -> bool:
+    # Errors and rate limiting are retried by the next poll, not served again
+    return response.status_code == 200
+
+
+class _Entries(Generic[Response]):
+    """Successful responses by path, expiring ttl seconds after they were
+    fetched. The least recently used is evicted past max_entries."""
+
+    def __init__(self, ttl: float, max_entries: int, clock: Callable[[], float]):
+        if ttl <= 0:
+            raise ValueError("ttl must be positive")
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        # path -> (expiry, response)
+        self._entries: collections.OrderedDict[Hashable, tuple[float, Response]] = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Response | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= self._clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Hashable, response: Response) -> None:
+        if not _cacheable(response):
+            return
+        self._entries[key] = (self._clock() + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class ResponseCache(Generic[Response]):
+    """
+    Caches ADSBExchange responses for ttl seconds, keeping at most
+    max_entries of them. Only 200 responses are cached. Safe to share between
+    threads: a thread asking for a path another thread is already fetching
+    waits for that response, and gets the same exception if it fails.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._entries: _Entries[Response] = _Entries(ttl, max_entries, clock)
+        self._in_flight: dict[Hashable, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, path: list[str], fetch: Callable[[], Response]) -> Response:
+        """The cached response for path, or what fetch() returns."""
+        key = tuple(path)
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                _HITS.inc()
+                return response
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._in_flight[key] = concurrent.futures.Future()
+        if not leader:
+            _COALESCED.inc()
+            return flight.result()
+
+        _MISSES.inc()
+        try:
+            response = fetch()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            self._entries.put(key, response)
+        flight.set_result(response)
+        return response
+
+
+class AsyncResponseCache(Generic[Response]):
+    """asyncio counterpart of ResponseCache, for AsyncADSBExchange. It must
+    only be used from one event loop."""
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._entries: _Entries[Response] = _Entries(ttl, max_entries, clock)
+        self._in_flight: dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(
+        self, path: list[str], fetch: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """The cached response for path, or what fetch() returns."""
+        key = tuple(path)
+        response = self._entries.get(key)
+        if response is not None:
+            _HITS.inc()
+            return response
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            _COALESCED.inc()
+            # Shielded so a cancelled waiter doesn't cancel the fetch for
+            # everyone else
+            return await asyncio.shield(flight)
+
+        _MISSES.inc()
+        flight = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await fetch()
+        except BaseException as e:
+            del self._in_flight[key]
+            if isinstance(e, Exception):
+                flight.set_exception(e)
+                # Marks it retrieved, nobody may be waiting on it
+                flight.exception()
+            else:
+                flight.cancel()
+            raise
+        del self._in_flight[key]
+        self._entries.put(key, response)
+        flight.set_result(response)
+        return response
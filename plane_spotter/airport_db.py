@@ -0,0 +1,290 @@
+"""
+Compiled, memory-mapped form of the airport-codes.csv file.
+
+Parsing the CSV and building an object per row takes seconds, so the CSV is
+compiled once into a columnar binary file which later processes mmap. The
+layout is:
+
+    header: magic, format version, row count, sha256 of the source CSV
+    section table: (offset, length) of every section, in SECTIONS order
+    sections: little-endian float64 latitude and longitude arrays, then for
+        every text field a uint32 offsets array (rows + 1 entries) followed by
+        the UTF-8 string table it indexes into. Low-cardinality fields
+        (CATEGORICAL_FIELDS) are dictionary encoded instead: a uint16 code per
+        row, and an offsets array and string table holding each distinct value
+        once.
+
+Sections are 8-byte aligned so they can be viewed as NumPy arrays directly.
+"""
+
+import csv
+import hashlib
+import mmap
+import os
+import pathlib
+import struct
+import sys
+import tempfile
+
+import numpy as np
+import structlog
+from structlog import get_logger
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+MAGIC = b"PSAIRDB\x00"
+FORMAT_VERSION = 2
+TEXT_FIELDS = (
+    "ident",
+    "type",
+    "name",
+    "elevation_ft",
+    "continent",
+    "iso_country",
+    "iso_region",
+    "municipality",
+    "gps_code",
+    "iata_code",
+    "local_code",
+)
+CATEGORICAL_FIELDS = frozenset(("type", "continent", "iso_country", "iso_region"))
+SECTIONS = ("latitude", "longitude") + tuple(
+    f"{field}.{part}"
+    for field in TEXT_FIELDS
+    for part in (
+        ("codes", "offsets", "strings")
+        if field in CATEGORICAL_FIELDS
+        else ("offsets", "strings")
+    )
+)
+
+_HEADER = struct.Struct("<8sII32s")
+_SECTION = struct.Struct("<QQ")
+_ALIGNMENT = 8
+
+
+def file_sha256(path: pathlib.Path) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def default_database_path(airport_code_file: pathlib.Path) -> pathlib.Path:
+    return pathlib.Path(airport_code_file).with_suffix(".bin")
+
+
+def _string_table(values: list[str]) -> tuple[bytes, bytes]:
+    encoded = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets.tobytes(), b"".join(encoded)
+
+
+def _dictionary_encode(values: list[str]) -> tuple[bytes, list[str]]:
+    dictionary: dict[str, int] = {}
+    codes = [dictionary.setdefault(value, len(dictionary)) for value in values]
+    if len(dictionary) > np.iinfo(np.uint16).max:
+        raise ValueError(f"too many distinct values to encode: {len(dictionary)}")
+    return np.array(codes, dtype="<u2").tobytes(), list(dictionary)
+
+
+def build_airport_database(
+    airport_code_file: pathlib.Path, database_file: pathlib.Path
+) -> None:
+    """Compiles airport_code_file into database_file. The file is replaced
+    atomically so concurrent readers never see a partial database."""
+    columns: dict[str, list[str]] = {field: [] for field in TEXT_FIELDS}
+    latitudes: list[float] = []
+    longitudes: list[float] = []
+    with open(airport_code_file, "r") as file:
+        for airport in csv.DictReader(file):
+            lat, lon = airport["coordinates"].split(", ")
+            latitudes.append(float(lat))
+            longitudes.append(float(lon))
+            for field in TEXT_FIELDS:
+                columns[field].append(airport[field])
+
+    sections = [
+        np.array(latitudes, dtype="<f8").tobytes(),
+        np.array(longitudes, dtype="<f8").tobytes(),
+    ]
+    for field in TEXT_FIELDS:
+        values = columns[field]
+        if field in CATEGORICAL_FIELDS:
+            codes, values = _dictionary_encode(values)
+            sections.append(codes)
+        sections.extend(_string_table(values))
+
+    offset = _HEADER.size + _SECTION.size * len(SECTIONS)
+    section_table = []
+    for section in sections:
+        offset += -offset % _ALIGNMENT
+        section_table.append(_SECTION.pack(offset, len(section)))
+        offset += len(section)
+
+    database_file = pathlib.Path(database_file)
+    fd, tmp_name = tempfile.mkstemp(
+        dir=database_file.parent, prefix=database_file.name, suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(
+                _HEADER.pack(
+                    MAGIC,
+                    FORMAT_VERSION,
+                    len(latitudes),
+                    file_sha256(airport_code_file),
+                )
+            )
+            file.write(b"".join(section_table))
+            for section in sections:
+                file.write(b"\x00" * (-file.tell() % _ALIGNMENT))
+                file.write(section)
+        # mkstemp creates the file owner-only; the database is shared data.
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, database_file)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+class AirportDatabase:
+    """Read-only view of a compiled airport database backed by mmap."""
+
+    def __init__(self, database_file: pathlib.Path):
+        with open(database_file, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, self._rows, self.csv_sha256 = _HEADER.unpack_from(
+            self._mmap
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{database_file} is not an airport database")
+
+        self._sections: dict[str, tuple[int, int]] = {}
+        if self.version == FORMAT_VERSION:
+            for i, name in enumerate(SECTIONS):
+                self._sections[name] = _SECTION.unpack_from(
+                    self._mmap, _HEADER.size + i * _SECTION.size
+                )
+            self.latitudes = self._array("latitude", "<f8")
+            self.longitudes = self._array("longitude", "<f8")
+            self._offsets = {
+                field: self._array(f"{field}.offsets", "<u4")
+                for field in TEXT_FIELDS
+                if field not in CATEGORICAL_FIELDS
+            }
+            self._codes = {
+                field: self._array(f"{field}.codes", "<u2")
+                for field in CATEGORICAL_FIELDS
+            }
+            # Each distinct value is decoded and interned once, so every airport
+            # built from the database shares the same string objects.
+            self._dictionaries = {
+                field: tuple(
+                    sys.intern(value)
+                    for value in self._strings(
+                        field, self._array(f"{field}.offsets", "<u4")
+                    )
+                )
+                for field in CATEGORICAL_FIELDS
+            }
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _array(self, section: str, dtype: str) -> np.ndarray:
+        offset, length = self._sections[section]
+        return np.frombuffer(
+            self._mmap,
+            dtype=dtype,
+            count=length // np.dtype(dtype).itemsize,
+            offset=offset,
+        )
+
+    def _strings(self, field: str, offsets: np.ndarray) -> list[str]:
+        bounds = offsets.tolist()
+        strings_offset, length = self._sections[f"{field}.strings"]
+        strings = self._mmap[strings_offset : strings_offset + length]
+        return [strings[start:end].decode() for start, end in zip(bounds, bounds[1:])]
+
+    def codes(self, field: str) -> np.ndarray:
+        """Per-row indices into dictionary(field) for a categorical field."""
+        return self._codes[field]
+
+    def dictionary(self, field: str) -> tuple[str, ...]:
+        """Distinct values of a categorical field."""
+        return self._dictionaries[field]
+
+    def value(self, field: str, row: int) -> str:
+        if field in CATEGORICAL_FIELDS:
+            return self._dictionaries[field][self._codes[field][row]]
+        start, end = self._offsets[field][row : row + 2].tolist()
+        strings_offset, _ = self._sections[f"{field}.strings"]
+        return self._mmap[strings_offset + start : strings_offset + end].decode()
+
+    def column(self, field: str) -> list[str]:
+        """Decodes every value of field."""
+        if field in CATEGORICAL_FIELDS:
+            dictionary = self._dictionaries[field]
+            return [dictionary[code] for code in self._codes[field].tolist()]
+        return self._strings(field, self._offsets[field])
+
+    def nonempty(self, field: str) -> np.ndarray:
+        """Per-row booleans, True where field has a value."""
+        if field in CATEGORICAL_FIELDS:
+            values = np.array([bool(value) for value in self._dictionaries[field]])
+            return values[self._codes[field]]
+        return np.diff(self._offsets[field]) > 0
+
+    def row(self, row: int) -> dict[str, str]:
+        return {field: self.value(field, row) for field in TEXT_FIELDS}
+
+
+def longest_runways(runway_file: pathlib.Path) -> dict[str, int]:
+    """
+    Length in feet of the longest open runway of every airport in an
+    OurAirports runways.csv, by airport ident. Runways without a length are
+    skipped.
+    """
+    lengths: dict[str, int] = {}
+    with open(runway_file, "r") as file:
+        for runway in csv.DictReader(file):
+            if runway["closed"] == "1" or not runway["length_ft"]:
+                continue
+            ident = runway["airport_ident"]
+            length = int(float(runway["length_ft"]))
+            if length > lengths.get(ident, 0):
+                lengths[ident] = length
+    return lengths
+
+
+def load_airport_database(
+    airport_code_file: pathlib.Path,
+    database_file: pathlib.Path | None = None,
+    log: structlog.stdlib.BoundLogger = logger,
+) -> AirportDatabase:
+    """
+    Opens the compiled database for airport_code_file, (re)building it first
+    if it is missing, was built by another format version, or was built from
+    a CSV with different contents.
+    """
+    if database_file is None:
+        database_file = default_database_path(airport_code_file)
+    database_file = pathlib.Path(database_file)
+    csv_sha256 = file_sha256(airport_code_file)
+
+    if database_file.exists():
+        try:
+            database = AirportDatabase(database_file)
+        except (ValueError, struct.error):
+            log.warning("airport database is corrupt", database_file=str(database_file))
+        else:
+            if database.version == FORMAT_VERSION and database.csv_sha256 == csv_sha256:
+                return database
+            log.info("airport database is stale", database_file=str(database_file))
+
+    log.info("building airport database", database_file=str(database_file))
+    build_airport_database(airport_code_file, database_file)
+    return AirportDatabase(database_file)
@@ -0,0 +1,242 @@
+import contextlib
+from dataclasses import dataclass
+import importlib.util
+import threading
+import time
+from typing import Any, Callable, Iterator
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+import structlog
+from structlog import get_logger
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+CHROME_ARGUMENTS = (
+    "--headless",
+    "--no-sandbox",
+    "--start-maximized",
+    "--incognito",
+    "--disable-dev-shm-usage",
+)
+
+# Creates a new WebDriver
+DriverFactory = Callable[[], Any]
+# Prepares a new WebDriver before first use, e.g. by logging in
+DriverSetup = Callable[[Any], None]
+# Bytes of memory a WebDriver uses, or None if unknown
+MemoryProbe = Callable[[Any], int | None]
+
+
+def chrome_driver(arguments: tuple[str, ...] = CHROME_ARGUMENTS) -> webdriver.Chrome:
+    options = Options()
+    for argument in arguments:
+        options.add_argument(argument)
+    return webdriver.Chrome(options=options)
+
+
+def process_rss_bytes(driver: Any) -> int | None:
+    """
+    Resident memory of the driver's service process, chromedriver, and every
+    process it started, which includes the browser and its renderers. None if
+    psutil isn't installed or the driver has no local service process.
+    """
+    service = getattr(driver, "service", None)
+    pid = getattr(getattr(service, "process", None), "pid", None)
+    if pid is None or importlib.util.find_spec("psutil") is None:
+        return None
+    import psutil
+
+    try:
+        process = psutil.Process(pid)
+        processes = [process, *process.children(recursive=True)]
+    except psutil.Error:
+        return None
+    rss = 0
+    for process in processes:
+        try:
+            rss += process.memory_info().rss
+        except psutil.Error:
+            # Exited in the meantime
+            pass
+    return rss
+
+
+@dataclass
+class _Browser:
+    driver: Any
+    uses: int = 0
+    baseline_memory: int | None = None
+
+
+class BrowserPool:
+    """
+    Keeps WebDriver instances warm between uses instead of starting a browser
+    each time.
+
+    At most max_browsers exist at once; borrowers wait for one to be free.
+    Browsers run `setup` once when created, so e.g. they are already logged
+    in when borrowed. Before a browser is lent out it is health checked and
+    replaced if it stopped responding. After use it is quit rather than
+    returned to the pool if it has been used max_uses times, its memory grew
+    by more than max_memory_growth_mb since its first use, or the borrower
+    raised a WebDriverException.
+
+    Memory is measured by memory_probe, by default the resident memory of the
+    browser's processes, which needs psutil. Without it browsers are only
+    recycled by uses.
+    """
+
+    def __init__(
+        self,
+        factory: DriverFactory = chrome_driver,
+        setup: DriverSetup | None = None,
+        max_browsers: int = 1,
+        max_uses: int = 100,
+        max_memory_growth_mb: float | None = 512,
+        memory_probe: MemoryProbe = process_rss_bytes,
+        log: structlog.stdlib.BoundLogger = logger,
+    ):
+        if max_browsers < 1:
+            raise ValueError("max_browsers must be at least 1")
+        self._factory = factory
+        self._setup = setup
+        self._max_uses = max_uses
+        self._max_memory_growth = (
+            max_memory_growth_mb * 2**20 if max_memory_growth_mb is not None else None
+        )
+        self._memory_probe = memory_probe
+        self._log = log
+        if (
+            self._max_memory_growth is not None
+            and memory_probe is process_rss_bytes
+            and importlib.util.find_spec("psutil") is None
+        ):
+            log.warning("psutil is not installed, browsers won't be recycled by memory")
+        self._slots = threading.BoundedSemaphore(max_browsers)
+        self._max_browsers = max_browsers
+        self._lock = threading.Lock()
+        self._idle: list[_Browser] = []
+        self._alive = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    @property
+    def alive(self) -> int:
+        return self._alive
+
+    def _create(self) -> _Browser:
+        start = time.monotonic()
+        with self._lock:
+            self._alive += 1
+        try:
+            driver = self._factory()
+        except BaseException:
+            with self._lock:
+                self._alive -= 1
+            raise
+        browser = _Browser(driver=driver)
+        try:
+            if self._setup is not None:
+                self._setup(driver)
+        except BaseException:
+            self._discard(browser)
+            raise
+        self._log.info("browser started", duration=time.monotonic() - start)
+        return browser
+
+    def _discard(self, browser: _Browser) -> None:
+        with self._lock:
+            self._alive -= 1
+        try:
+            browser.driver.quit()
+        except WebDriverException:
+            self._log.warning("failed to quit browser", exc_info=True)
+
+    def _healthy(self, browser: _Browser) -> bool:
+        try:
+            browser.driver.execute_script("return 1")
+            return True
+        except WebDriverException:
+            return False
+
+    def _should_recycle(self, browser: _Browser) -> str | None:
+        if browser.uses >= self._max_uses:
+            return "max uses reached"
+        if self._max_memory_growth is not None:
+            memory = self._memory_probe(browser.driver)
+            if memory is not None:
+                if browser.baseline_memory is None:
+                    browser.baseline_memory = memory
+                elif memory - browser.baseline_memory > self._max_memory_growth:
+                    return "memory grew"
+        return None
+
+    def warm(self, count: int = 1) -> None:
+        """Starts browsers until `count` are idle, without exceeding
+        max_browsers."""
+        while True:
+            with self._lock:
+                if len(self._idle) >= count or self._alive >= self._max_browsers:
+                    return
+            browser = self._create()
+            with self._lock:
+                self._idle.append(browser)
+
+    @contextlib.contextmanager
+    def browser(self) -> Iterator[Any]:
+        """Borrows a browser, which is returned to the pool on exit."""
+        if self._closed:
+            raise RuntimeError("browser pool is closed")
+        with self._slots:
+            browser = None
+            with self._lock:
+                if self._idle:
+                    browser = self._idle.pop()
+            if browser is not None and not self._healthy(browser):
+                self._log.warning("browser failed health check, replacing it")
+                self._discard(browser)
+                browser = None
+            if browser is None:
+                browser = self._create()
+
+            try:
+                yield browser.driver
+            except WebDriverException:
+                self._log.warning("browser raised an error, discarding it")
+                self._discard(browser)
+                raise
+            except BaseException:
+                self._release(browser)
+                raise
+            else:
+                self._release(browser)
+
+    def _release(self, browser: _Browser) -> None:
+        browser.uses += 1
+        reason = self._should_recycle(browser)
+        if reason is not None or self._closed:
+            if reason is not None:
+                self._log.info("recycling browser", reason=reason, uses=browser.uses)
+            self._discard(browser)
+            return
+        with self._lock:
+            self._idle.append(browser)
+
+    def close(self) -> None:
+        """Quits the idle browsers. Borrowed ones are quit when returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for browser in idle:
+            self._discard(browser)
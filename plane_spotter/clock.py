@@ -0,0 +1,55 @@
+import asyncio
+import datetime
+import time
+
+
+class Clock:
+    """Where the polling loops get the time from and how they wait."""
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    async def async_sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+SYSTEM_CLOCK = Clock()
+
+
+class VirtualClock(Clock):
+    """
+    A clock that only moves when slept on, so loops that sleep between polls
+    run as fast as they can compute.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._time = start
+
+    def time(self) -> float:
+        return self._time
+
+    def monotonic(self) -> float:
+        return self._time
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(self._time, datetime.timezone.utc)
+
+    def advance(self, seconds: float) -> None:
+        self._time += max(0.0, seconds)
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    async def async_sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+        # Still give other tasks a chance to run
+        await asyncio.sleep(0)
@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+
+import structlog
+from structlog import get_logger
+
+from plane_spotter.metrics import (
+    NOTIFICATION_QUEUE_DEPTH,
+    NOTIFICATION_SEND_SECONDS,
+    NOTIFICATIONS,
+)
+from plane_spotter.notification import NotificationBackend
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+# Put on the queue once per worker to tell it to exit
+_STOP = object()
+
+
+class NotificationDispatcher(NotificationBackend):
+    """
+    Sends notifications through `backend` from worker threads, so callers of
+    send() never wait on the backend.
+
+    Messages wait in a queue of at most queue_size. When it is full, new
+    messages are dropped and logged. A failed send is retried up to `retries`
+    times, waiting retry_backoff * 2 ** (attempt - 1) seconds before each
+    retry. Sends are started at most once per min_interval seconds across all
+    workers. Backends that aren't thread safe, like TwitterSelenium, need
+    workers=1.
+
+    close(), or leaving the context manager, stops accepting messages and
+    waits for the ones already queued to be sent.
+    """
+
+    def __init__(
+        self,
+        backend: NotificationBackend,
+        workers: int = 1,
+        queue_size: int = 100,
+        retries: int = 3,
+        retry_backoff: float = 5.0,
+        min_interval: float = 0.0,
+        log: structlog.stdlib.BoundLogger = logger,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self._backend = backend
+        backend_name = type(backend).__name__
+        self._send_seconds = NOTIFICATION_SEND_SECONDS.labels(backend=backend_name)
+        self._outcomes = {
+            outcome: NOTIFICATIONS.labels(backend=backend_name, outcome=outcome)
+            for outcome in ("sent", "failed", "gave_up", "dropped")
+        }
+        self._retries = retries
+        self._retry_backoff = retry_backoff
+        self._min_interval = min_interval
+        self._log = log
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._rate_lock = threading.Lock()
+        self._next_send = 0.0
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(
+                target=self._work, name=f"notification-worker-{i}", daemon=True
+            )
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def send(self, message: str, log: structlog.stdlib.BoundLogger = logger) -> bool:
+        """Queues message to be sent. Returns False if it had to be dropped."""
+        if self._closed:
+            raise RuntimeError("dispatcher is closed")
+        try:
+            self._queue.put_nowait((message, log))
+        except queue.Full:
+            log.error("notification queue is full, dropping message", message=message)
+            self._outcomes["dropped"].inc()
+            return False
+        NOTIFICATION_QUEUE_DEPTH.set(self._queue.qsize())
+        log.info("notification queued", queue_depth=self._queue.qsize())
+        return True
+
+    def _wait_for_rate_limit(self) -> None:
+        with self._rate_lock:
+            now = time.monotonic()
+            delay = self._next_send - now
+            self._next_send = max(now, self._next_send) + self._min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def _deliver(self, message: str, log: structlog.stdlib.BoundLogger) -> None:
+        attempt = 0
+        while True:
+            self._wait_for_rate_limit()
+            try:
+                with self._send_seconds.time():
+                    self._backend.send(message=message, log=log)
+                self._outcomes["sent"].inc()
+                return
+            except Exception:
+                attempt += 1
+                if attempt > self._retries:
+                    log.exception("giving up on notification", attempts=attempt)
+                    self._outcomes["gave_up"].inc()
+                    return
+                self._outcomes["failed"].inc()
+                delay = self._retry_backoff * 2 ** (attempt - 1)
+                log.exception("notification failed, retrying", retry_in=delay)
+                time.sleep(delay)
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            NOTIFICATION_QUEUE_DEPTH.set(self._queue.qsize())
+            try:
+                if item is _STOP:
+                    return
+                self._deliver(*item)
+            finally:
+                self._queue.task_done()
+
+    def close(self) -> None:
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._log.info("draining notification queue", queue_depth=self.qsize())
+        for _ in self._workers:
+            # Blocks while the queue is full, so queued messages go out first
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
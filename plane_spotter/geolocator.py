@@ -1,17 +1,51 @@
-from copy import deepcopy
 import datetime
-from typing import Any
+import functools
+import math
+import time
+from typing import Any, Collection, Hashable, Iterable, Sequence
 
-import csv
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import haversine
+import numpy as np
 import pathlib
 
+from plane_spotter.airport_db import (
+    AirportDatabase,
+    default_database_path,
+    load_airport_database,
+    longest_runways,
+)
+from plane_spotter.metrics import GEOLOCATION_SECONDS, GEOLOCATIONS
+from plane_spotter.proximity import (
+    EARTH_RADIUS_KM,
+    ProximityMask,
+    coordinates_sha256,
+    load_proximity_mask,
+    mask_path,
+)
+
 AIRPORT_TYPE_BLACKLIST = set(("balloonport", "closed", "heliport", "seaplane_base"))
 DEFAULT_PATH = pathlib.Path("plane_spotter/data/airport-codes.csv")
+GRID_CELL_DEGREES = 1.0
+# Distances computed with numpy can differ from haversine.haversine in the last
+# few ULPs. Candidates this close to the best vectorized distance are re-checked
+# with haversine.haversine so results match lookup_airport exactly.
+DISTANCE_TOLERANCE_KM = 1e-6
+# Number of Airport objects kept around for reuse. Tracked aircraft spend most
+# of their time parked, so the same few airports are returned over and over.
+AIRPORT_CACHE_SIZE = 1024
+# Defaults of IncrementalGeolocator, in kilometers
+MIN_MOVEMENT_KM = 0.1
+TAXI_RADIUS_KM = 5.0
 
+_LOOKUP_AIRPORT_SECONDS = GEOLOCATION_SECONDS.labels(method="lookup_airport")
+_LOOKUP_AIRPORTS_SECONDS = GEOLOCATION_SECONDS.labels(method="lookup_airports")
+_SKIPPED = GEOLOCATIONS.labels(path="skipped")
+_TAXIING = GEOLOCATIONS.labels(path="taxiing")
+_FULL = GEOLOCATIONS.labels(path="full")
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Airport:
     ident: str | None = None
     type: str | None = None
@@ -24,8 +58,36 @@ class Airport:
     gps_code: str | None = None
     iata_code: str | None = None
     local_code: str | None = None
-    coordinates: list[float] | None = None
-    distance_to_coordinates: float = 0.0
+    coordinates: tuple[float, float] | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class AirportMatch:
+    """The result of an airport lookup."""
+
+    airport: Airport
+    distance: float
+    """Distance in kilometers from the looked up coordinates to the airport"""
+
+
+@dataclass(frozen=True)
+class AirportFilter:
+    """
+    Which airports of the CSV a Geolocator loads. An airport is loaded if it
+    passes every criterion that is set.
+    """
+
+    exclude_types: frozenset[str] = frozenset(AIRPORT_TYPE_BLACKLIST)
+    # The only types loaded, if set
+    types: frozenset[str] | None = None
+    # If either is set, only airports in one of countries (iso_country, like
+    # "US") or regions (iso_region, like "CA-ON") are loaded
+    countries: frozenset[str] | None = None
+    regions: frozenset[str] | None = None
+    require_iata_code: bool = False
+    # Needs the runway_file passed to Geolocator. Airports without an open
+    # runway of known length are skipped.
+    min_runway_length_ft: int | None = None
 
 
 @dataclass
@@ -35,43 +97,524 @@ class AirportDiscovery:
     unknown: bool = False
 
 
+def haversine_km(
+    lat: float,
+    lon: float,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    cos_latitudes: np.ndarray,
+) -> np.ndarray:
+    """
+    Vectorized haversine distance in kilometers from (lat, lon), in degrees, to
+    every point in latitudes/longitudes, which are in radians. cos_latitudes
+    is the precomputed cosine of latitudes.
+    """
+    lat_rad = math.radians(lat)
+    lon_rad = math.radians(lon)
+    d = (
+        np.sin((latitudes - lat_rad) * 0.5) ** 2
+        + math.cos(lat_rad) * cos_latitudes * np.sin((longitudes - lon_rad) * 0.5) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(d))
+
+
+class GridIndex:
+    """
+    Buckets coordinates into fixed-size latitude/longitude cells so that a
+    radius query only has to visit the cells overlapping the search area.
+    The candidates returned are a superset of the points within the radius;
+    callers are expected to refine them with an exact distance check.
+    """
+
+    def __init__(
+        self,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        cell_degrees: float = GRID_CELL_DEGREES,
+    ):
+        """latitudes and longitudes are in degrees."""
+        self._cell_degrees = cell_degrees
+        self._num_columns = math.ceil(360 / cell_degrees)
+        self._row_offset = math.ceil(90 / cell_degrees)
+        self._size = len(latitudes)
+
+        rows = np.floor(np.asarray(latitudes) / cell_degrees).astype(np.int64)
+        columns = np.floor(np.asarray(longitudes) / cell_degrees).astype(np.int64)
+        cell_ids = self._cell_id(rows, columns % self._num_columns)
+        # Points sorted by cell, and by original index within each cell, so that
+        # every cell (and every run of adjacent cells in a row) is one slice.
+        self._order = np.argsort(cell_ids, kind="stable")
+        self._cell_ids = cell_ids[self._order]
+
+    def _cell_id(self, row, column):
+        return (row + self._row_offset) * self._num_columns + column
+
+    def _row(self, lat: float) -> int:
+        return math.floor(lat / self._cell_degrees)
+
+    def _column_ranges(
+        self, lon: float, delta_lon: float | None
+    ) -> list[tuple[int, int]]:
+        """Returns inclusive ranges of cell columns covering lon +/- delta_lon,
+        split in two where they wrap at the antimeridian. A delta_lon of None
+        means every column."""
+        all_columns = [(0, self._num_columns - 1)]
+        if delta_lon is None or 2 * delta_lon >= 360:
+            return all_columns
+        first = math.floor((lon - delta_lon) / self._cell_degrees)
+        last = math.floor((lon + delta_lon) / self._cell_degrees)
+        if last - first + 1 >= self._num_columns:
+            return all_columns
+        first %= self._num_columns
+        last %= self._num_columns
+        if first <= last:
+            return [(first, last)]
+        return [(first, self._num_columns - 1), (0, last)]
+
+    def candidates(
+        self, coordinates: tuple[float, float], max_distance: float
+    ) -> np.ndarray:
+        """
+        Returns the indices, in ascending order, of every point that could be
+        within max_distance (in kilometers) of coordinates.
+        """
+        # Pad the angular radius slightly so floating point error in the
+        # bounding box never excludes a point that haversine would accept.
+        radius = max_distance / EARTH_RADIUS_KM * (1 + 1e-9) + 1e-12
+        if radius >= math.pi:
+            return np.arange(self._size)
+
+        lat, lon = coordinates
+        lat_rad = math.radians(lat)
+        lat_min = lat_rad - radius
+        lat_max = lat_rad + radius
+
+        # Bounding box of a spherical cap. If the cap contains a pole, every
+        # longitude is reachable.
+        delta_lon: float | None
+        if lat_min <= -math.pi / 2 or lat_max >= math.pi / 2:
+            delta_lon = None
+            lat_min = max(lat_min, -math.pi / 2)
+            lat_max = min(lat_max, math.pi / 2)
+        else:
+            delta_lon = math.degrees(
+                math.asin(min(1.0, math.sin(radius) / math.cos(lat_rad)))
+            )
+
+        column_ranges = self._column_ranges(lon, delta_lon)
+        slices = []
+        for row in range(
+            self._row(math.degrees(lat_min)), self._row(math.degrees(lat_max)) + 1
+        ):
+            for first, last in column_ranges:
+                start, stop = np.searchsorted(
+                    self._cell_ids,
+                    (self._cell_id(row, first), self._cell_id(row, last) + 1),
+                )
+                if start != stop:
+                    slices.append(self._order[start:stop])
+        if not slices:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(slices))
+
+
+@dataclass(frozen=True, slots=True)
+class _Tier:
+    """Airports searched together: positions into Geolocator's arrays, and the
+    index and proximity masks over just those airports."""
+
+    positions: np.ndarray
+    index: GridIndex | None
+    coordinates_digest: bytes
+    masks: dict[float, ProximityMask] = field(default_factory=dict)
+
+
 class Geolocator:
     """Translates coordinates to the closest airport."""
 
-    def __init__(self, airport_code_file: pathlib.Path = DEFAULT_PATH):
-        """Initializes a Geolocator object"""
-        self.__airports: list[Airport] = []
-        # Add airport dict for each row in airport_code_file
-        with open(airport_code_file, "r") as file:
-            for airport in csv.DictReader(file):
-                # Add it if it's not a blacklisted type
-                if airport["type"] not in AIRPORT_TYPE_BLACKLIST:
-                    coordinates = airport["coordinates"].split(", ")
-                    airport["coordinates"] = [
-                        float(coordinates[0]),
-                        float(coordinates[1]),
-                    ]
-                    self.__airports.append(Airport(**airport))
-        if len(self.__airports) == 0:
+    def __init__(
+        self,
+        airport_code_file: pathlib.Path = DEFAULT_PATH,
+        spatial_index: bool = True,
+        database_file: pathlib.Path | None = None,
+        cache_proximity_masks: bool = True,
+        airport_filter: AirportFilter = AirportFilter(),
+        runway_file: pathlib.Path | None = None,
+        tiers: Sequence[Collection[str]] = (),
+    ):
+        """
+        Initializes a Geolocator object, loading the airports airport_filter
+        keeps. runway_file is an OurAirports runways.csv, only needed to filter
+        by runway length.
+
+        tiers are airport types searched in order, such as
+        [("large_airport", "medium_airport")]. Airports of later tiers, and
+        last those of types in no tier, are only matched when no airport of an
+        earlier tier is within max_distance.
+
+        If spatial_index is False, lookups fall back to a linear scan over every
+        airport. This is slower but is kept as a reference implementation.
+
+        With the spatial index, lookups first check a ProximityMask and skip
+        tiers with no airport in reach. Masks are only built by
+        proximity_masks, for the search radius the caller settles on, and if
+        cache_proximity_masks is set, cached next to the database. Lookups
+        within a smaller max_distance reuse the smallest larger mask; those
+        with no mask of at least their max_distance search without one.
+
+        The CSV is compiled into a memory-mapped database at database_file (next
+        to the CSV by default) the first time it is seen, and recompiled
+        whenever its contents change.
+        """
+        if database_file is None:
+            database_file = default_database_path(airport_code_file)
+        self.__database: AirportDatabase = load_airport_database(
+            airport_code_file, database_file
+        )
+        self.__database_file = pathlib.Path(database_file)
+        self.__cache_masks = cache_proximity_masks
+        # Database rows of every airport airport_filter keeps. Airports are
+        # stored as parallel arrays indexed by position in self.__rows.
+        self.__rows = np.flatnonzero(self.__keep(airport_filter, runway_file))
+        if len(self.__rows) == 0:
             raise ValueError("No airports loaded.")
 
+        self.__latitudes_deg = self.__database.latitudes[self.__rows]
+        self.__longitudes_deg = self.__database.longitudes[self.__rows]
+        self.__tier_of_type = {
+            airport_type: number
+            for number, types in reversed(list(enumerate(tiers)))
+            for airport_type in types
+        }
+        self.__tiers = self.__build_tiers(len(tiers), spatial_index)
+
+        self.__latitudes = np.radians(self.__latitudes_deg)
+        self.__longitudes = np.radians(self.__longitudes_deg)
+        self.__cos_latitudes = np.cos(self.__latitudes)
+        self.__airport = functools.lru_cache(maxsize=AIRPORT_CACHE_SIZE)(
+            self.__build_airport
+        )
+
     def lookup_airport(
         self, coordinates: tuple[float, float], max_distance: float
-    ) -> Airport | None:
+    ) -> AirportMatch | None:
         """Finds the closest airport to any set of coordinates that is within
-        max_distance (in kilometers) and returns that airport as a dict of each element
-        in the airport_code_file passed in during initialization.
-        If no airport is found, returns None."""
-        closest: Airport | None = None
+        max_distance (in kilometers) and returns it, along with its distance to
+        coordinates. If no airport is found, returns None.
+
+        Results are immutable and may be shared between callers and threads."""
+        start = time.perf_counter()
+        match = None
+        for tier in self.__tiers:
+            candidates: Iterable[int]
+            if tier.index is None:
+                candidates = tier.positions.tolist()
+            elif not _may_be_near(self.__cached_mask(tier, max_distance), coordinates):
+                continue
+            else:
+                local = tier.index.candidates(coordinates, max_distance)
+                candidates = tier.positions[local].tolist()
+            match = self.__closest(coordinates, candidates, max_distance)
+            if match is not None:
+                break
+        _LOOKUP_AIRPORT_SECONDS.observe(time.perf_counter() - start)
+        return match
+
+    def lookup_airports(
+        self, coords: Sequence[tuple[float, float]], max_distance: float
+    ) -> list[AirportMatch | None]:
+        """
+        Batch version of lookup_airport. Returns, for each coordinate in coords,
+        the closest airport within max_distance (in kilometers) or None.
+        """
+        start = time.perf_counter()
+        masks = [
+            self.__cached_mask(tier, max_distance) if tier.index is not None else None
+            for tier in self.__tiers
+        ]
+        matches: list[AirportMatch | None] = []
+        for point in coords:
+            match = None
+            for tier, mask in zip(self.__tiers, masks):
+                if _may_be_near(mask, point):
+                    match = self.__lookup_vectorized(tier, point, max_distance)
+                    if match is not None:
+                        break
+            matches.append(match)
+        _LOOKUP_AIRPORTS_SECONDS.observe(time.perf_counter() - start)
+        return matches
+
+    def tier(self, airport: Airport) -> int:
+        """The number of the tier airport is searched in, 0 being the first."""
+        return self.__tier_of_type.get(airport.type, len(self.__tiers) - 1)
+
+    def proximity_masks(self, max_distance: float) -> list[ProximityMask]:
+        """The ProximityMask for max_distance of every tier, loading or
+        building them on first use. Lookups only use masks loaded here, so
+        this should be called once for the search radius, not per lookup."""
+        return [self.__mask(tier, max_distance) for tier in self.__tiers]
+
+    def __cached_mask(self, tier: _Tier, max_distance: float) -> ProximityMask | None:
+        """The smallest loaded mask of tier covering max_distance, if any. A
+        point with no airport within a larger radius has none within
+        max_distance either."""
+        radii = [radius for radius in tier.masks if radius >= max_distance]
+        if not radii:
+            return None
+        return tier.masks[min(radii)]
+
+    def __mask(self, tier: _Tier, max_distance: float) -> ProximityMask:
+        mask = tier.masks.get(max_distance)
+        if mask is None:
+            positions = tier.positions
+            mask = load_proximity_mask(
+                self.__latitudes_deg[positions],
+                self.__longitudes_deg[positions],
+                max_distance,
+                path=(
+                    mask_path(
+                        self.__database_file, max_distance, tier.coordinates_digest
+                    )
+                    if self.__cache_masks
+                    else None
+                ),
+                coordinates_digest=tier.coordinates_digest,
+            )
+            tier.masks[max_distance] = mask
+        return mask
+
+    def __keep(
+        self, airport_filter: AirportFilter, runway_file: pathlib.Path | None
+    ) -> np.ndarray:
+        """Per database row, whether airport_filter keeps the airport."""
+        database = self.__database
+        keep = ~_isin(database, "type", airport_filter.exclude_types)
+        if airport_filter.types is not None:
+            keep &= _isin(database, "type", airport_filter.types)
+        if airport_filter.countries is not None or airport_filter.regions is not None:
+            keep &= _isin(
+                database, "iso_country", airport_filter.countries or ()
+            ) | _isin(database, "iso_region", airport_filter.regions or ())
+        if airport_filter.require_iata_code:
+            keep &= database.nonempty("iata_code")
+        if airport_filter.min_runway_length_ft is not None:
+            if runway_file is None:
+                raise ValueError("Filtering by runway length needs a runway_file.")
+            runways = longest_runways(runway_file)
+            lengths = np.array(
+                [runways.get(ident, 0) for ident in database.column("ident")],
+                dtype=np.int64,
+            )
+            keep &= lengths >= airport_filter.min_runway_length_ft
+        return keep
+
+    def __build_tiers(self, num_tiers: int, spatial_index: bool) -> list[_Tier]:
+        types = self.__database.dictionary("type")
+        tier_of_code = np.array(
+            [
+                self.__tier_of_type.get(airport_type, num_tiers)
+                for airport_type in types
+            ],
+            dtype=np.int64,
+        )
+        tier_numbers = tier_of_code[self.__database.codes("type")[self.__rows]]
+        tiers = []
+        for number in range(num_tiers + 1):
+            positions = np.flatnonzero(tier_numbers == number)
+            latitudes = self.__latitudes_deg[positions]
+            longitudes = self.__longitudes_deg[positions]
+            tiers.append(
+                _Tier(
+                    positions=positions,
+                    index=GridIndex(latitudes, longitudes) if spatial_index else None,
+                    coordinates_digest=coordinates_sha256(latitudes, longitudes),
+                )
+            )
+        return tiers
+
+    def __lookup_vectorized(
+        self, tier: _Tier, coordinates: tuple[float, float], max_distance: float
+    ) -> AirportMatch | None:
+        candidates = tier.positions
+        if tier.index is not None:
+            candidates = candidates[tier.index.candidates(coordinates, max_distance)]
+            if candidates.size == 0:
+                return None
+
+        lat, lon = coordinates
+        distances = haversine_km(
+            lat,
+            lon,
+            self.__latitudes[candidates],
+            self.__longitudes[candidates],
+            self.__cos_latitudes[candidates],
+        )
+        best = distances.min()
+        if best > max_distance + DISTANCE_TOLERANCE_KM:
+            return None
+
+        # Settle the winner, including ties, exactly the way lookup_airport does.
+        (near,) = np.nonzero(distances <= best + DISTANCE_TOLERANCE_KM)
+        near = candidates[near]
+        return self.__closest(coordinates, near.tolist(), max_distance)
+
+    def __closest(
+        self,
+        coordinates: tuple[float, float],
+        candidates: Iterable[int],
+        max_distance: float,
+    ) -> AirportMatch | None:
+        """Exact haversine scan over candidates (indices into self.__rows).
+        Later candidates win ties."""
+        closest: int | None = None
         closest_distance = max_distance
-        for airport in self.__airports:
-            distance = self.__distance(coordinates, airport.coordinates)
+        for index in candidates:
+            distance = self.__distance(coordinates, self.__coordinates(index))
             if distance <= closest_distance:
-                closest = airport
-                closest.distance_to_coordinates = distance
+                closest = index
                 closest_distance = distance
-        return deepcopy(closest)
+        if closest is None:
+            return None
+        return AirportMatch(airport=self.__airport(closest), distance=closest_distance)
+
+    def __coordinates(self, index: int) -> tuple[float, float]:
+        return (
+            float(self.__latitudes_deg[index]),
+            float(self.__longitudes_deg[index]),
+        )
+
+    def __build_airport(self, index: int) -> Airport:
+        """Builds the Airport for index from the database."""
+        return Airport(
+            **self.__database.row(int(self.__rows[index])),
+            coordinates=self.__coordinates(index),
+        )
 
     def __distance(self, a: tuple[float, float], b: tuple[float, float]) -> float:
         """Calculates the distance between 2 coordinates in Kilometers"""
         return haversine.haversine(a, b, unit=haversine.Unit.KILOMETERS)
+
+
+@dataclass(frozen=True, slots=True)
+class _LastLookup:
+    coordinates: tuple[float, float]
+    max_distance: float
+    match: AirportMatch | None
+
+
+class IncrementalGeolocator:
+    """
+    Wraps a Geolocator for aircraft polled over and over, remembering the
+    last lookup of each. Lookups are keyed by aircraft, usually its hex id.
+
+    An aircraft that moved less than min_movement kilometers since its last
+    lookup gets the same result back without searching; parked aircraft
+    never do. One still within taxi_radius kilometers of the airport it was
+    last matched to is only searched for within its distance to that
+    airport. No other airport can be nearer, so the result is exact while
+    only the airport's neighborhood is visited. With a tiered Geolocator
+    that only holds for airports of its first tier.
+    """
+
+    def __init__(
+        self,
+        geolocator: Geolocator,
+        min_movement: float = MIN_MOVEMENT_KM,
+        taxi_radius: float = TAXI_RADIUS_KM,
+    ):
+        self._geolocator = geolocator
+        self._min_movement = min_movement
+        self._taxi_radius = taxi_radius
+        self._last: dict[Hashable, _LastLookup] = {}
+
+    @property
+    def geolocator(self) -> Geolocator:
+        return self._geolocator
+
+    def forget(self, key: Hashable) -> None:
+        self._last.pop(key, None)
+
+    def lookup_airport(
+        self, key: Hashable, coordinates: tuple[float, float], max_distance: float
+    ) -> AirportMatch | None:
+        """Geolocator.lookup_airport for the aircraft identified by key."""
+        found, match = self.__incremental(key, coordinates, max_distance)
+        if not found:
+            _FULL.inc()
+            match = self._geolocator.lookup_airport(coordinates, max_distance)
+            self.__remember(key, coordinates, max_distance, match)
+        return match
+
+    def lookup_airports(
+        self,
+        keys: Sequence[Hashable],
+        coords: Sequence[tuple[float, float]],
+        max_distance: float,
+    ) -> list[AirportMatch | None]:
+        """Geolocator.lookup_airports for the aircraft identified by keys.
+        Aircraft needing a full lookup are looked up in one batch."""
+        matches: list[AirportMatch | None] = []
+        full: list[int] = []
+        for i, (key, coordinates) in enumerate(zip(keys, coords)):
+            found, match = self.__incremental(key, coordinates, max_distance)
+            if not found:
+                full.append(i)
+            matches.append(match)
+        if full:
+            _FULL.inc(len(full))
+            results = self._geolocator.lookup_airports(
+                [coords[i] for i in full], max_distance
+            )
+            for i, match in zip(full, results):
+                matches[i] = match
+                self.__remember(keys[i], coords[i], max_distance, match)
+        return matches
+
+    def __incremental(
+        self, key: Hashable, coordinates: tuple[float, float], max_distance: float
+    ) -> tuple[bool, AirportMatch | None]:
+        """Answers from the last lookup of key if it can. Returns whether it
+        did, and the match."""
+        last = self._last.get(key)
+        if last is None or last.max_distance != max_distance:
+            return False, None
+        if _distance(last.coordinates, coordinates) < self._min_movement:
+            _SKIPPED.inc()
+            return True, last.match
+        if last.match is None or last.match.airport.coordinates is None:
+            return False, None
+        to_airport = _distance(coordinates, last.match.airport.coordinates)
+        if to_airport > self._taxi_radius or to_airport > max_distance:
+            return False, None
+        if self._geolocator.tier(last.match.airport) != 0:
+            # A nearer airport of an earlier tier might have come in range
+            return False, None
+        _TAXIING.inc()
+        match = self._geolocator.lookup_airport(coordinates, max_distance=to_airport)
+        self.__remember(key, coordinates, max_distance, match)
+        return True, match
+
+    def __remember(
+        self,
+        key: Hashable,
+        coordinates: tuple[float, float],
+        max_distance: float,
+        match: AirportMatch | None,
+    ) -> None:
+        self._last[key] = _LastLookup(coordinates, max_distance, match)
+
+
+def _may_be_near(mask: ProximityMask | None, coordinates: tuple[float, float]) -> bool:
+    return mask is None or mask.may_be_near(coordinates)
+
+
+def _isin(database: AirportDatabase, field: str, values: Collection[str]) -> np.ndarray:
+    """Per database row, whether categorical field is one of values."""
+    codes = [
+        code for code, value in enumerate(database.dictionary(field)) if value in values
+    ]
+    return np.isin(database.codes(field), codes)
+
+
+def _distance(a: tuple[float, float], b: tuple[float, float]) -> float:
+    return haversine.haversine(a, b, unit=haversine.Unit.KILOMETERS)
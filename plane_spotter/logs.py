@@ -0,0 +1,140 @@
+"""
+structlog configuration for the long running scripts.
+
+Log calls pass raw dicts and dataclasses as fields rather than preformatted
+strings. Records below the configured level are dropped by the bound logger
+before any processor runs, so nothing is serialized unless it is emitted.
+"""
+
+import dataclasses
+import datetime
+import importlib.util
+import json
+import logging
+import sys
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+import structlog
+
+LOG_FORMATS = ("console", "json")
+# Logged for every aircraft on every poll while nothing happens
+SAMPLED_EVENTS = frozenset(
+    (
+        "airplane hasn't moved",
+        "aircraft still in flight",
+        "position unchanged since last poll",
+    )
+)
+
+
+class RepeatedEventSampler:
+    """
+    structlog processor letting each of `events` through at most once per
+    `interval` seconds per aircraft. The next record let through says how
+    many were suppressed in between.
+    """
+
+    def __init__(
+        self,
+        events: Iterable[str] = SAMPLED_EVENTS,
+        interval: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._events = frozenset(events)
+        self._interval = interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (event, icao_hex_id) -> (time last let through, suppressed since)
+        self._seen: dict[tuple[str, Any], tuple[float, int]] = {}
+
+    def __call__(self, logger, method_name: str, event_dict: dict) -> dict:
+        event = event_dict.get("event")
+        if event not in self._events:
+            return event_dict
+        key = (event, event_dict.get("icao_hex_id"))
+        now = self._clock()
+        with self._lock:
+            last, suppressed = self._seen.get(key, (None, 0))
+            if last is not None and now - last < self._interval:
+                self._seen[key] = (last, suppressed + 1)
+                raise structlog.DropEvent
+            self._seen[key] = (now, 0)
+        if suppressed:
+            event_dict["suppressed"] = suppressed
+        return event_dict
+
+
+def _json_default(value: Any) -> Any:
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return repr(value)
+
+
+def json_renderer() -> tuple[structlog.types.Processor, Any]:
+    """
+    A JSON renderer and the logger factory it needs. orjson is used when it
+    is installed, it is several times faster than the json module and
+    serializes dataclasses natively.
+    """
+    if importlib.util.find_spec("orjson") is not None:
+        import orjson
+
+        return (
+            structlog.processors.JSONRenderer(
+                serializer=orjson.dumps, default=_json_default
+            ),
+            structlog.BytesLoggerFactory(),
+        )
+    return (
+        structlog.processors.JSONRenderer(serializer=json.dumps, default=_json_default),
+        structlog.PrintLoggerFactory(),
+    )
+
+
+def configure_logging(
+    format: str = "console",
+    level: str = "INFO",
+    sample_interval: float | None = 300.0,
+) -> None:
+    """
+    Configures structlog for `format`: "console" for people, "json" for log
+    pipelines. Repeated per-poll events are let through once per
+    sample_interval seconds per aircraft, or every time if it is None.
+    """
+    if format not in LOG_FORMATS:
+        raise ValueError(f"log format must be one of {LOG_FORMATS}, got {format}")
+    processors: list[structlog.types.Processor] = [
+        structlog.contextvars.merge_contextvars,
+    ]
+    if sample_interval is not None:
+        processors.append(RepeatedEventSampler(interval=sample_interval))
+    processors += [
+        structlog.processors.add_log_level,
+        structlog.processors.StackInfoRenderer(),
+        structlog.dev.set_exc_info,
+    ]
+    if format == "json":
+        renderer, logger_factory = json_renderer()
+        processors += [
+            structlog.processors.TimeStamper(fmt="iso", utc=True),
+            structlog.processors.format_exc_info,
+            renderer,
+        ]
+    else:
+        logger_factory = structlog.PrintLoggerFactory(sys.stdout)
+        processors += [
+            structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S", utc=False),
+            structlog.dev.ConsoleRenderer(),
+        ]
+    structlog.configure(
+        processors=processors,
+        wrapper_class=structlog.make_filtering_bound_logger(
+            logging.getLevelName(level.upper())
+        ),
+        logger_factory=logger_factory,
+        cache_logger_on_first_use=True,
+    )
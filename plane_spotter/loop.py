@@ -0,0 +1,265 @@
+"""
+The polling loops behind the notify script: fetch ADS-B data, find the
+nearest airport, update the trackers and send notifications for their events.
+
+This module deliberately doesn't depend on hydra or any notification backend,
+so the replay script, benchmarks and tests can run the loops without paying
+for those imports.
+"""
+
+import asyncio
+from typing import Any, Sequence
+
+import structlog
+from structlog import get_logger
+
+from plane_spotter.adsb import MAX_HEX_IDS_PER_REQUEST, ADSBExchange, AsyncADSBExchange
+from plane_spotter.clock import SYSTEM_CLOCK, Clock
+from plane_spotter.geolocator import (
+    MIN_MOVEMENT_KM,
+    TAXI_RADIUS_KM,
+    Geolocator,
+    IncrementalGeolocator,
+)
+from plane_spotter.metrics import LOOP_CYCLE_SECONDS, LOOP_LAG_SECONDS
+from plane_spotter.notification import NotificationBackend, event_message
+from plane_spotter.polling import Area, poll_fleet, poll_scheduled
+from plane_spotter.scheduler import PollIntervals, PollScheduler
+from plane_spotter.state import StateStore
+from plane_spotter.tracker import (
+    AircraftTracker,
+    Event,
+    FleetTracker,
+    Landed,
+    airport_discovery,
+)
+from plane_spotter.tracks import RouteStats, TrackStore
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+HASHTAGS = ["#elonjet", "@elonjet", "@elonmusk", "@ElonJetNextDay"]
+
+
+def _route(track_store: TrackStore | None, event: Event) -> RouteStats | None:
+    """Stats of the flight a Landed event ended, if its track was stored."""
+    if track_store is None or not isinstance(event, Landed):
+        return None
+    return track_store.flight(
+        event.icao_hex_id, event.source, event.destination
+    ).stats()
+
+
+def main_loop(
+    adsb_backend: ADSBExchange,
+    geolocator: Geolocator,
+    notification_backend: NotificationBackend,
+    search_radius: int,
+    icao_hex_id: str,
+    loop_interval: int = 120,
+    num_loops: int = -1,
+    poll_intervals: PollIntervals | None = None,
+    state_store: StateStore | None = None,
+    track_store: TrackStore | None = None,
+    min_movement: float = MIN_MOVEMENT_KM,
+    taxi_radius: float = TAXI_RADIUS_KM,
+    clock: Clock = SYSTEM_CLOCK,
+    log=logger,
+):
+    """
+    This is the main loop for discovering ADS-B data and notifying the backend.
+
+    num_loops if set to a non-positive number will loop only that number of times.
+    If it's set to zero or a negative number, it will loop infinitely.
+
+    If poll_intervals is given, the time slept between loops depends on the
+    aircraft's flight phase instead of being loop_interval.
+
+    If state_store is given, the tracker resumes from the saved state of the
+    aircraft and saves every update to it.
+
+    If track_store is given, every position is appended to it, and landing
+    notifications include stats of the flight's route.
+
+    The nearest airport isn't searched for again until the aircraft moves
+    min_movement kilometers, and only around the last airport while it taxis
+    within taxi_radius kilometers of it, see IncrementalGeolocator.
+
+    All timekeeping goes through clock, so a VirtualClock can replay a
+    recorded trace faster than real time.
+    """
+    tracker = AircraftTracker(icao_hex_id=icao_hex_id, now=clock.now(), log=log)
+    incremental = IncrementalGeolocator(
+        geolocator, min_movement=min_movement, taxi_radius=taxi_radius
+    )
+    if state_store is not None and state_store.restore(tracker):
+        log.info(
+            "restored tracker state",
+            in_flight=tracker.in_flight,
+            last_landed_airport=tracker.last_landed_airport.airport.ident,
+        )
+    scheduler = (
+        PollScheduler(
+            poll_intervals,
+            near_airport=lambda _: tracker.near_airport,
+            clock=clock.monotonic,
+        )
+        if poll_intervals is not None
+        else None
+    )
+    first_loop: bool = True
+    sleep_interval: float = loop_interval
+    cycle_seconds = LOOP_CYCLE_SECONDS.labels(loop="main")
+    lag_seconds = LOOP_LAG_SECONDS.labels(loop="main")
+    cur_loop = 0
+
+    while (cur_loop < num_loops) or num_loops <= 0:
+        if num_loops > 0:
+            cur_loop += 1
+        if not first_loop:
+            # The next cycle is due sleep_interval after the last one finished
+            due = clock.monotonic() + sleep_interval
+            clock.sleep(sleep_interval)
+            lag_seconds.set(max(0.0, clock.monotonic() - due))
+        first_loop = False
+
+        start = clock.monotonic()
+        now = clock.now()
+
+        adsb_data = adsb_backend.aircraft_last_position_by_hex_id(
+            hex_id=icao_hex_id
+        ).json()
+        # Passed as is, it is only serialized if the record is emitted
+        log.info("adsb info", adsb_data=adsb_data)
+
+        if tracker.is_repeat(adsb_data):
+            # ADSBExchange answered from its cache, nothing has changed
+            log.info("position unchanged since last poll")
+        else:
+            lat = adsb_data["lat"]
+            lon = adsb_data["lon"]
+            log.info(f"Plane last known location", lat=lat, lon=lon)
+
+            closest_airport = incremental.lookup_airport(
+                icao_hex_id, coordinates=(lat, lon), max_distance=search_radius
+            )
+            nearest_airport = airport_discovery(closest_airport, now)
+            if closest_airport is not None:
+                log.info(
+                    "nearest airport info",
+                    airport=nearest_airport.airport,
+                    distance_to_coordinates=closest_airport.distance,
+                )
+            else:
+                log.info("not near any known airport")
+
+            if track_store is not None:
+                track_store.append(icao_hex_id, adsb_data, time=clock.time())
+            for event in tracker.update(adsb_data, nearest_airport):
+                notification_backend.send(
+                    message=event_message(
+                        event, hashtags=HASHTAGS, route=_route(track_store, event)
+                    ),
+                    log=log,
+                )
+            if state_store is not None:
+                state_store.save(tracker)
+        cycle_seconds.observe(clock.monotonic() - start)
+
+        if scheduler is not None:
+            phase = scheduler.observe(icao_hex_id, adsb_data)
+            sleep_interval = scheduler.time_until_due() or 0.0
+            log.info("next poll scheduled", phase=phase.value, delay=sleep_interval)
+
+
+def fleet_main_loop(
+    adsb_backend: AsyncADSBExchange,
+    geolocator: Geolocator,
+    notification_backend: NotificationBackend,
+    search_radius: int,
+    icao_hex_ids: list[str],
+    loop_interval: int = 120,
+    concurrency: int = 10,
+    requests_per_second: float | None = None,
+    num_loops: int = -1,
+    poll_intervals: PollIntervals | None = None,
+    bulk: bool = False,
+    areas: Sequence[Area] = (),
+    max_hex_ids_per_request: int = MAX_HEX_IDS_PER_REQUEST,
+    state_store: StateStore | None = None,
+    track_store: TrackStore | None = None,
+    min_movement: float = MIN_MOVEMENT_KM,
+    taxi_radius: float = TAXI_RADIUS_KM,
+    clock: Clock = SYSTEM_CLOCK,
+    log=logger,
+):
+    """
+    Like main_loop, but tracks every aircraft in icao_hex_ids, polling them
+    concurrently each cycle. If poll_intervals is given, each aircraft is
+    instead polled on its own schedule depending on its flight phase. With
+    bulk set, aircraft are fetched with area and multi-hex requests rather
+    than one request each.
+
+    adsb_backend is closed once polling stops, in the event loop it ran in.
+    """
+    fleet = FleetTracker(
+        geolocator=geolocator,
+        search_radius=search_radius,
+        icao_hex_ids=icao_hex_ids,
+        state_store=state_store,
+        min_movement=min_movement,
+        taxi_radius=taxi_radius,
+        log=log,
+    )
+
+    def handle_observations(observations: dict[str, dict[str, Any]]) -> None:
+        if track_store is not None:
+            track_store.extend(observations, time=clock.time())
+        for event in fleet.update(observations, now=clock.now()):
+            notification_backend.send(
+                message=event_message(
+                    event, hashtags=HASHTAGS, route=_route(track_store, event)
+                ),
+                log=log.bind(icao_hex_id=event.icao_hex_id),
+            )
+
+    if poll_intervals is not None:
+        scheduler = PollScheduler(
+            poll_intervals,
+            near_airport=lambda hex_id: hex_id in fleet and fleet[hex_id].near_airport,
+            clock=clock.monotonic,
+        )
+        scheduler.add(icao_hex_ids)
+        polling = poll_scheduled(
+            adsb_backend=adsb_backend,
+            scheduler=scheduler,
+            handle_observations=handle_observations,
+            concurrency=concurrency,
+            requests_per_second=requests_per_second,
+            num_loops=num_loops,
+            bulk=bulk,
+            areas=areas,
+            max_hex_ids_per_request=max_hex_ids_per_request,
+            clock=clock,
+            log=log,
+        )
+    else:
+        polling = poll_fleet(
+            adsb_backend=adsb_backend,
+            hex_ids=icao_hex_ids,
+            handle_observations=handle_observations,
+            loop_interval=loop_interval,
+            concurrency=concurrency,
+            requests_per_second=requests_per_second,
+            num_loops=num_loops,
+            bulk=bulk,
+            areas=areas,
+            max_hex_ids_per_request=max_hex_ids_per_request,
+            clock=clock,
+            log=log,
+        )
+
+    async def run() -> None:
+        async with adsb_backend:
+            await polling
+
+    asyncio.run(run())
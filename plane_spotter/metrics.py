@@ -0,0 +1,462 @@
+"""
+Process-wide metrics, exposed in the Prometheus text format.
+
+The ADS-B clients, the Geolocator, the polling loops and the notification
+dispatcher record into the metrics defined at the bottom of this module.
+Nothing is exported unless asked for: MetricsServer serves the metrics over
+HTTP for Prometheus to scrape, and TextfileExporter periodically writes them
+to a file for node_exporter's textfile collector.
+
+Recording is a dictionary lookup and a locked update, so it is cheap enough
+for the polling hot path.
+"""
+
+from abc import ABC, abstractmethod
+import bisect
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from typing import Any, Iterator
+
+import structlog
+from structlog import get_logger
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds, in seconds, of histogram buckets. Covers everything from a
+# geolocation lookup to a slow tweet.
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Registry:
+    """A set of metrics rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> "_Metric":
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Zeroes every recorded value. Meant for tests."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+
+class _Metric(ABC):
+    kind: str
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        registry: Registry | None = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._children: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    @abstractmethod
+    def _child(self, key: tuple[str, ...]):
+        """A new series of this metric for label values key."""
+
+    def labels(self, **labels: object):
+        """The series of this metric with the given label values."""
+        if labels.keys() != set(self.label_names):
+            raise ValueError(
+                f"{self.name} expects labels {self.label_names}, got {tuple(labels)}"
+            )
+        key = tuple(str(labels[name]) for name in self.label_names)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._child(key))
+        return child
+
+    def _series(self) -> list[tuple[dict[str, str], object]]:
+        with self._lock:
+            children = list(self._children.items())
+        return [(dict(zip(self.label_names, key)), child) for key, child in children]
+
+    @abstractmethod
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        """Every sample to export, as name, labels and value."""
+
+    def reset(self) -> None:
+        # Children are zeroed rather than dropped, as callers may hold on to them
+        with self._lock:
+            children = list(self._children.values())
+        for child in children:
+            child.reset()
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def reset(self) -> None:
+        self.value = 0.0
+
+
+class Counter(_Metric):
+    """A count that only goes up, like requests made."""
+
+    kind = "counter"
+
+    def _child(self, key: tuple[str, ...]) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for labels, child in self._series():
+            assert isinstance(child, _Value)
+            yield self.name + "_total", labels, child.value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, like a queue depth."""
+
+    kind = "gauge"
+
+    def _child(self, key: tuple[str, ...]) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for labels, child in self._series():
+            assert isinstance(child, _Value)
+            yield self.name, labels, child.value
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # One more than bounds, for observations above the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.sum = 0.0
+            self.count = 0
+
+    def observe(self, value: float) -> None:
+        bucket = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextlib.contextmanager
+    def time(self) -> Iterator[None]:
+        """Observes how long the with block took, even if it raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values, usually durations in seconds."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: Registry | None = REGISTRY,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def _child(self, key: tuple[str, ...]) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self) -> Iterator[tuple[str, dict[str, str], float]]:
+        for labels, child in self._series():
+            assert isinstance(child, _HistogramValue)
+            with child._lock:
+                counts = list(child.counts)
+                total, count = child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip((*child.bounds, math.inf), counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", {
+                    **labels,
+                    "le": _format_value(bound),
+                }, cumulative
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    Serves the registry's metrics at http://host:port/metrics from a
+    background thread. Binds to localhost by default; port 0 picks a free
+    port, see the port attribute.
+    """
+
+    def __init__(
+        self,
+        port: int,
+        host: str = "127.0.0.1",
+        registry: Registry = REGISTRY,
+        log=logger,
+    ):
+        handler = type("Handler", (_Handler,), {"registry": registry})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        log.info("serving metrics", host=host, port=self.port)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+def write_textfile(path: str | os.PathLike, registry: Registry = REGISTRY) -> None:
+    """Writes the metrics to path atomically, so readers never see a partial
+    file."""
+    path = pathlib.Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name)
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(registry.render())
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+class TextfileExporter:
+    """Rewrites path with the current metrics every `interval` seconds, and
+    once more on close()."""
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        interval: float = 15.0,
+        registry: Registry = REGISTRY,
+        log=logger,
+    ):
+        self._path = path
+        self._interval = interval
+        self._registry = registry
+        self._log = log
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-textfile", daemon=True
+        )
+        self._thread.start()
+        log.info("writing metrics", metrics_file=str(path), interval=interval)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _write(self) -> None:
+        try:
+            write_textfile(self._path, self._registry)
+        except OSError:
+            self._log.exception("failed to write metrics", metrics_file=self._path)
+
+    def _run(self) -> None:
+        while not self._closed.wait(self._interval):
+            self._write()
+
+    def close(self) -> None:
+        self._closed.set()
+        self._thread.join()
+        self._write()
+
+
+ADSB_REQUEST_SECONDS = Histogram(
+    "plane_spotter_adsb_request_seconds",
+    "Time taken by ADS-B API requests, including retries.",
+    labels=("endpoint",),
+)
+ADSB_RESPONSES = Counter(
+    "plane_spotter_adsb_responses",
+    "ADS-B API responses by status code, or error when no response came.",
+    labels=("endpoint", "status"),
+)
+ADSB_CACHE_LOOKUPS = Counter(
+    "plane_spotter_adsb_cache_lookups",
+    "ADS-B response cache lookups: hit, miss, or coalesced into a request "
+    "already in flight.",
+    labels=("result",),
+)
+GEOLOCATION_SECONDS = Histogram(
+    "plane_spotter_geolocation_seconds",
+    "Time taken to find the nearest airport, per lookup call.",
+    labels=("method",),
+)
+GEOLOCATIONS = Counter(
+    "plane_spotter_geolocations",
+    "Nearest airport lookups by aircraft: skipped because it hadn't moved, "
+    "taxiing (searched around the last airport) or full.",
+    labels=("path",),
+)
+LOOP_CYCLE_SECONDS = Histogram(
+    "plane_spotter_loop_cycle_seconds",
+    "Time taken by one polling cycle, from fetch to notification.",
+    labels=("loop",),
+)
+LOOP_LAG_SECONDS = Gauge(
+    "plane_spotter_loop_lag_seconds",
+    "How late the last polling cycle started compared to its schedule.",
+    labels=("loop",),
+)
+NOTIFICATION_SEND_SECONDS = Histogram(
+    "plane_spotter_notification_send_seconds",
+    "Time taken by a notification backend to send one message.",
+    labels=("backend",),
+)
+NOTIFICATIONS = Counter(
+    "plane_spotter_notifications",
+    "Notifications by outcome: sent, failed (will retry), gave_up or dropped.",
+    labels=("backend", "outcome"),
+)
+NOTIFICATION_QUEUE_DEPTH = Gauge(
+    "plane_spotter_notification_queue_depth",
+    "Notifications waiting to be sent.",
+)
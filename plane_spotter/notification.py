@@ -4,18 +4,42 @@ import structlog
 from textwrap import dedent
 
 from plane_spotter.geolocator import AirportDiscovery
+from plane_spotter.tracker import Event, Landed, Stationed, TookOff
+from plane_spotter.tracks import RouteStats
+
+TOOK_OFF_MESSAGE = "Aircraft has taken off!"
+
+
+def route_stats_lines(route: RouteStats) -> str:
+    lines = f"Distance Flown: {route.distance_km:.0f} km\n"
+    if route.max_altitude_ft is not None:
+        lines += f"Max Altitude: {route.max_altitude_ft:.0f} ft\n"
+    if route.max_ground_speed_kt is not None:
+        lines += f"Max Ground Speed: {route.max_ground_speed_kt:.0f} kt\n"
+    return lines
 
 
 def plane_landed_message(
-    source: AirportDiscovery, destination: AirportDiscovery, hashtags: list[str]
+    source: AirportDiscovery,
+    destination: AirportDiscovery,
+    hashtags: list[str],
+    route: RouteStats | None = None,
 ) -> str:
-    return dedent(
+    """route, if known, adds the distance flown and other stats of the
+    flight."""
+    message = dedent(
         f"""\
         Airplane landed at {destination.airport.name}
         
         Source: {source.airport.ident}: {source.airport.name}
         Destination: {destination.airport.ident}: {destination.airport.name}
         Flight Time: {str(destination.discovery_time - source.discovery_time)}
+        """
+    )
+    if route is not None:
+        message += route_stats_lines(route)
+    return message + dedent(
+        f"""\
         Source Region: {source.airport.iso_region}
         Dest Region: {destination.airport.iso_region}
         Discovery Time: {source.discovery_time}
@@ -39,6 +63,24 @@ def plane_stationed_at_message(airport: AirportDiscovery, hashtags: list[str]):
     )
 
 
+def event_message(
+    event: Event, hashtags: list[str], route: RouteStats | None = None
+) -> str:
+    """route is only used by Landed events, see plane_landed_message."""
+    if isinstance(event, Stationed):
+        return plane_stationed_at_message(airport=event.airport, hashtags=hashtags)
+    if isinstance(event, TookOff):
+        return TOOK_OFF_MESSAGE
+    if isinstance(event, Landed):
+        return plane_landed_message(
+            source=event.source,
+            destination=event.destination,
+            hashtags=hashtags,
+            route=route,
+        )
+    raise TypeError(f"unknown event: {event!r}")
+
+
 class NotificationBackend(ABC):
     @abstractmethod
     def send(self, message: str, log: structlog.stdlib.BoundLogger):
@@ -0,0 +1,347 @@
+import asyncio
+from dataclasses import dataclass
+import functools
+from typing import Any, Awaitable, Callable, Iterable, Sequence
+
+import structlog
+from structlog import get_logger
+
+from plane_spotter.adsb import MAX_HEX_IDS_PER_REQUEST, AsyncADSBExchange
+from plane_spotter.clock import SYSTEM_CLOCK, Clock
+from plane_spotter.metrics import LOOP_CYCLE_SECONDS, LOOP_LAG_SECONDS
+from plane_spotter.scheduler import PollScheduler
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+# Called with each cycle's observations, keyed by hex id
+ObservationHandler = Callable[[dict[str, dict[str, Any]]], None]
+# Fetches observations of the given hex ids, keyed by hex id
+AircraftFetcher = Callable[[list[str]], Awaitable[dict[str, dict[str, Any]]]]
+
+
+@dataclass
+class Area:
+    """A circle of dist nautical miles around (lat, lon) to query in bulk."""
+
+    lat: float
+    lon: float
+    dist: float
+
+
+class RateLimiter:
+    """
+    Token bucket limiting how many requests per second are started across all
+    tasks sharing it. Up to `burst` requests may start back to back. Time is
+    kept, and waited out, on clock.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, clock: Clock = SYSTEM_CLOCK):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._rate = rate
+        self._burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = self._clock.monotonic()
+                self._tokens = min(
+                    self._burst, self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await self._clock.async_sleep((1 - self._tokens) / self._rate)
+
+
+async def poll_aircraft(
+    adsb_backend: AsyncADSBExchange,
+    hex_ids: Iterable[str],
+    semaphore: asyncio.Semaphore,
+    rate_limiter: RateLimiter | None = None,
+    log: structlog.stdlib.BoundLogger = logger,
+) -> dict[str, dict[str, Any]]:
+    """
+    Fetches the last position of every aircraft in hex_ids concurrently. At
+    most semaphore's worth of requests are in flight at once, and requests
+    start no faster than rate_limiter allows.
+
+    Returns the ADS-B data keyed by hex id. Aircraft whose request failed are
+    logged and left out.
+    """
+
+    async def poll(hex_id: str) -> dict[str, Any] | None:
+        async with semaphore:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            try:
+                response = await adsb_backend.aircraft_last_position_by_hex_id(
+                    hex_id=hex_id
+                )
+                response.raise_for_status()
+                return response.json()
+            except Exception:
+                log.exception("failed to poll aircraft", icao_hex_id=hex_id)
+                return None
+
+    hex_ids = list(hex_ids)
+    results = await asyncio.gather(*(poll(hex_id) for hex_id in hex_ids))
+    return {
+        hex_id: adsb_data
+        for hex_id, adsb_data in zip(hex_ids, results)
+        if adsb_data is not None
+    }
+
+
+async def poll_aircraft_bulk(
+    adsb_backend: AsyncADSBExchange,
+    hex_ids: Iterable[str],
+    semaphore: asyncio.Semaphore,
+    rate_limiter: RateLimiter | None = None,
+    areas: Sequence[Area] = (),
+    max_hex_ids_per_request: int = MAX_HEX_IDS_PER_REQUEST,
+    log: structlog.stdlib.BoundLogger = logger,
+) -> dict[str, dict[str, Any]]:
+    """
+    Like poll_aircraft, but fetches the aircraft in as few requests as
+    possible. Each of `areas` is queried first, then every aircraft not seen
+    in any area is requested max_hex_ids_per_request hex ids at a time.
+
+    Aircraft that aren't transmitting, or whose request failed, are left out.
+    """
+    # ADSBExchange reports hex ids in lower case
+    wanted = {hex_id.lower(): hex_id for hex_id in hex_ids}
+    observations: dict[str, dict[str, Any]] = {}
+
+    async def fetch(
+        request: Callable[[], Awaitable[Any]], **description: Any
+    ) -> dict[str, Any]:
+        async with semaphore:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            try:
+                response = await request()
+                response.raise_for_status()
+                return response.json()
+            except Exception:
+                log.exception("failed to poll aircraft in bulk", **description)
+                return {}
+
+    def collect(results: list[dict[str, Any]]) -> None:
+        for body in results:
+            # Aircraft in "ac" don't carry the response's time themselves,
+            # copy it over so their position_time can be worked out
+            ctime = body.get("ctime", body.get("now"))
+            for adsb_data in body.get("ac") or []:
+                hex_id = wanted.get(str(adsb_data.get("hex", "")).lower())
+                if hex_id is not None:
+                    if ctime is not None:
+                        adsb_data.setdefault("ctime", ctime)
+                    observations[hex_id] = adsb_data
+
+    collect(
+        await asyncio.gather(
+            *(
+                fetch(
+                    functools.partial(
+                        adsb_backend.aircraft_in_area, area.lat, area.lon, area.dist
+                    ),
+                    area=area,
+                )
+                for area in areas
+            )
+        )
+    )
+    remaining = [hex_id for hex_id in wanted.values() if hex_id not in observations]
+    chunks = [
+        remaining[i : i + max_hex_ids_per_request]
+        for i in range(0, len(remaining), max_hex_ids_per_request)
+    ]
+    collect(
+        await asyncio.gather(
+            *(
+                fetch(
+                    functools.partial(adsb_backend.aircraft_by_hex_ids, chunk),
+                    icao_hex_ids=chunk,
+                )
+                for chunk in chunks
+            )
+        )
+    )
+
+    missing = [hex_id for hex_id in wanted.values() if hex_id not in observations]
+    if missing:
+        log.info("aircraft not found", icao_hex_ids=missing)
+    return observations
+
+
+def _fetcher(
+    adsb_backend: AsyncADSBExchange,
+    concurrency: int,
+    requests_per_second: float | None,
+    bulk: bool,
+    areas: Sequence[Area],
+    max_hex_ids_per_request: int,
+    clock: Clock,
+    log: structlog.stdlib.BoundLogger,
+) -> AircraftFetcher:
+    semaphore = asyncio.Semaphore(concurrency)
+    rate_limiter = (
+        RateLimiter(rate=requests_per_second, burst=concurrency, clock=clock)
+        if requests_per_second
+        else None
+    )
+    if bulk:
+        return functools.partial(
+            poll_aircraft_bulk,
+            adsb_backend,
+            semaphore=semaphore,
+            rate_limiter=rate_limiter,
+            areas=areas,
+            max_hex_ids_per_request=max_hex_ids_per_request,
+            log=log,
+        )
+    return functools.partial(
+        poll_aircraft,
+        adsb_backend,
+        semaphore=semaphore,
+        rate_limiter=rate_limiter,
+        log=log,
+    )
+
+
+async def poll_fleet(
+    adsb_backend: AsyncADSBExchange,
+    hex_ids: Iterable[str],
+    handle_observations: ObservationHandler,
+    loop_interval: float = 120,
+    concurrency: int = 10,
+    requests_per_second: float | None = None,
+    num_loops: int = -1,
+    bulk: bool = False,
+    areas: Sequence[Area] = (),
+    max_hex_ids_per_request: int = MAX_HEX_IDS_PER_REQUEST,
+    clock: Clock = SYSTEM_CLOCK,
+    log: structlog.stdlib.BoundLogger = logger,
+):
+    """
+    Polls every aircraft in hex_ids once per loop_interval seconds and passes
+    each cycle's observations, keyed by hex id, to handle_observations.
+
+    Requests are made concurrently, bounded by `concurrency` in flight and a
+    global requests_per_second limit, so the time a cycle takes stays roughly
+    flat as the fleet grows. The next cycle starts loop_interval seconds after
+    the previous one started, or immediately if a cycle overran.
+
+    With bulk set, the fleet is fetched with poll_aircraft_bulk instead of one
+    request per aircraft.
+
+    num_loops behaves as in main_loop: a non-positive value loops forever.
+    """
+    hex_ids = list(hex_ids)
+    fetch = _fetcher(
+        adsb_backend,
+        concurrency,
+        requests_per_second,
+        bulk,
+        areas,
+        max_hex_ids_per_request,
+        clock,
+        log,
+    )
+    cycle_seconds = LOOP_CYCLE_SECONDS.labels(loop="fleet")
+    lag_seconds = LOOP_LAG_SECONDS.labels(loop="fleet")
+    due: float | None = None
+    cur_loop = 0
+    while (cur_loop < num_loops) or num_loops <= 0:
+        if num_loops > 0:
+            cur_loop += 1
+        start = clock.monotonic()
+        if due is not None:
+            lag_seconds.set(max(0.0, start - due))
+        due = start + loop_interval
+        observations = await fetch(hex_ids)
+        handle_observations(observations)
+        elapsed = clock.monotonic() - start
+        cycle_seconds.observe(elapsed)
+        log.info(
+            "fleet poll cycle finished",
+            aircraft=len(hex_ids),
+            observations=len(observations),
+            duration=elapsed,
+        )
+        if num_loops <= 0 or cur_loop < num_loops:
+            await clock.async_sleep(max(0.0, loop_interval - elapsed))
+
+
+async def poll_scheduled(
+    adsb_backend: AsyncADSBExchange,
+    scheduler: PollScheduler,
+    handle_observations: ObservationHandler,
+    concurrency: int = 10,
+    requests_per_second: float | None = None,
+    num_loops: int = -1,
+    bulk: bool = False,
+    areas: Sequence[Area] = (),
+    max_hex_ids_per_request: int = MAX_HEX_IDS_PER_REQUEST,
+    clock: Clock = SYSTEM_CLOCK,
+    log: structlog.stdlib.BoundLogger = logger,
+):
+    """
+    Like poll_fleet, but each aircraft is polled when scheduler says it is due
+    rather than every cycle. Every aircraft due at the same time is polled in
+    one concurrent batch, then rescheduled from its new observation once
+    handle_observations has run. Aircraft whose poll failed are retried after
+    the scheduler's retry interval.
+
+    num_loops counts batches. A non-positive value loops forever.
+    """
+    fetch = _fetcher(
+        adsb_backend,
+        concurrency,
+        requests_per_second,
+        bulk,
+        areas,
+        max_hex_ids_per_request,
+        clock,
+        log,
+    )
+    cycle_seconds = LOOP_CYCLE_SECONDS.labels(loop="scheduled")
+    lag_seconds = LOOP_LAG_SECONDS.labels(loop="scheduled")
+    cur_loop = 0
+    while (cur_loop < num_loops) or num_loops <= 0:
+        delay = scheduler.time_until_due()
+        if delay is None:
+            log.warning("no aircraft scheduled, stopping")
+            return
+        if delay > 0:
+            await clock.async_sleep(delay)
+        due = scheduler.next_due()
+        hex_ids = scheduler.pop_due()
+        if not hex_ids:
+            continue
+        if num_loops > 0:
+            cur_loop += 1
+
+        start = clock.monotonic()
+        assert due is not None
+        lag_seconds.set(max(0.0, start - due))
+        observations = await fetch(hex_ids)
+        handle_observations(observations)
+        for hex_id in hex_ids:
+            if hex_id in observations:
+                scheduler.observe(hex_id, observations[hex_id])
+            else:
+                scheduler.failed(hex_id)
+        cycle_seconds.observe(clock.monotonic() - start)
+        log.info(
+            "scheduled poll finished",
+            aircraft=len(hex_ids),
+            observations=len(observations),
+            phases={hex_id: scheduler.phases[hex_id].value for hex_id in observations},
+        )
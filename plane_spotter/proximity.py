@@ -0,0 +1,234 @@
+"""
+Proximity masks, answering "could there be an airport within radius of this
+point?" with a single array lookup.
+
+A mask is a raster of cell_degrees sized latitude/longitude cells for one
+search radius. A cell is set if it overlaps the bounding box of the spherical
+cap of that radius around some airport, so a point in an unset cell has no
+airport within radius and needs no search. Points in set cells may or may not
+have one; those are searched as usual.
+
+Masks take a moment to build, so they are cached next to the compiled
+airport database, one file per radius:
+
+    header: magic, format version, rows, columns, cell size, radius, sha256
+        of the airport coordinates the mask was built from
+    cells: the raster, row-major from (-90, -180), one bit per cell
+"""
+
+import hashlib
+import math
+import os
+import pathlib
+import struct
+import tempfile
+
+import numpy as np
+import structlog
+from structlog import get_logger
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+MAGIC = b"PSPROXM\x00"
+FORMAT_VERSION = 1
+CELL_DEGREES = 0.25
+# Mean Earth radius used by haversine.haversine for kilometers
+EARTH_RADIUS_KM = 6371.0088
+
+_HEADER = struct.Struct("<8sIIIdd32s")
+
+
+def coordinates_sha256(latitudes: np.ndarray, longitudes: np.ndarray) -> bytes:
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(latitudes, dtype="<f8").tobytes())
+    digest.update(np.ascontiguousarray(longitudes, dtype="<f8").tobytes())
+    return digest.digest()
+
+
+def mask_path(
+    database_file: pathlib.Path, radius: float, coordinates_digest: bytes
+) -> pathlib.Path:
+    """Where the mask for radius around the airports with coordinates_digest
+    is cached, next to database_file."""
+    database_file = pathlib.Path(database_file)
+    name = f"{database_file.stem}.{coordinates_digest.hex()[:16]}.{radius:g}km.mask"
+    return database_file.parent / name
+
+
+class ProximityMask:
+    """Cells of a raster with an airport possibly within radius kilometers."""
+
+    def __init__(self, cells: np.ndarray, radius: float, cell_degrees: float):
+        self.cells = cells
+        self.radius = radius
+        self.cell_degrees = cell_degrees
+        self._rows, self._columns = cells.shape
+        # Indexing bytes is several times faster than indexing the array
+        self._flat = np.ascontiguousarray(cells, dtype=np.uint8).tobytes()
+
+    @classmethod
+    def build(
+        cls,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        radius: float,
+        cell_degrees: float = CELL_DEGREES,
+    ) -> "ProximityMask":
+        """Builds the mask for airports at latitudes/longitudes, in degrees."""
+        num_rows = math.ceil(180 / cell_degrees)
+        num_columns = math.ceil(360 / cell_degrees)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+
+        # Bounding boxes of the caps, padded like GridIndex.candidates so
+        # floating point error never leaves out a point haversine accepts
+        angle = radius / EARTH_RADIUS_KM * (1 + 1e-9) + 1e-12
+        angle_deg = math.degrees(angle)
+        lat_min = latitudes - angle_deg
+        lat_max = latitudes + angle_deg
+        cos_lat = np.cos(np.radians(latitudes))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(
+                cos_lat > 0, math.sin(min(angle, math.pi / 2)) / cos_lat, 2
+            )
+        delta_lon = np.degrees(np.arcsin(np.minimum(1.0, ratio)))
+        every_column = (
+            (lat_min <= -90) | (lat_max >= 90) | (ratio >= 1) | (angle >= math.pi / 2)
+        )
+
+        first_row = cls._row_of(np.maximum(lat_min, -90), cell_degrees, num_rows)
+        last_row = cls._row_of(np.minimum(lat_max, 90), cell_degrees, num_rows)
+        first_column = np.floor((longitudes - delta_lon + 180) / cell_degrees)
+        last_column = np.floor((longitudes + delta_lon + 180) / cell_degrees)
+        every_column |= last_column - first_column + 1 >= num_columns
+        first_column = np.where(every_column, 0, first_column % num_columns)
+        last_column = np.where(every_column, num_columns - 1, last_column % num_columns)
+        first_column = first_column.astype(np.int64)
+        last_column = last_column.astype(np.int64)
+
+        # Boxes wrapping at the antimeridian are split in two
+        wraps = first_column > last_column
+        boxes = [
+            (
+                first_row,
+                last_row,
+                first_column,
+                np.where(wraps, num_columns - 1, last_column),
+            ),
+            (
+                first_row[wraps],
+                last_row[wraps],
+                np.zeros(wraps.sum(), np.int64),
+                last_column[wraps],
+            ),
+        ]
+        # Every box adds one to its cells in a 2D difference array, which
+        # cumulative sums turn into how many boxes cover each cell
+        coverage = np.zeros((num_rows + 1, num_columns + 1), dtype=np.int32)
+        for top, bottom, left, right in boxes:
+            np.add.at(coverage, (top, left), 1)
+            np.add.at(coverage, (top, right + 1), -1)
+            np.add.at(coverage, (bottom + 1, left), -1)
+            np.add.at(coverage, (bottom + 1, right + 1), 1)
+        coverage = coverage.cumsum(axis=0).cumsum(axis=1)
+        return cls(coverage[:num_rows, :num_columns] > 0, radius, cell_degrees)
+
+    @staticmethod
+    def _row_of(latitudes, cell_degrees: float, num_rows: int):
+        rows = np.floor((np.asarray(latitudes) + 90) / cell_degrees).astype(np.int64)
+        return np.clip(rows, 0, num_rows - 1)
+
+    def may_be_near(self, coordinates: tuple[float, float]) -> bool:
+        """False if no airport is within radius of coordinates."""
+        lat, lon = coordinates
+        row = min(self._rows - 1, max(0, math.floor((lat + 90) / self.cell_degrees)))
+        column = math.floor((lon + 180) / self.cell_degrees) % self._columns
+        return bool(self._flat[row * self._columns + column])
+
+    def save(self, path: pathlib.Path, coordinates_digest: bytes) -> None:
+        """Writes the mask to path, atomically."""
+        path = pathlib.Path(path)
+        fd, tmp_name = tempfile.mkstemp(
+            dir=path.parent, prefix=path.name, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(
+                    _HEADER.pack(
+                        MAGIC,
+                        FORMAT_VERSION,
+                        self._rows,
+                        self._columns,
+                        self.cell_degrees,
+                        self.radius,
+                        coordinates_digest,
+                    )
+                )
+                file.write(np.packbits(self.cells).tobytes())
+            os.chmod(tmp_name, 0o644)
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    @classmethod
+    def load(
+        cls,
+        path: pathlib.Path,
+        radius: float,
+        cell_degrees: float,
+        coordinates_digest: bytes,
+    ) -> "ProximityMask | None":
+        """The mask saved at path, or None if it is missing or was saved for
+        other airports or settings."""
+        try:
+            data = pathlib.Path(path).read_bytes()
+            magic, version, rows, columns, cells, saved_radius, digest = (
+                _HEADER.unpack_from(data)
+            )
+        except (OSError, struct.error):
+            return None
+        if (
+            magic != MAGIC
+            or version != FORMAT_VERSION
+            or cells != cell_degrees
+            or saved_radius != radius
+            or digest != coordinates_digest
+        ):
+            return None
+        bits = np.frombuffer(data, dtype=np.uint8, offset=_HEADER.size)
+        if len(bits) * 8 < rows * columns:
+            return None
+        mask = np.unpackbits(bits, count=rows * columns).astype(bool)
+        return cls(mask.reshape(rows, columns), radius, cell_degrees)
+
+
+def load_proximity_mask(
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+    radius: float,
+    path: pathlib.Path | None = None,
+    cell_degrees: float = CELL_DEGREES,
+    coordinates_digest: bytes | None = None,
+    log: structlog.stdlib.BoundLogger = logger,
+) -> ProximityMask:
+    """
+    The mask for airports at latitudes/longitudes, read from path if it was
+    cached there for the same airports, otherwise built and cached there. A
+    cache that can't be written, say in a read-only install, is skipped.
+    """
+    if path is None:
+        return ProximityMask.build(latitudes, longitudes, radius, cell_degrees)
+    if coordinates_digest is None:
+        coordinates_digest = coordinates_sha256(latitudes, longitudes)
+    mask = ProximityMask.load(path, radius, cell_degrees, coordinates_digest)
+    if mask is not None:
+        return mask
+
+    log.info("building proximity mask", mask_file=str(path), radius=radius)
+    mask = ProximityMask.build(latitudes, longitudes, radius, cell_degrees)
+    try:
+        mask.save(path, coordinates_digest)
+    except OSError:
+        log.warning("could not cache proximity mask", mask_file=str(path))
+    return mask
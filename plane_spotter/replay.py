@@ -0,0 +1,314 @@
+import bisect
+import collections
+import gzip
+import json
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Iterator, Optional
+
+import structlog
+from structlog import get_logger
+
+from plane_spotter.clock import SYSTEM_CLOCK, Clock
+
+if TYPE_CHECKING:
+    # Only needed to replay traces, not to record them
+    import httpx
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+REPLAY_URL = "http://replay/v2/"
+
+
+class TraceRecorder:
+    """
+    Appends every ADSBExchange response to a gzipped JSON lines file, one
+    record per response:
+
+        {"time": 1671668713.8, "path": ["hex", "a835af"], "status": 200,
+         "body": "<raw response text>"}
+
+    The body is stored exactly as received, so a trace can be replayed with
+    ReplayADSBExchange or inspected with zcat. Records are buffered by gzip,
+    call close() (or use the recorder as a context manager) to flush them.
+    """
+
+    def __init__(
+        self, path: str | os.PathLike, clock: Clock = SYSTEM_CLOCK, log=logger
+    ):
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.records = 0
+        log.info("recording ADS-B responses", trace_file=str(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, path: list[str], status: int, body: str) -> None:
+        line = json.dumps(
+            {"time": self._clock.time(), "path": path, "status": status, "body": body}
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+            self.records += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def read_trace(path: str | os.PathLike) -> Iterator[dict[str, Any]]:
+    """
+    Yields the records of a trace written by TraceRecorder. A trace cut short
+    by a crash is read up to the last complete record.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile):
+            return
+
+
+# A response as it was recorded: (time, status, parsed body)
+_Entry = tuple[float, int, Any]
+
+
+class _Timeline:
+    """Responses recorded for one key, looked up by time."""
+
+    def __init__(self) -> None:
+        self.times: list[float] = []
+        self.entries: list[_Entry] = []
+
+    def add(self, entry: _Entry) -> None:
+        self.times.append(entry[0])
+        self.entries.append(entry)
+
+    def sort(self) -> None:
+        self.entries.sort(key=lambda entry: entry[0])
+        self.times = [entry[0] for entry in self.entries]
+
+    def at(self, time: float) -> _Entry | None:
+        """The last entry recorded at or before time."""
+        i = bisect.bisect_right(self.times, time)
+        return self.entries[i - 1] if i else None
+
+
+class _Trace:
+    """
+    A trace indexed for replay. Observations of each aircraft are pulled out
+    of single, multi-hex and area responses alike, so requests can be
+    answered whichever way the aircraft were fetched while recording.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.aircraft: dict[str, _Timeline] = collections.defaultdict(_Timeline)
+        self.paths: dict[tuple[str, ...], _Timeline] = collections.defaultdict(
+            _Timeline
+        )
+        self.start: float | None = None
+        self.end: float | None = None
+        self.records = 0
+        for record in read_trace(path):
+            self._add(record)
+        for timeline in (*self.aircraft.values(), *self.paths.values()):
+            timeline.sort()
+
+    def _add(self, record: dict[str, Any]) -> None:
+        time = record["time"]
+        status = record["status"]
+        path = tuple(record["path"])
+        self.records += 1
+        self.start = time if self.start is None else min(self.start, time)
+        self.end = time if self.end is None else max(self.end, time)
+        try:
+            body = json.loads(record["body"])
+        except ValueError:
+            body = None
+        self.paths[path].add((time, status, body))
+
+        if status != 200 or not isinstance(body, dict):
+            if len(path) == 2 and path[0] == "hex" and "," not in path[1]:
+                self.aircraft[path[1].lower()].add((time, status, body))
+            return
+        if "ac" in body:
+            for adsb_data in body["ac"] or []:
+                if "hex" in adsb_data:
+                    self.aircraft[adsb_data["hex"].lower()].add((time, 200, adsb_data))
+        elif len(path) == 2 and path[0] == "hex":
+            self.aircraft[path[1].lower()].add((time, 200, body))
+
+    def aircraft_at(self, hex_id: str, time: float) -> _Entry | None:
+        timeline = self.aircraft.get(hex_id.lower())
+        return timeline.at(time) if timeline is not None else None
+
+    def path_at(self, path: list[str], time: float) -> _Entry | None:
+        timeline = self.paths.get(tuple(path))
+        return timeline.at(time) if timeline is not None else None
+
+
+def _response(path: list[str], status: int, body: Any) -> "httpx.Response":
+    import httpx
+
+    return httpx.Response(
+        status,
+        json=body,
+        request=httpx.Request("GET", REPLAY_URL + "/".join(path) + "/"),
+    )
+
+
+class ReplayADSBExchange:
+    """
+    Stands in for ADSBExchange, answering from a trace recorded by
+    TraceRecorder instead of the API. Each request gets the newest response
+    recorded at or before clock.time(). Drive it with a VirtualClock starting
+    at start_time to replay a trace as fast as the main loop can run.
+
+    Aircraft are answered from whatever response last saw them, so a trace
+    recorded with bulk polling can be replayed one aircraft at a time and vice
+    versa. Lookups with nothing recorded yet get a 404.
+    """
+
+    def __init__(
+        self, trace_path: str | os.PathLike, clock: Clock = SYSTEM_CLOCK, log=logger
+    ):
+        self._trace = _Trace(trace_path)
+        self._clock = clock
+        self.requests = 0
+        log.info(
+            "loaded ADS-B trace",
+            trace_file=str(trace_path),
+            records=self._trace.records,
+            aircraft=len(self._trace.aircraft),
+            start_time=self._trace.start,
+            end_time=self._trace.end,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def start_time(self) -> Optional[float]:
+        return self._trace.start
+
+    @property
+    def end_time(self) -> Optional[float]:
+        return self._trace.end
+
+    @property
+    def hex_ids(self) -> list[str]:
+        """Every aircraft seen in the trace."""
+        return sorted(self._trace.aircraft)
+
+    def GET(self, path: list[str], headers: Optional[dict] = None) -> "httpx.Response":
+        self.requests += 1
+        now = self._clock.time()
+        if len(path) == 2 and path[0] == "hex":
+            hex_ids = path[1].split(",")
+            if len(hex_ids) == 1:
+                entry = self._trace.aircraft_at(hex_ids[0], now)
+                if entry is None:
+                    return _response(path, 404, {})
+                return _response(path, entry[1], entry[2])
+            observations = [self._trace.aircraft_at(hex_id, now) for hex_id in hex_ids]
+            return _response(
+                path,
+                200,
+                {
+                    "ac": [
+                        entry[2]
+                        for entry in observations
+                        if entry is not None and entry[1] == 200
+                    ]
+                },
+            )
+        entry = self._trace.path_at(path, now)
+        if entry is None:
+            return _response(path, 404, {})
+        return _response(path, entry[1], entry[2])
+
+    def position_by_registration(self, registration: str) -> "httpx.Response":
+        return self.GET(path=["registration", registration])
+
+    def aircraft_by_callsign(self, callsign: str) -> "httpx.Response":
+        return self.GET(path=["callsign", callsign])
+
+    def aircraft_last_position_by_hex_id(self, hex_id: str) -> "httpx.Response":
+        return self.GET(path=["hex", hex_id])
+
+    def aircraft_by_hex_ids(self, hex_ids: list[str]) -> "httpx.Response":
+        return self.GET(path=["hex", ",".join(hex_ids)])
+
+    def aircraft_in_area(self, lat: float, lon: float, dist: float) -> "httpx.Response":
+        return self.GET(path=["lat", str(lat), "lon", str(lon), "dist", str(dist)])
+
+
+class AsyncReplayADSBExchange:
+    """asyncio counterpart of ReplayADSBExchange, standing in for
+    AsyncADSBExchange."""
+
+    def __init__(
+        self, trace_path: str | os.PathLike, clock: Clock = SYSTEM_CLOCK, log=logger
+    ):
+        self._replay = ReplayADSBExchange(trace_path, clock=clock, log=log)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        self._replay.close()
+
+    @property
+    def requests(self) -> int:
+        return self._replay.requests
+
+    @property
+    def start_time(self) -> Optional[float]:
+        return self._replay.start_time
+
+    @property
+    def end_time(self) -> Optional[float]:
+        return self._replay.end_time
+
+    @property
+    def hex_ids(self) -> list[str]:
+        return self._replay.hex_ids
+
+    async def GET(
+        self, path: list[str], headers: Optional[dict] = None
+    ) -> "httpx.Response":
+        return self._replay.GET(path, headers)
+
+    async def position_by_registration(self, registration: str) -> "httpx.Response":
+        return await self.GET(path=["registration", registration])
+
+    async def aircraft_by_callsign(self, callsign: str) -> "httpx.Response":
+        return await self.GET(path=["callsign", callsign])
+
+    async def aircraft_last_position_by_hex_id(self, hex_id: str) -> "httpx.Response":
+        return await self.GET(path=["hex", hex_id])
+
+    async def aircraft_by_hex_ids(self, hex_ids: list[str]) -> "httpx.Response":
+        return await self.GET(path=["hex", ",".join(hex_ids)])
+
+    async def aircraft_in_area(
+        self, lat: float, lon: float, dist: float
+    ) -> "httpx.Response":
+        return await self.GET(
+            path=["lat", str(lat), "lon", str(lon), "dist", str(dist)]
+        )
@@ -0,0 +1,168 @@
+from dataclasses import dataclass
+import enum
+import heapq
+import itertools
+import time
+from typing import Any, Callable, Iterable
+
+# Vertical speed, in feet per minute, below which an aircraft is descending
+DESCENT_RATE_FPM = -300.0
+# Ground speed, in knots, above which an aircraft on the ground is taxiing
+TAXI_SPEED_KT = 3.0
+
+
+class FlightPhase(enum.Enum):
+    PARKED = "parked"
+    TAXIING = "taxiing"
+    CRUISE = "cruise"
+    APPROACH = "approach"
+    DESCENDING = "descending"
+
+
+@dataclass
+class PollIntervals:
+    """Seconds between polls of an aircraft in each flight phase."""
+
+    parked: float = 600
+    taxiing: float = 60
+    cruise: float = 120
+    # Airborne within search_radius of an airport
+    approach: float = 45
+    descending: float = 20
+    # Used after a failed poll
+    retry: float = 30
+
+    def for_phase(self, phase: FlightPhase) -> float:
+        return getattr(self, phase.value)
+
+
+def vertical_rate(
+    adsb_data: dict[str, Any],
+    previous: tuple[float, float] | None,
+    now: float,
+) -> float | None:
+    """
+    Vertical speed in feet per minute. baro_rate (or geom_rate) is used when
+    the API reports it, otherwise it is estimated from the change in alt_baro
+    since the previous (time, altitude) observation.
+    """
+    for key in ("baro_rate", "geom_rate"):
+        if isinstance(adsb_data.get(key), (int, float)):
+            return float(adsb_data[key])
+    altitude = adsb_data.get("alt_baro")
+    if previous is None or not isinstance(altitude, (int, float)):
+        return None
+    previous_time, previous_altitude = previous
+    if now <= previous_time:
+        return None
+    return (altitude - previous_altitude) / ((now - previous_time) / 60)
+
+
+def flight_phase(
+    adsb_data: dict[str, Any], near_airport: bool, rate: float | None
+) -> FlightPhase:
+    if adsb_data.get("alt_baro") == "ground":
+        if (adsb_data.get("gs") or 0) > TAXI_SPEED_KT:
+            return FlightPhase.TAXIING
+        return FlightPhase.PARKED
+    if rate is not None and rate <= DESCENT_RATE_FPM:
+        return FlightPhase.DESCENDING
+    if near_airport:
+        return FlightPhase.APPROACH
+    return FlightPhase.CRUISE
+
+
+class PollScheduler:
+    """
+    Decides when each aircraft should next be polled, based on its flight
+    phase. Aircraft are kept in a priority queue keyed by the time they are
+    next due.
+
+    near_airport(hex_id) tells the scheduler whether the aircraft's last
+    position was within search radius of an airport.
+    """
+
+    def __init__(
+        self,
+        intervals: PollIntervals,
+        near_airport: Callable[[str], bool] = lambda hex_id: False,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.intervals = intervals
+        self._near_airport = near_airport
+        self._clock = clock
+        self._queue: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        # The authoritative due time of each aircraft. Queue entries that don't
+        # match it are stale and skipped when popped.
+        self._due: dict[str, float] = {}
+        self._altitudes: dict[str, tuple[float, float]] = {}
+        self.phases: dict[str, FlightPhase] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, hex_id: object) -> bool:
+        return hex_id in self._due
+
+    def add(self, hex_ids: Iterable[str]) -> None:
+        """Schedules aircraft to be polled right away."""
+        now = self._clock()
+        for hex_id in hex_ids:
+            self.schedule(hex_id, now)
+
+    def remove(self, hex_id: str) -> None:
+        self._due.pop(hex_id, None)
+        self._altitudes.pop(hex_id, None)
+        self.phases.pop(hex_id, None)
+
+    def schedule(self, hex_id: str, due: float) -> None:
+        self._due[hex_id] = due
+        heapq.heappush(self._queue, (due, next(self._counter), hex_id))
+
+    def _discard_stale(self) -> None:
+        while self._queue:
+            due, _, hex_id = self._queue[0]
+            if self._due.get(hex_id) == due:
+                return
+            heapq.heappop(self._queue)
+
+    def next_due(self) -> float | None:
+        self._discard_stale()
+        return self._queue[0][0] if self._queue else None
+
+    def time_until_due(self) -> float | None:
+        """Seconds until the next aircraft is due, or None if none are tracked."""
+        due = self.next_due()
+        if due is None:
+            return None
+        return max(0.0, due - self._clock())
+
+    def pop_due(self) -> list[str]:
+        """Removes and returns every aircraft that is due now."""
+        now = self._clock()
+        hex_ids = []
+        while self.next_due() is not None and self._queue[0][0] <= now:
+            _, _, hex_id = heapq.heappop(self._queue)
+            del self._due[hex_id]
+            hex_ids.append(hex_id)
+        return hex_ids
+
+    def observe(self, hex_id: str, adsb_data: dict[str, Any]) -> FlightPhase:
+        """Schedules the next poll of hex_id from the observation just made."""
+        now = self._clock()
+        rate = vertical_rate(adsb_data, self._altitudes.get(hex_id), now)
+        altitude = adsb_data.get("alt_baro")
+        if isinstance(altitude, (int, float)):
+            self._altitudes[hex_id] = (now, float(altitude))
+        else:
+            self._altitudes.pop(hex_id, None)
+
+        phase = flight_phase(adsb_data, self._near_airport(hex_id), rate)
+        self.phases[hex_id] = phase
+        self.schedule(hex_id, now + self.intervals.for_phase(phase))
+        return phase
+
+    def failed(self, hex_id: str) -> None:
+        """Schedules a retry of an aircraft whose poll failed."""
+        self.schedule(hex_id, self._clock() + self.intervals.retry)
@@ -0,0 +1,33 @@
+import pathlib
+
+import click
+
+from plane_spotter.airport_db import build_airport_database, default_database_path
+from plane_spotter.package import airport_code_path
+
+
+@click.command()
+@click.option(
+    "--airport-code-file",
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+    default=airport_code_path,
+    show_default="package airport-codes.csv",
+    help="OurAirports CSV to compile.",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    default=None,
+    help="Where to write the database. Defaults to next to the CSV.",
+)
+def main(airport_code_file: pathlib.Path, output: pathlib.Path | None) -> None:
+    """Compiles the airport CSV into the memory-mapped database the
+    Geolocator loads at startup."""
+    if output is None:
+        output = default_database_path(airport_code_file)
+    build_airport_database(airport_code_file, output)
+    click.echo(f"wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
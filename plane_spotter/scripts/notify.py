@@ -1,26 +1,41 @@
-import collections
-from dataclasses import asdict, dataclass, field
-import datetime
-import json
+import concurrent.futures
+import contextlib
+from dataclasses import dataclass, field
 import os
-from textwrap import dedent
-import time
-from typing import Any, Iterable
+import pathlib
+from typing import Any, Iterable, Optional
 
 import hydra
 from hydra.core.config_store import ConfigStore
 from omegaconf import MISSING, OmegaConf
 from structlog import get_logger
 
-from plane_spotter.adsb import ADSBExchange
-from plane_spotter.geolocator import Airport, AirportDiscovery, Geolocator
-from plane_spotter.notification import (
-    NotificationBackend,
-    plane_landed_message,
-    plane_stationed_at_message,
+from plane_spotter.adsb import (
+    MAX_HEX_IDS_PER_REQUEST,
+    ADSBExchange,
+    AsyncADSBExchange,
 )
+from plane_spotter.adsb_cache import AsyncResponseCache, ResponseCache
+from plane_spotter.dispatcher import NotificationDispatcher
+from plane_spotter.geolocator import (
+    AIRPORT_TYPE_BLACKLIST,
+    AirportFilter,
+    Geolocator,
+)
+from plane_spotter.logs import configure_logging
+from plane_spotter.loop import fleet_main_loop as _fleet_main_loop
+from plane_spotter.loop import main_loop as _main_loop
+from plane_spotter.metrics import MetricsServer, TextfileExporter
+from plane_spotter.notification import NotificationBackend
 from plane_spotter.package import airport_code_path
-from plane_spotter.twitter import TwitterSelenium as _TwitterSelenium
+from plane_spotter.polling import Area
+from plane_spotter.replay import TraceRecorder
+from plane_spotter.scheduler import PollIntervals
+from plane_spotter.state import StateStore
+from plane_spotter.tracks import TrackStore
+
+# The notification backends, and selenium behind TwitterSelenium, are
+# imported in notify() once it is known which one is configured.
 
 
 @dataclass
@@ -28,6 +43,18 @@ class ADSBExchangeConfig:
     api_key: str = MISSING
     api_hostname: str = MISSING
     driver: str = "adsbexchange"
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    retries: int = 3
+    backoff_factor: float = 0.5
+    backoff_jitter: float = 0.5
+    backoff_max: float = 60.0
+    pool_maxsize: int = 10
+    # Serve identical requests made within cache_ttl seconds from one API
+    # response, keeping at most cache_size of them. Requests already in
+    # flight are always shared while the cache is on.
+    cache_ttl: Optional[float] = None
+    cache_size: int = 1024
 
 
 @dataclass
@@ -40,9 +67,17 @@ class TwitterBase:
 
 @dataclass
 class TwitterAPI(TwitterBase):
+    # The app's consumer key and secret
     key_id: str = MISSING
     key_secret: str = MISSING
+    # Access token of the account tweets are posted as
+    access_token: str = MISSING
+    access_token_secret: str = MISSING
     driver: str = "twitter_api"
+    api_url: str = "https://api.twitter.com"
+    # Tweets held while rate limited, and how long shutdown waits for them
+    max_queued: int = 100
+    close_timeout: float = 30.0
 
 
 @dataclass
@@ -52,22 +87,113 @@ class TwitterSelenium(TwitterBase):
     username: str = MISSING
     phone_number: str | None = None
     key_secret: str = MISSING
+    # Browsers are kept warm and logged in between tweets, and replaced after
+    # browser_max_uses tweets or once their processes' resident memory grows
+    # by browser_max_memory_growth_mb, which needs psutil.
+    max_browsers: int = 1
+    browser_max_uses: int = 100
+    browser_max_memory_growth_mb: Optional[float] = 512
+    # File the logged in Twitter session is kept in, so restarts can skip the
+    # login flow. Keep it private, it grants access to the account.
+    session_file: Optional[str] = None
 
 
 @dataclass
 class Airplane:
-    registration: str | None = MISSING
-    icao_hex_id: str | None = MISSING
+    registration: str | None = None
+    icao_hex_id: str | None = None
+
+
+@dataclass
+class NotificationQueue:
+    """Settings of the queue notifications are sent from, see
+    NotificationDispatcher."""
+
+    size: int = 100
+    workers: int = 1
+    retries: int = 3
+    retry_backoff: float = 5.0
+    # Minimum seconds between two notifications
+    min_interval: float = 0.0
+
+
+@dataclass
+class Airports:
+    """Which airports airplanes are matched to, see AirportFilter. Fewer
+    airports load and search faster."""
+
+    exclude_types: list[str] = field(
+        default_factory=lambda: sorted(AIRPORT_TYPE_BLACKLIST)
+    )
+    types: Optional[list[str]] = None
+    # iso_country codes like US, and iso_region codes like CA-ON
+    countries: Optional[list[str]] = None
+    regions: Optional[list[str]] = None
+    require_iata_code: bool = False
+    # Needs runway_file, OurAirports' runways.csv
+    min_runway_length_ft: Optional[int] = None
+    runway_file: Optional[str] = None
+    # Airport types searched first, in order, like
+    # [[large_airport, medium_airport]]. Airports of other types are only
+    # matched when none of an earlier tier is within search_radius.
+    tiers: list[list[str]] = field(default_factory=list)
 
 
 @dataclass
 class Config:
     defaults: list[Any] = field(default_factory=lambda: defaults)
     search_radius: int = 1000
+    # Kilometers an airplane has to move before its nearest airport is looked
+    # up again, and how close to its last airport it has to stay for only
+    # that airport's neighborhood to be searched.
+    geolocation_min_movement: float = 0.1
+    geolocation_taxi_radius: float = 5.0
+    airports: Airports = field(default_factory=Airports)
     adsb_backend: Any = MISSING
-    airplane: Airplane = MISSING
+    # A single airplane to track. More can be listed in airplanes.
+    airplane: Optional[Airplane] = None
+    airplanes: list[Airplane] = field(default_factory=list)
     notification_backend: Any = MISSING
     loop_interval: int = 120
+    # Only used when tracking more than one airplane
+    poll_concurrency: int = 10
+    poll_requests_per_second: Optional[float] = None
+    # Poll each airplane at an interval depending on its flight phase, given by
+    # poll_intervals, instead of every loop_interval seconds.
+    adaptive_polling: bool = False
+    poll_intervals: PollIntervals = field(default_factory=PollIntervals)
+    # Fetch the airplanes with bulk requests: first every area in poll_areas,
+    # then the airplanes not found there up to bulk_max_hex_ids at a time.
+    bulk_polling: bool = False
+    bulk_max_hex_ids: int = MAX_HEX_IDS_PER_REQUEST
+    poll_areas: list[Area] = field(default_factory=list)
+    # SQLite file remembering each airplane's state across restarts. State is
+    # written every state_flush_interval seconds; state_synchronous is
+    # SQLite's synchronous pragma: OFF, NORMAL, FULL or EXTRA.
+    state_file: Optional[str] = None
+    state_flush_interval: float = 1.0
+    state_synchronous: str = "NORMAL"
+    notification_queue: NotificationQueue = field(default_factory=NotificationQueue)
+    # Directory every polled position is stored in, one file per airplane
+    # per day. Landing notifications then include stats of the route flown.
+    track_dir: Optional[str] = None
+    # Gzipped JSON lines file every ADS-B response is appended to, for
+    # replaying with plane_spotter.scripts.replay
+    trace_file: Optional[str] = None
+    # Serve Prometheus metrics on http://metrics_host:metrics_port/metrics,
+    # and/or write them to metrics_file every metrics_file_interval seconds
+    # for node_exporter's textfile collector.
+    metrics_port: Optional[int] = None
+    metrics_host: str = "127.0.0.1"
+    metrics_file: Optional[str] = None
+    metrics_file_interval: float = 15.0
+    # "console" for people, "json" for log pipelines (rendered with orjson
+    # when installed). Repeated "airplane hasn't moved" style messages are
+    # logged once per log_sample_interval seconds per airplane; set it to
+    # null to log every one.
+    log_format: str = "console"
+    log_level: str = "INFO"
+    log_sample_interval: Optional[float] = 300.0
 
 
 defaults: list[Any] = []
@@ -84,126 +210,37 @@ cs.store(name="airplane_schema", node=Airplane)
 
 logger = get_logger(__name__)
 
-HASHTAGS = ["#elonjet", "@elonjet", "@elonmusk", "@ElonJetNextDay"]
-
-
-def _main_loop(
-    adsb_backend: ADSBExchange,
-    geolocator: Geolocator,
-    notification_backend: NotificationBackend,
-    search_radius: int,
-    icao_hex_id: str,
-    loop_interval: int = 120,
-    num_loops: int = -1,
-    log=logger,
-):
-    """
-    This is the main loop for discovering ADS-B data and notifying the backend.
-
-    num_loops if set to a non-positive number will loop only that number of times.
-    If it's set to zero or a negative number, it will loop infinitely.
-    """
-    last_landed_airport = AirportDiscovery(
-        airport=Airport(),
-        discovery_time=datetime.datetime.now(datetime.timezone.utc),
-        unknown=True,
+
+def _optional_set(values: Optional[Iterable[str]]) -> Optional[frozenset[str]]:
+    return None if values is None else frozenset(values)
+
+
+def _load_geolocator(airports: Airports, search_radius: float) -> Geolocator:
+    geolocator = Geolocator(
+        airport_code_file=airport_code_path(),
+        airport_filter=AirportFilter(
+            exclude_types=frozenset(airports.exclude_types),
+            types=_optional_set(airports.types),
+            countries=_optional_set(airports.countries),
+            regions=_optional_set(airports.regions),
+            require_iata_code=airports.require_iata_code,
+            min_runway_length_ft=airports.min_runway_length_ft,
+        ),
+        runway_file=(
+            None if airports.runway_file is None else pathlib.Path(airports.runway_file)
+        ),
+        tiers=[list(types) for types in airports.tiers],
     )
-    in_flight: bool = False
-    first_loop: bool = True
-    cur_loop = 0
-
-    while (cur_loop < num_loops) or num_loops <= 0:
-        if num_loops > 0:
-            cur_loop += 1
-        if not first_loop:
-            time.sleep(loop_interval)
-        first_loop = False
-
-        now = datetime.datetime.now(datetime.timezone.utc)
-
-        adsb_data = adsb_backend.aircraft_last_position_by_hex_id(
-            hex_id=icao_hex_id
-        ).json()
-        log.info("adsb info:")
-        log.info(f"\n{json.dumps(adsb_data, indent=4)}\n")
-
-        lat = adsb_data["lat"]
-        lon = adsb_data["lon"]
-        log.info(f"Plane last known location", lat=lat, lon=lon)
-
-        discovered_closest_airport = geolocator.lookup_airport(
-            coordinates=(lat, lon), max_distance=search_radius
-        )
-        nearest_airport = AirportDiscovery(
-            airport=discovered_closest_airport or Airport(),
-            discovery_time=now,
-            unknown=discovered_closest_airport is None,
-        )
-        if not nearest_airport.unknown:
-            log.info(
-                "Nearest airport info:\n"
-                + json.dumps(asdict(nearest_airport.airport), indent=4)
-                + "\n"
-            )
-        else:
-            log.info("not near any known airport")
-
-        if (
-            not in_flight
-            and last_landed_airport.unknown
-            and not nearest_airport.unknown
-        ):
-            if adsb_data["alt_baro"] == "ground":
-                in_flight = False
-                log.info("discovered first airport aircraft has landed at")
-                last_landed_airport = nearest_airport
-
-                message = plane_stationed_at_message(
-                    airport=nearest_airport, hashtags=HASHTAGS
-                )
-                notification_backend.send(message=message, log=log)
-            else:
-                in_flight = True
-                last_landed_airport = AirportDiscovery(
-                    airport=Airport(), discovery_time=now, unknown=True
-                )
-                log.info("aircraft is still in flight. Unknown last landed airport.")
-            continue
-        else:
-            log.info("last_landed_airport is unknown")
-
-        if adsb_data["alt_baro"] != "ground":
-            if not in_flight:
-                message = "Aircraft has taken off!"
-                log.info(message)
-                notification_backend.send(message=message, log=log)
-            else:
-                log.info("aircraft still in flight")
-            in_flight = True
-            continue
-        else:
-            log.info("altimeter reporting ground")
-
-        log.debug(f"nearest airport: {nearest_airport.airport.ident}")
-        log.debug(f"last landed airport: {last_landed_airport.airport.ident}")
-
-        if (
-            nearest_airport.airport.ident != last_landed_airport.airport.ident
-            and adsb_data["alt_baro"] == "ground"
-            and in_flight
-        ):
-            in_flight = False
-
-            log.info("airplane landed at airport")
-            message = plane_landed_message(
-                source=last_landed_airport,
-                destination=nearest_airport,
-                hashtags=HASHTAGS,
-            )
-            notification_backend.send(message=message, log=log)
-            last_landed_airport = nearest_airport
-        else:
-            log.info("airplane hasn't moved")
+    # Loaded or built now so the first lookup doesn't wait on them
+    geolocator.proximity_masks(search_radius)
+    return geolocator
+
+
+def _icao_hex_ids(cfg: Config) -> list[str]:
+    airplanes = list(cfg.airplanes)
+    if cfg.airplane is not None:
+        airplanes.append(cfg.airplane)
+    return [airplane.icao_hex_id for airplane in airplanes if airplane.icao_hex_id]
 
 
 @hydra.main(
@@ -215,6 +252,11 @@ def notify(cfg: Config) -> None:
     missing_keys = OmegaConf.missing_keys(cfg)
     if missing_keys:
         raise RuntimeError(f"Got missing keys in config:\n{missing_keys}")
+    configure_logging(
+        format=cfg.log_format,
+        level=cfg.log_level,
+        sample_interval=cfg.log_sample_interval,
+    )
 
     log = logger.bind(
         adsb_backend=cfg.adsb_backend.driver,
@@ -222,43 +264,183 @@ def notify(cfg: Config) -> None:
     )
     log.info("starting")
 
+    icao_hex_ids = _icao_hex_ids(cfg)
+    if not icao_hex_ids:
+        raise RuntimeError("No airplanes configured, set airplane or airplanes")
+    fleet_mode = len(icao_hex_ids) > 1 or cfg.bulk_polling
+    log.info("tracking airplanes", icao_hex_ids=icao_hex_ids)
+
+    # The airport index loads in the background while the backends start up
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="geolocator"
+    )
+    geolocator_future = executor.submit(
+        _load_geolocator, cfg.airports, cfg.search_radius
+    )
+    executor.shutdown(wait=False)
+
     notification_backend: NotificationBackend
-    geolocator = Geolocator(airport_code_file=airport_code_path())
 
     log.info("instantiating ADS-B backend")
+    recorder = (
+        TraceRecorder(cfg.trace_file, log=log) if cfg.trace_file is not None else None
+    )
+    adsb_backend: ADSBExchange | AsyncADSBExchange
     if cfg.adsb_backend["driver"] == "adsbexchange":
-        adsb_backend = ADSBExchange(
-            key=cfg.adsb_backend["api_key"], hostname=cfg.adsb_backend["api_hostname"]
+        adsb_class = AsyncADSBExchange if fleet_mode else ADSBExchange
+        cache: ResponseCache | AsyncResponseCache | None = None
+        if cfg.adsb_backend.cache_ttl is not None:
+            cache_class = AsyncResponseCache if fleet_mode else ResponseCache
+            cache = cache_class(
+                ttl=cfg.adsb_backend.cache_ttl,
+                max_entries=cfg.adsb_backend.cache_size,
+            )
+        adsb_backend = adsb_class(
+            key=cfg.adsb_backend["api_key"],
+            hostname=cfg.adsb_backend["api_hostname"],
+            connect_timeout=cfg.adsb_backend.connect_timeout,
+            read_timeout=cfg.adsb_backend.read_timeout,
+            retries=cfg.adsb_backend.retries,
+            backoff_factor=cfg.adsb_backend.backoff_factor,
+            backoff_jitter=cfg.adsb_backend.backoff_jitter,
+            backoff_max=cfg.adsb_backend.backoff_max,
+            pool_maxsize=cfg.adsb_backend.pool_maxsize,
+            recorder=recorder,
+            cache=cache,
         )
     else:
         raise ValueError(f"backend not known: {cfg.adsb_backend['driver']}")
 
     log.info("instantiating notification backend")
 
+    backend_contexts: list[Any]
+    login = None
     if cfg.notification_backend.driver == "twitter_selenium":
-        twitter_selenium = _TwitterSelenium(
+        from plane_spotter.browser_pool import BrowserPool
+        from plane_spotter.twitter import TwitterSelenium as _TwitterSelenium
+
+        browser_pool = BrowserPool(
+            max_browsers=cfg.notification_backend.max_browsers,
+            max_uses=cfg.notification_backend.browser_max_uses,
+            max_memory_growth_mb=cfg.notification_backend.browser_max_memory_growth_mb,
+            log=log,
+        )
+        notification_backend = _TwitterSelenium(
             email=cfg.notification_backend.key_id,
             password=cfg.notification_backend.key_secret,
             phone_number=cfg.notification_backend.phone_number,
             username=cfg.notification_backend.username,
             dry_run=cfg.notification_backend.dry_run,
+            browser_pool=browser_pool,
+            session_file=cfg.notification_backend.session_file,
+        )
+        backend_contexts = [browser_pool, notification_backend]
+        login = notification_backend.login
+    elif cfg.notification_backend.driver == "twitter_api":
+        from plane_spotter.twitter_api import TwitterAPI as _TwitterAPI
+
+        notification_backend = _TwitterAPI(
+            consumer_key=cfg.notification_backend.key_id,
+            consumer_secret=cfg.notification_backend.key_secret,
+            access_token=cfg.notification_backend.access_token,
+            access_token_secret=cfg.notification_backend.access_token_secret,
+            api_url=cfg.notification_backend.api_url,
+            max_queued=cfg.notification_backend.max_queued,
+            close_timeout=cfg.notification_backend.close_timeout,
+            dry_run=cfg.notification_backend.dry_run,
+            log=log,
         )
-        notification_backend = twitter_selenium
+        backend_contexts = [notification_backend]
     else:
         raise ValueError(f"backend not known: {cfg.notification_backend.driver}")
 
-    with twitter_selenium:
-        twitter_selenium.login()
-        log.info("starting main loop")
-        _main_loop(
-            adsb_backend=adsb_backend,
-            geolocator=geolocator,
-            notification_backend=notification_backend,
-            icao_hex_id=cfg.airplane.icao_hex_id,
-            search_radius=cfg.search_radius,
-            loop_interval=cfg.loop_interval,
-            log=log,
+    poll_intervals = (
+        OmegaConf.to_object(cfg.poll_intervals) if cfg.adaptive_polling else None
+    )
+
+    with contextlib.ExitStack() as stack:
+        if recorder is not None:
+            stack.enter_context(recorder)
+        if cfg.metrics_port is not None:
+            stack.enter_context(
+                MetricsServer(cfg.metrics_port, host=cfg.metrics_host, log=log)
+            )
+        if cfg.metrics_file is not None:
+            stack.enter_context(
+                TextfileExporter(
+                    cfg.metrics_file, interval=cfg.metrics_file_interval, log=log
+                )
+            )
+        for context in backend_contexts:
+            stack.enter_context(context)
+        state_store = None
+        if cfg.state_file is not None:
+            state_store = stack.enter_context(
+                StateStore(
+                    cfg.state_file,
+                    flush_interval=cfg.state_flush_interval,
+                    synchronous=cfg.state_synchronous,
+                    log=log,
+                )
+            )
+        track_store = None
+        if cfg.track_dir is not None:
+            track_store = TrackStore(cfg.track_dir, log=log)
+            # Days that ended while the process was down
+            track_store.compact()
+        if login is not None:
+            login()
+        # Sends happen on the dispatcher's workers, so a slow backend never
+        # holds up polling. It is closed first, draining queued notifications
+        # before the backend is.
+        notification_backend = stack.enter_context(
+            NotificationDispatcher(
+                notification_backend,
+                workers=cfg.notification_queue.workers,
+                queue_size=cfg.notification_queue.size,
+                retries=cfg.notification_queue.retries,
+                retry_backoff=cfg.notification_queue.retry_backoff,
+                min_interval=cfg.notification_queue.min_interval,
+                log=log,
+            )
         )
+        geolocator = geolocator_future.result()
+        log.info("starting main loop")
+        if isinstance(adsb_backend, AsyncADSBExchange):
+            _fleet_main_loop(
+                adsb_backend=adsb_backend,
+                geolocator=geolocator,
+                notification_backend=notification_backend,
+                icao_hex_ids=icao_hex_ids,
+                search_radius=cfg.search_radius,
+                loop_interval=cfg.loop_interval,
+                concurrency=cfg.poll_concurrency,
+                requests_per_second=cfg.poll_requests_per_second,
+                poll_intervals=poll_intervals,
+                bulk=cfg.bulk_polling,
+                areas=[Area(**area) for area in cfg.poll_areas],
+                max_hex_ids_per_request=cfg.bulk_max_hex_ids,
+                state_store=state_store,
+                track_store=track_store,
+                min_movement=cfg.geolocation_min_movement,
+                taxi_radius=cfg.geolocation_taxi_radius,
+                log=log,
+            )
+        else:
+            _main_loop(
+                adsb_backend=adsb_backend,
+                geolocator=geolocator,
+                notification_backend=notification_backend,
+                icao_hex_id=icao_hex_ids[0],
+                search_radius=cfg.search_radius,
+                loop_interval=cfg.loop_interval,
+                poll_intervals=poll_intervals,
+                state_store=state_store,
+                track_store=track_store,
+                min_movement=cfg.geolocation_min_movement,
+                taxi_radius=cfg.geolocation_taxi_radius,
+                log=log,
+            )
 
 
 if __name__ == "__main__":
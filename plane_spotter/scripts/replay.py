@@ -0,0 +1,140 @@
+import collections
+import logging
+import pathlib
+import time
+
+import click
+import structlog
+
+from plane_spotter.clock import VirtualClock
+from plane_spotter.geolocator import Geolocator
+from plane_spotter.notification import TOOK_OFF_MESSAGE, NotificationBackend
+from plane_spotter.package import airport_code_path
+from plane_spotter.replay import AsyncReplayADSBExchange
+from plane_spotter.scheduler import PollIntervals
+from plane_spotter.loop import fleet_main_loop
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+
+class EndOfTrace(Exception):
+    pass
+
+
+class ReplayClock(VirtualClock):
+    """A VirtualClock that ends the replay once it passes the end of the
+    trace."""
+
+    def __init__(self):
+        super().__init__()
+        self._end = float("inf")
+
+    def start(self, start: float, end: float) -> None:
+        self._time = start
+        self._end = end
+
+    def advance(self, seconds: float) -> None:
+        super().advance(seconds)
+        if self.time() > self._end:
+            raise EndOfTrace()
+
+
+class CountingBackend(NotificationBackend):
+    """Counts notifications by kind instead of sending them."""
+
+    def __init__(self):
+        self.counts: collections.Counter[str] = collections.Counter()
+
+    def send(self, message: str, log=logger):
+        if message == TOOK_OFF_MESSAGE:
+            self.counts["took off"] += 1
+        elif message.startswith("Airplane landed"):
+            self.counts["landed"] += 1
+        elif message.startswith("Airplane is stationed"):
+            self.counts["stationed"] += 1
+        else:
+            self.counts["other"] += 1
+
+
+@click.command()
+@click.argument(
+    "trace_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+)
+@click.option(
+    "--airport-code-file",
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+    default=airport_code_path,
+    show_default="package airport-codes.csv",
+    help="OurAirports CSV to geolocate against.",
+)
+@click.option(
+    "--icao-hex-id",
+    "icao_hex_ids",
+    multiple=True,
+    help="Aircraft to track. Defaults to every aircraft in the trace.",
+)
+@click.option("--search-radius", type=int, default=1000, show_default=True)
+@click.option("--loop-interval", type=int, default=120, show_default=True)
+@click.option(
+    "--adaptive-polling/--no-adaptive-polling",
+    default=False,
+    help="Poll on the default PollIntervals schedule instead of every loop.",
+)
+@click.option("--bulk-polling/--no-bulk-polling", default=False)
+def main(
+    trace_file: pathlib.Path,
+    airport_code_file: pathlib.Path,
+    icao_hex_ids: tuple[str, ...],
+    search_radius: int,
+    loop_interval: int,
+    adaptive_polling: bool,
+    bulk_polling: bool,
+) -> None:
+    """
+    Replays a trace recorded with notify's trace_file through the fleet main
+    loop on a virtual clock, as fast as events can be detected, then reports
+    the events found and how fast the replay ran.
+    """
+    structlog.configure(
+        wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING),
+    )
+    geolocator = Geolocator(airport_code_file=airport_code_file)
+    clock = ReplayClock()
+    adsb_backend = AsyncReplayADSBExchange(trace_file, clock=clock)
+    if adsb_backend.start_time is None or adsb_backend.end_time is None:
+        raise click.ClickException(f"{trace_file} has no records")
+    clock.start(adsb_backend.start_time, adsb_backend.end_time)
+    hex_ids = list(icao_hex_ids) or adsb_backend.hex_ids
+    notifications = CountingBackend()
+
+    start = time.perf_counter()
+    try:
+        fleet_main_loop(
+            adsb_backend=adsb_backend,
+            geolocator=geolocator,
+            notification_backend=notifications,
+            search_radius=search_radius,
+            icao_hex_ids=hex_ids,
+            loop_interval=loop_interval,
+            poll_intervals=PollIntervals() if adaptive_polling else None,
+            bulk=bulk_polling,
+            clock=clock,
+        )
+    except EndOfTrace:
+        pass
+    elapsed = time.perf_counter() - start
+
+    replayed = adsb_backend.end_time - adsb_backend.start_time
+    click.echo(f"aircraft: {len(hex_ids)}")
+    click.echo(f"replayed: {replayed:.0f} s of trace in {elapsed:.2f} s")
+    click.echo(f"speedup: {replayed / elapsed:.0f}x")
+    click.echo(
+        f"requests: {adsb_backend.requests} ({adsb_backend.requests / elapsed:.0f}/s)"
+    )
+    for kind, count in sorted(notifications.counts.items()):
+        click.echo(f"{kind}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,33 @@
 import pathlib
-import time
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 import structlog
 from structlog import get_logger
 
+from plane_spotter.browser_pool import BrowserPool, chrome_driver
+
 logger: structlog.stdlib.BoundLogger = get_logger(__name__)
 
+SCREENSHOT_CHROME_ARGUMENTS = ("--headless", "--start-maximized")
+
+
+def adsb_exchange_screenshot(
+    icao_hex: str,
+    screenshot_path: pathlib.Path,
+    browser_pool: BrowserPool | None = None,
+) -> None:
+    """
+    Saves a screenshot of the aircraft on the ADS-B Exchange map. The browser
+    is borrowed from browser_pool if given, otherwise one is started just for
+    the screenshot.
+    """
+    if browser_pool is None:
+        with BrowserPool(
+            factory=lambda: chrome_driver(SCREENSHOT_CHROME_ARGUMENTS)
+        ) as pool:
+            adsb_exchange_screenshot(icao_hex, screenshot_path, browser_pool=pool)
+        return
 
-def adsb_exchange_screenshot(icao_hex: str, screenshot_path: pathlib.Path) -> None:
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=options)
-    try:
+    with browser_pool.browser() as driver:
         driver.get(f"https://globe.adsbexchange.com/?icao={icao_hex.lower()}")
         driver.set_window_size(1000, 1000)
         driver.save_screenshot(screenshot_path)
-    finally:
-        driver.quit()
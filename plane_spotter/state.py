@@ -0,0 +1,197 @@
+"""
+Durable tracker state, so a restarted process remembers where each aircraft
+last landed and whether it is in flight.
+
+State lives in a SQLite database in WAL mode, one row per aircraft. Saving a
+tracker only records a snapshot in memory; a background thread writes the
+latest snapshot of every changed aircraft in one transaction per
+flush_interval, so the polling loop never waits on disk I/O. How hard SQLite
+syncs to disk is set by `synchronous`, see
+https://www.sqlite.org/pragma.html#pragma_synchronous.
+"""
+
+from dataclasses import asdict
+import datetime
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any
+
+import structlog
+from structlog import get_logger
+
+from plane_spotter.geolocator import Airport, AirportDiscovery
+from plane_spotter.tracker import AircraftTracker, TrackerState
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS aircraft (
+    icao_hex_id TEXT PRIMARY KEY,
+    in_flight INTEGER NOT NULL,
+    last_landed_airport TEXT NOT NULL,
+    last_observation TEXT,
+    updated REAL NOT NULL
+)
+"""
+_UPSERT = """
+INSERT INTO aircraft
+    (icao_hex_id, in_flight, last_landed_airport, last_observation, updated)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (icao_hex_id) DO UPDATE SET
+    in_flight = excluded.in_flight,
+    last_landed_airport = excluded.last_landed_airport,
+    last_observation = excluded.last_observation,
+    updated = excluded.updated
+"""
+
+
+def _encode_discovery(discovery: AirportDiscovery) -> str:
+    return json.dumps(
+        {
+            "airport": asdict(discovery.airport),
+            "discovery_time": discovery.discovery_time.isoformat(),
+            "unknown": discovery.unknown,
+        }
+    )
+
+
+def _decode_discovery(encoded: str) -> AirportDiscovery:
+    discovery = json.loads(encoded)
+    airport = discovery["airport"]
+    if airport.get("coordinates") is not None:
+        airport["coordinates"] = tuple(airport["coordinates"])
+    return AirportDiscovery(
+        airport=Airport(**airport),
+        discovery_time=datetime.datetime.fromisoformat(discovery["discovery_time"]),
+        unknown=discovery["unknown"],
+    )
+
+
+class StateStore:
+    """
+    Persists TrackerState per aircraft. Use as a context manager, or call
+    close(), so pending writes are flushed on shutdown.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path | str,
+        flush_interval: float = 1.0,
+        synchronous: str = "NORMAL",
+        log: structlog.stdlib.BoundLogger = logger,
+    ):
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {SYNCHRONOUS_MODES}")
+        self._flush_interval = flush_interval
+        self._log = log
+
+        # The connection is only used by the writer thread once it's started
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(f"PRAGMA synchronous={synchronous}")
+        self._connection.execute(_SCHEMA)
+        self.states = self._load()
+        log.info("loaded tracker state", aircraft=len(self.states), path=str(path))
+
+        self._pending: dict[str, TrackerState] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(
+            target=self._write_loop, name="state-store-writer", daemon=True
+        )
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _load(self) -> dict[str, TrackerState]:
+        states = {}
+        rows = self._connection.execute(
+            "SELECT icao_hex_id, in_flight, last_landed_airport, last_observation "
+            "FROM aircraft"
+        )
+        for icao_hex_id, in_flight, last_landed_airport, last_observation in rows:
+            states[icao_hex_id] = TrackerState(
+                icao_hex_id=icao_hex_id,
+                last_landed_airport=_decode_discovery(last_landed_airport),
+                in_flight=bool(in_flight),
+                last_observation=(
+                    json.loads(last_observation) if last_observation else None
+                ),
+            )
+        return states
+
+    def restore(self, tracker: AircraftTracker) -> bool:
+        """Restores tracker from its saved state. Returns whether there was one."""
+        state = self.states.get(tracker.icao_hex_id)
+        if state is None:
+            return False
+        tracker.restore(state)
+        return True
+
+    def save(self, tracker: AircraftTracker) -> None:
+        """Queues a snapshot of tracker to be written by the next flush."""
+        state = tracker.state()
+        with self._condition:
+            self.states[state.icao_hex_id] = state
+            self._pending[state.icao_hex_id] = state
+            self._condition.notify()
+
+    def _write(self, states: list[TrackerState]) -> None:
+        now = time.time()
+        rows: list[tuple[Any, ...]] = [
+            (
+                state.icao_hex_id,
+                state.in_flight,
+                _encode_discovery(state.last_landed_airport),
+                (
+                    json.dumps(state.last_observation)
+                    if state.last_observation is not None
+                    else None
+                ),
+                now,
+            )
+            for state in states
+        ]
+        with self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(_UPSERT, rows)
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._closed:
+                    # Let more changes accumulate so they share a transaction
+                    self._condition.wait_for(
+                        lambda: self._closed, timeout=self._flush_interval
+                    )
+                pending, self._pending = self._pending, {}
+                closed = self._closed
+            if pending:
+                try:
+                    self._write(list(pending.values()))
+                except sqlite3.Error:
+                    self._log.exception("failed to write tracker state")
+            if closed:
+                return
+
+    def close(self) -> None:
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._writer.join()
+        self._connection.close()
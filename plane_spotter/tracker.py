@@ -0,0 +1,298 @@
+from dataclasses import dataclass
+import datetime
+from typing import TYPE_CHECKING, Any, Iterable
+
+import structlog
+from structlog import get_logger
+
+from plane_spotter.adsb import position_time
+from plane_spotter.geolocator import (
+    MIN_MOVEMENT_KM,
+    TAXI_RADIUS_KM,
+    Airport,
+    AirportDiscovery,
+    AirportMatch,
+    Geolocator,
+    IncrementalGeolocator,
+)
+
+if TYPE_CHECKING:
+    from plane_spotter.state import StateStore
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class Stationed:
+    """The first airport an aircraft was seen on the ground at."""
+
+    icao_hex_id: str
+    airport: AirportDiscovery
+
+
+@dataclass(frozen=True)
+class TookOff:
+    icao_hex_id: str
+    source: AirportDiscovery
+
+
+@dataclass(frozen=True)
+class Landed:
+    icao_hex_id: str
+    source: AirportDiscovery
+    destination: AirportDiscovery
+
+
+Event = Stationed | TookOff | Landed
+
+
+@dataclass(frozen=True)
+class TrackerState:
+    """What an AircraftTracker needs to pick up where it left off."""
+
+    icao_hex_id: str
+    last_landed_airport: AirportDiscovery
+    in_flight: bool
+    last_observation: dict[str, Any] | None = None
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def unknown_airport(discovery_time: datetime.datetime) -> AirportDiscovery:
+    return AirportDiscovery(
+        airport=Airport(), discovery_time=discovery_time, unknown=True
+    )
+
+
+def airport_discovery(
+    match: AirportMatch | None, discovery_time: datetime.datetime
+) -> AirportDiscovery:
+    if match is None:
+        return unknown_airport(discovery_time)
+    return AirportDiscovery(airport=match.airport, discovery_time=discovery_time)
+
+
+class AircraftTracker:
+    """
+    Landing and takeoff state machine for a single aircraft. Feed it every
+    ADS-B observation of the aircraft along with the nearest airport, and it
+    returns the events that observation caused.
+    """
+
+    __slots__ = (
+        "icao_hex_id",
+        "last_landed_airport",
+        "in_flight",
+        "near_airport",
+        "last_observation",
+        "_log",
+    )
+
+    def __init__(
+        self,
+        icao_hex_id: str,
+        now: datetime.datetime | None = None,
+        log: structlog.stdlib.BoundLogger = logger,
+    ):
+        self.icao_hex_id = icao_hex_id
+        self.last_landed_airport = unknown_airport(now or _now())
+        self.in_flight = False
+        # Whether the last observation was within search radius of an airport
+        self.near_airport = False
+        self.last_observation: dict[str, Any] | None = None
+        self._log = log
+
+    def state(self) -> TrackerState:
+        return TrackerState(
+            icao_hex_id=self.icao_hex_id,
+            last_landed_airport=self.last_landed_airport,
+            in_flight=self.in_flight,
+            last_observation=self.last_observation,
+        )
+
+    def restore(self, state: TrackerState) -> None:
+        self.last_landed_airport = state.last_landed_airport
+        self.in_flight = state.in_flight
+        self.last_observation = state.last_observation
+
+    def is_repeat(self, adsb_data: dict[str, Any]) -> bool:
+        """
+        Whether adsb_data carries the same position report as the last
+        observation, judging by their position_time. Repeats change nothing,
+        so callers can skip geolocating and updating them.
+        """
+        if self.last_observation is None:
+            return False
+        time_ = position_time(adsb_data)
+        return time_ is not None and time_ == position_time(self.last_observation)
+
+    def update(
+        self, adsb_data: dict[str, Any], nearest_airport: AirportDiscovery
+    ) -> list[Event]:
+        log = self._log
+        now = nearest_airport.discovery_time
+        self.near_airport = not nearest_airport.unknown
+        self.last_observation = adsb_data
+
+        if (
+            not self.in_flight
+            and self.last_landed_airport.unknown
+            and not nearest_airport.unknown
+        ):
+            if adsb_data["alt_baro"] == "ground":
+                log.info("discovered first airport aircraft has landed at")
+                self.last_landed_airport = nearest_airport
+                return [
+                    Stationed(icao_hex_id=self.icao_hex_id, airport=nearest_airport)
+                ]
+
+            self.in_flight = True
+            self.last_landed_airport = unknown_airport(now)
+            log.info("aircraft is still in flight. Unknown last landed airport.")
+            return []
+        else:
+            log.info("last_landed_airport is unknown")
+
+        if adsb_data["alt_baro"] != "ground":
+            events: list[Event] = []
+            if not self.in_flight:
+                log.info("Aircraft has taken off!")
+                events.append(
+                    TookOff(
+                        icao_hex_id=self.icao_hex_id, source=self.last_landed_airport
+                    )
+                )
+            else:
+                log.info("aircraft still in flight")
+            self.in_flight = True
+            return events
+        else:
+            log.info("altimeter reporting ground")
+
+        log.debug(f"nearest airport: {nearest_airport.airport.ident}")
+        log.debug(f"last landed airport: {self.last_landed_airport.airport.ident}")
+
+        if (
+            nearest_airport.airport.ident != self.last_landed_airport.airport.ident
+            and self.in_flight
+        ):
+            self.in_flight = False
+            log.info("airplane landed at airport")
+            event = Landed(
+                icao_hex_id=self.icao_hex_id,
+                source=self.last_landed_airport,
+                destination=nearest_airport,
+            )
+            self.last_landed_airport = nearest_airport
+            return [event]
+
+        log.info("airplane hasn't moved")
+        return []
+
+
+class FleetTracker:
+    """
+    Tracks many aircraft at once, keeping one AircraftTracker per ICAO hex id.
+    Nearest airports for a batch of observations are resolved with a single
+    Geolocator.lookup_airports call.
+
+    If state_store is given, trackers start from the state it holds and every
+    update is saved back to it.
+
+    Aircraft that moved less than min_movement kilometers since their last
+    lookup keep their nearest airport, and ones taxiing within taxi_radius
+    kilometers of it are only searched for around it, see
+    IncrementalGeolocator.
+    """
+
+    def __init__(
+        self,
+        geolocator: Geolocator,
+        search_radius: float,
+        icao_hex_ids: Iterable[str] = (),
+        state_store: "StateStore | None" = None,
+        min_movement: float = MIN_MOVEMENT_KM,
+        taxi_radius: float = TAXI_RADIUS_KM,
+        log: structlog.stdlib.BoundLogger = logger,
+    ):
+        self._geolocator = IncrementalGeolocator(
+            geolocator, min_movement=min_movement, taxi_radius=taxi_radius
+        )
+        self._search_radius = search_radius
+        self._state_store = state_store
+        self._log = log
+        self._trackers: dict[str, AircraftTracker] = {}
+        for icao_hex_id in icao_hex_ids:
+            self.track(icao_hex_id)
+
+    def track(self, icao_hex_id: str) -> AircraftTracker:
+        tracker = self._trackers.get(icao_hex_id)
+        if tracker is None:
+            tracker = AircraftTracker(
+                icao_hex_id, log=self._log.bind(icao_hex_id=icao_hex_id)
+            )
+            if self._state_store is not None:
+                self._state_store.restore(tracker)
+            self._trackers[icao_hex_id] = tracker
+        return tracker
+
+    def __getitem__(self, icao_hex_id: str) -> AircraftTracker:
+        return self._trackers[icao_hex_id]
+
+    def __contains__(self, icao_hex_id: object) -> bool:
+        return icao_hex_id in self._trackers
+
+    def __len__(self) -> int:
+        return len(self._trackers)
+
+    def __iter__(self):
+        return iter(self._trackers)
+
+    def update(
+        self,
+        observations: dict[str, dict[str, Any]],
+        now: datetime.datetime | None = None,
+    ) -> list[Event]:
+        """
+        Applies a batch of ADS-B observations, keyed by hex id, and returns the
+        events they caused in order. Aircraft not tracked yet start being
+        tracked. Observations repeating an aircraft's last position report,
+        or without a position at all, are skipped.
+        """
+        now = now or _now()
+        hex_ids: list[str] = []
+        repeats: list[str] = []
+        unpositioned: list[str] = []
+        for hex_id, adsb_data in observations.items():
+            tracker = self._trackers.get(hex_id)
+            if adsb_data.get("lat") is None or adsb_data.get("lon") is None:
+                unpositioned.append(hex_id)
+            elif tracker is not None and tracker.is_repeat(adsb_data):
+                repeats.append(hex_id)
+            else:
+                hex_ids.append(hex_id)
+        if repeats:
+            self._log.debug("skipping unchanged positions", icao_hex_ids=repeats)
+        if unpositioned:
+            self._log.info(
+                "skipping aircraft without a position", icao_hex_ids=unpositioned
+            )
+        matches = self._geolocator.lookup_airports(
+            keys=hex_ids,
+            coords=[
+                (observations[hex_id]["lat"], observations[hex_id]["lon"])
+                for hex_id in hex_ids
+            ],
+            max_distance=self._search_radius,
+        )
+        events: list[Event] = []
+        for hex_id, match in zip(hex_ids, matches):
+            tracker = self.track(hex_id)
+            events.extend(
+                tracker.update(observations[hex_id], airport_discovery(match, now))
+            )
+            if self._state_store is not None:
+                self._state_store.save(tracker)
+        return events
@@ -0,0 +1,436 @@
+"""
+Flight tracks: every position polled for an aircraft, kept on disk so routes
+can be looked back on, for instance to say how far a flight went when it
+lands.
+
+Tracks are split into one chunk per aircraft per UTC day, under
+<directory>/<hex id>/<date>. The current day is appended to as fixed-width
+TRACK_DTYPE records (a .track file), so reads memory-map it and binary search
+the time column rather than loading it. Once a day is over its chunk is
+compacted into a .trackz file: each column delta encoded, zigzag encoded and
+written as varints, which takes a parked or cruising aircraft down to a few
+bytes a position.
+"""
+
+from dataclasses import dataclass
+import datetime
+import math
+import os
+import pathlib
+import struct
+import tempfile
+import threading
+from typing import Any, Iterator
+
+import numpy as np
+import structlog
+from structlog import get_logger
+
+from plane_spotter.adsb import position_time
+from plane_spotter.geolocator import EARTH_RADIUS_KM, AirportDiscovery
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+# Positions are stored as integers: time in milliseconds since the epoch,
+# coordinates in millionths of a degree (about 10 cm), altitude in feet,
+# ground speed in tenths of a knot and heading in hundredths of a degree.
+TRACK_DTYPE = np.dtype(
+    [
+        ("time", "<i8"),
+        ("lat", "<i4"),
+        ("lon", "<i4"),
+        ("alt_baro", "<i4"),
+        ("gs", "<i4"),
+        ("heading", "<i4"),
+    ]
+)
+# Stands in for a field the observation didn't have
+MISSING = np.iinfo(np.int32).min
+# alt_baro of an aircraft reporting "ground"
+GROUND = MISSING + 1
+
+_SCALES = {"lat": 1e6, "lon": 1e6, "alt_baro": 1, "gs": 10, "heading": 100}
+_RAW_SUFFIX = ".track"
+_COMPACT_SUFFIX = ".trackz"
+_MAGIC = b"PSTZ\x01"
+_HEADER = struct.Struct("<5sI")
+_COLUMN_HEADER = struct.Struct("<I")
+
+
+def _quantize(value: Any, scale: float) -> int:
+    if value is None:
+        return MISSING
+    try:
+        return int(round(float(value) * scale))
+    except (TypeError, ValueError):
+        return MISSING
+
+
+def observation_record(adsb_data: dict[str, Any], time: float) -> np.ndarray | None:
+    """
+    adsb_data as a TRACK_DTYPE record observed at time, in seconds since the
+    epoch. None if it has no position.
+    """
+    if adsb_data.get("lat") is None or adsb_data.get("lon") is None:
+        return None
+    record = np.zeros(1, dtype=TRACK_DTYPE)
+    record["time"] = round(time * 1000)
+    alt_baro = adsb_data.get("alt_baro")
+    heading = adsb_data.get("true_heading", adsb_data.get("track"))
+    for field, value in (
+        ("lat", adsb_data["lat"]),
+        ("lon", adsb_data["lon"]),
+        ("alt_baro", alt_baro),
+        ("gs", adsb_data.get("gs")),
+        ("heading", heading),
+    ):
+        record[field] = _quantize(value, _SCALES[field])
+    if alt_baro == "ground":
+        record["alt_baro"] = GROUND
+    return record
+
+
+def _varint_encode(values: np.ndarray) -> bytes:
+    """LEB128 encodes unsigned values, vectorized over the array."""
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    offsets = np.cumsum(lengths) - lengths
+    for byte in range(int(lengths.max(initial=0))):
+        (present,) = np.nonzero(lengths > byte)
+        part = (values[present] >> np.uint64(7 * byte)) & np.uint64(0x7F)
+        more = (lengths[present] > byte + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[present] + byte] = (part | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def _varint_decode(data: bytes, count: int) -> np.ndarray:
+    if count == 0:
+        return np.zeros(0, dtype=np.uint64)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    (ends,) = np.nonzero(raw < 0x80)
+    if len(ends) != count:
+        raise ValueError(f"expected {count} varints, found {len(ends)}")
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    values = np.zeros(count, dtype=np.uint64)
+    for byte in range(int(lengths.max(initial=0))):
+        (present,) = np.nonzero(lengths > byte)
+        part = raw[starts[present] + byte].astype(np.uint64) & np.uint64(0x7F)
+        values[present] |= part << np.uint64(7 * byte)
+    return values
+
+
+def _encode_column(column: np.ndarray) -> bytes:
+    """Deltas between consecutive values, zigzag and varint encoded."""
+    deltas: np.ndarray = np.diff(column.astype(np.int64), prepend=np.int64(0))
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    return _varint_encode(zigzag.view(np.uint64))
+
+
+def _decode_column(data: bytes, count: int, dtype: np.dtype) -> np.ndarray:
+    zigzag = _varint_decode(data, count)
+    magnitude = (zigzag >> np.uint64(1)).view(np.int64)
+    sign = -(zigzag & np.uint64(1)).view(np.int64)
+    return np.cumsum(magnitude ^ sign).astype(dtype)
+
+
+def encode_chunk(records: np.ndarray) -> bytes:
+    """Compacts TRACK_DTYPE records into the .trackz format."""
+    parts = [_HEADER.pack(_MAGIC, len(records))]
+    for name in TRACK_DTYPE.names or ():
+        column = _encode_column(records[name])
+        parts += [_COLUMN_HEADER.pack(len(column)), column]
+    return b"".join(parts)
+
+
+def decode_chunk(data: bytes) -> np.ndarray:
+    magic, count = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("not a compacted track chunk")
+    records = np.zeros(count, dtype=TRACK_DTYPE)
+    offset = _HEADER.size
+    for name in TRACK_DTYPE.names or ():
+        (size,) = _COLUMN_HEADER.unpack_from(data, offset)
+        offset += _COLUMN_HEADER.size
+        records[name] = _decode_column(
+            data[offset : offset + size], count, TRACK_DTYPE[name]
+        )
+        offset += size
+    return records
+
+
+@dataclass(frozen=True)
+class RouteStats:
+    points: int
+    distance_km: float
+    duration: datetime.timedelta
+    max_altitude_ft: float | None
+    max_ground_speed_kt: float | None
+
+
+class Track:
+    """Positions of one aircraft in time order, as TRACK_DTYPE records."""
+
+    def __init__(self, records: np.ndarray):
+        self.records = records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _column(self, name: str) -> np.ndarray:
+        column = self.records[name]
+        values = column / _SCALES[name]
+        return np.where(column <= GROUND, np.nan, values)
+
+    @property
+    def times(self) -> np.ndarray:
+        """Seconds since the epoch."""
+        return self.records["time"] / 1000
+
+    @property
+    def latitudes(self) -> np.ndarray:
+        return self.records["lat"] / _SCALES["lat"]
+
+    @property
+    def longitudes(self) -> np.ndarray:
+        return self.records["lon"] / _SCALES["lon"]
+
+    @property
+    def altitudes(self) -> np.ndarray:
+        """Barometric altitude in feet, NaN on the ground or if unknown."""
+        return self._column("alt_baro")
+
+    @property
+    def on_ground(self) -> np.ndarray:
+        return self.records["alt_baro"] == GROUND
+
+    @property
+    def ground_speeds(self) -> np.ndarray:
+        """Knots, NaN if unknown."""
+        return self._column("gs")
+
+    @property
+    def headings(self) -> np.ndarray:
+        """Degrees, NaN if unknown."""
+        return self._column("heading")
+
+    def distance(self) -> float:
+        """Kilometers flown between the positions, along great circles."""
+        if len(self) < 2:
+            return 0.0
+        lat = np.radians(self.latitudes)
+        lon = np.radians(self.longitudes)
+        d = (
+            np.sin(np.diff(lat) * 0.5) ** 2
+            + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) * 0.5) ** 2
+        )
+        return float(
+            (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(d, 1.0)))).sum()
+        )
+
+    def stats(self) -> RouteStats | None:
+        """Summary of the track, or None if it has fewer than two positions."""
+        if len(self) < 2:
+            return None
+
+        def maximum(values: np.ndarray) -> float | None:
+            values = values[~np.isnan(values)]
+            return float(values.max()) if len(values) else None
+
+        times = self.records["time"]
+        return RouteStats(
+            points=len(self),
+            distance_km=self.distance(),
+            duration=datetime.timedelta(milliseconds=int(times[-1] - times[0])),
+            max_altitude_ft=maximum(self.altitudes),
+            max_ground_speed_kt=maximum(self.ground_speeds),
+        )
+
+
+def _day(time_ms: int) -> datetime.date:
+    return datetime.datetime.fromtimestamp(time_ms / 1000, datetime.timezone.utc).date()
+
+
+def _days(start: datetime.date, end: datetime.date) -> Iterator[datetime.date]:
+    day = start
+    while day <= end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def _timestamp(when: datetime.datetime | float) -> float:
+    if isinstance(when, datetime.datetime):
+        return when.timestamp()
+    return when
+
+
+class TrackStore:
+    """
+    Appends observations to per aircraft, per day chunks under directory and
+    reads them back by time range.
+
+    Positions are timed by their position_time, falling back to the time
+    they were appended at. A position no newer than the last one kept for the
+    aircraft is dropped, so polls answered from a cache aren't stored twice.
+    When an aircraft's positions move on to a new day, its previous day is
+    compacted.
+    """
+
+    def __init__(self, directory: str | os.PathLike, log=logger):
+        self._directory = pathlib.Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # hex id -> (day, time in ms) of the last position kept
+        self._last: dict[str, tuple[datetime.date, int]] = {}
+        self._log = log
+        log.info("storing flight tracks", track_dir=str(self._directory))
+
+    def _path(self, icao_hex_id: str, day: datetime.date, suffix: str) -> pathlib.Path:
+        return self._directory / icao_hex_id.lower() / (day.isoformat() + suffix)
+
+    def append(self, icao_hex_id: str, adsb_data: dict[str, Any], time: float) -> bool:
+        """
+        Stores the position in adsb_data, polled at time (seconds since the
+        epoch). Returns whether it was kept.
+        """
+        icao_hex_id = icao_hex_id.lower()
+        time_ = position_time(adsb_data)
+        record = observation_record(adsb_data, time if time_ is None else time_)
+        if record is None:
+            return False
+        time_ms = int(record["time"][0])
+        day = _day(time_ms)
+        with self._lock:
+            last = self._last.get(icao_hex_id)
+            if last is None:
+                last = self._last_kept(icao_hex_id, day)
+            if last is not None and time_ms <= last[1]:
+                return False
+            path = self._path(icao_hex_id, day, _RAW_SUFFIX)
+            path.parent.mkdir(exist_ok=True)
+            with open(path, "ab") as file:
+                file.write(record.tobytes())
+            self._last[icao_hex_id] = (day, time_ms)
+            if last is not None and last[0] < day:
+                self._compact(icao_hex_id, last[0])
+        return True
+
+    def extend(self, observations: dict[str, dict[str, Any]], time: float) -> int:
+        """append() for a batch of observations keyed by hex id. Returns how
+        many were kept."""
+        return sum(
+            self.append(hex_id, adsb_data, time)
+            for hex_id, adsb_data in observations.items()
+        )
+
+    def _last_kept(
+        self, icao_hex_id: str, day: datetime.date
+    ) -> tuple[datetime.date, int] | None:
+        """The last position kept on day, from disk."""
+        records = self._read(icao_hex_id, day)
+        if len(records) == 0:
+            return None
+        return day, int(records["time"][-1])
+
+    def _read(self, icao_hex_id: str, day: datetime.date) -> np.ndarray:
+        """The records of day, memory-mapped unless the day was compacted."""
+        raw = self._read_raw(self._path(icao_hex_id, day, _RAW_SUFFIX))
+        compact = self._path(icao_hex_id, day, _COMPACT_SUFFIX)
+        if not compact.exists():
+            return raw
+        records = decode_chunk(compact.read_bytes())
+        if len(raw):
+            # Positions appended after the day was compacted
+            records = np.sort(np.concatenate((records, raw)), order="time")
+        return records
+
+    @staticmethod
+    def _read_raw(path: pathlib.Path) -> np.ndarray:
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return np.zeros(0, dtype=TRACK_DTYPE)
+        # A record cut short by a crash is ignored
+        count = size // TRACK_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=TRACK_DTYPE)
+        return np.memmap(path, dtype=TRACK_DTYPE, mode="r", shape=(count,))
+
+    def track(
+        self,
+        icao_hex_id: str,
+        start: datetime.datetime | float,
+        end: datetime.datetime | float,
+    ) -> Track:
+        """Positions of the aircraft from start to end, inclusive. Times are
+        datetimes or seconds since the epoch."""
+        icao_hex_id = icao_hex_id.lower()
+        start_ms = math.floor(_timestamp(start) * 1000)
+        end_ms = math.ceil(_timestamp(end) * 1000)
+        chunks = []
+        with self._lock:
+            for day in _days(_day(start_ms), _day(end_ms)):
+                records = self._read(icao_hex_id, day)
+                first = np.searchsorted(records["time"], start_ms, side="left")
+                last = np.searchsorted(records["time"], end_ms, side="right")
+                chunks.append(np.array(records[first:last]))
+        if not chunks:
+            return Track(np.zeros(0, dtype=TRACK_DTYPE))
+        return Track(np.concatenate(chunks))
+
+    def flight(
+        self,
+        icao_hex_id: str,
+        source: AirportDiscovery,
+        destination: AirportDiscovery,
+    ) -> Track:
+        """The track flown from source to destination, by when each was
+        discovered."""
+        return self.track(
+            icao_hex_id, source.discovery_time, destination.discovery_time
+        )
+
+    def compact(self, before: datetime.date | None = None) -> int:
+        """
+        Compacts every chunk of a day before `before`, today (UTC) by
+        default. Returns how many were compacted.
+        """
+        if before is None:
+            before = datetime.datetime.now(datetime.timezone.utc).date()
+        compacted = 0
+        with self._lock:
+            for raw in sorted(self._directory.glob(f"*/*{_RAW_SUFFIX}")):
+                day = datetime.date.fromisoformat(raw.stem)
+                if day < before:
+                    self._compact(raw.parent.name, day)
+                    compacted += 1
+        return compacted
+
+    def _compact(self, icao_hex_id: str, day: datetime.date) -> None:
+        raw = self._path(icao_hex_id, day, _RAW_SUFFIX)
+        if not raw.exists():
+            return
+        compact = self._path(icao_hex_id, day, _COMPACT_SUFFIX)
+        records = self._read(icao_hex_id, day)
+        data = encode_chunk(np.asarray(records))
+        fd, tmp = tempfile.mkstemp(dir=compact.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp, compact)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        raw.unlink()
+        self._log.debug(
+            "compacted flight track",
+            icao_hex_id=icao_hex_id,
+            day=day.isoformat(),
+            points=len(records),
+            size=len(data),
+        )
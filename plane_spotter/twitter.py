@@ -1,22 +1,70 @@
+import contextlib
+import json
+import os
 import pathlib
+import tempfile
 import time
+from typing import Any, Iterator
+import weakref
 
 import selenium
 from selenium.webdriver.common.by import By
-from selenium import webdriver
 from selenium.webdriver import ActionChains
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions
 
 import structlog
 from structlog import get_logger
 
+from plane_spotter.browser_pool import BrowserPool
 from plane_spotter.notification import NotificationBackend
 
 logger: structlog.stdlib.BoundLogger = get_logger(__name__)
 
+TWITTER_URL = "https://twitter.com/"
+HOME_URL = "https://twitter.com/home"
+# Twitter's session cookie. Without it the browser is logged out.
+AUTH_COOKIE = "auth_token"
+# How often waits check their condition, in seconds
+POLL_FREQUENCY = 0.1
+
+Locator = tuple[str, str]
+# Only present once the home timeline has loaded for a logged in user
+HOME_LINK: Locator = (By.CSS_SELECTOR, "a[data-testid='AppTabBar_Home_Link']")
+EMAIL_INPUT: Locator = (
+    By.XPATH,
+    "/html/body/div/div/div/div[1]/div/div/div/div/div/div/div[2]/div[2]/div/div/div[2]/div[2]/div/div/div/div[5]/label/div/div[2]/div/input",
+)
+UNUSUAL_ACTIVITY_INPUT: Locator = (
+    By.XPATH,
+    "/html/body/div/div/div/div[1]/div/div/div/div/div/div/div[2]/div[2]/div/div/div[2]/div[2]/div[1]/div/div[2]/label/div/div[2]/div/input",
+)
+PASSWORD_INPUTS: tuple[Locator, ...] = (
+    (
+        By.XPATH,
+        "/html/body/div/div/div/div[1]/div/div/div/div/div/div/div[2]/div[2]/div/div/div[2]/div[2]/div[1]/div/div/div[3]/div/label/div/div[2]/div[1]/input",
+    ),
+    (
+        By.XPATH,
+        "/html/body/div[1]/div/div/div[1]/div/div/div/div/div/div/div[2]/div[2]/div/div/div[2]/div[2]/div[1]/div/div/div[3]/div/label/div/div[2]/div[1]/input",
+    ),
+)
+COMPOSER: Locator = (By.CLASS_NAME, "DraftEditor-root")
+# Shown while the composer is empty, so also once a tweet has been posted
+COMPOSER_PLACEHOLDER: Locator = (By.CLASS_NAME, "public-DraftEditorPlaceholder-root")
+TWEET_BUTTON: Locator = (By.CSS_SELECTOR, "div[data-testid='tweetButtonInline']")
+TWEET_SENT_TOAST: Locator = (By.CSS_SELECTOR, "div[data-testid='toast']")
+
+
+def session_cookies_valid(cookies: list[dict[str, Any]], now: float) -> bool:
+    """Whether cookies hold an auth token that hasn't expired yet."""
+    for cookie in cookies:
+        if cookie.get("name") == AUTH_COOKIE:
+            expiry = cookie.get("expiry")
+            return expiry is None or expiry > now
+    return False
+
 
 class TwitterSelenium(NotificationBackend):
     def __init__(
@@ -27,8 +75,25 @@ class TwitterSelenium(NotificationBackend):
         username: str | None = None,
         sleep_interval: int = 5,
         dry_run: bool = True,
+        browser_pool: BrowserPool | None = None,
+        session_file: pathlib.Path | str | None = None,
+        session_check_timeout: float = 10,
         log=logger,
     ):
+        """
+        Tweets are sent from browsers borrowed from browser_pool, which may be
+        shared with other users such as adsb_exchange_screenshot. Each browser
+        is logged in the first time it is borrowed. Without a pool, one with a
+        single browser is created on __enter__.
+
+        If session_file is given, the cookies and local storage of a logged in
+        browser are saved to it, and new browsers restore them instead of going
+        through the login flow. The full login only runs when the stored
+        session has expired or Twitter rejects it.
+
+        sleep_interval is the longest any step of the login or tweet flow waits
+        for the page. Steps finish as soon as their condition is met.
+        """
         self._email = email
         self._password = password
         self._log = log.bind(class_name="TwitterSelenium")
@@ -36,103 +101,238 @@ class TwitterSelenium(NotificationBackend):
         self._username = username
         self._sleep_interval = sleep_interval
         self._dry_run = dry_run
+        self._session_file = (
+            pathlib.Path(session_file) if session_file is not None else None
+        )
+        self._session_check_timeout = session_check_timeout
+        self._browser_pool = browser_pool
+        self._owns_browser_pool = False
+        # Seconds the last run of each step of the login or tweet flow took
+        self.step_durations: dict[str, float] = {}
+        # Browsers from the pool that are already logged in
+        self._logged_in: weakref.WeakSet = weakref.WeakSet()
+        # The browser currently borrowed from the pool
+        self.webdriver: Any = None
 
     def __enter__(self):
         if self._dry_run:
             self._log.info("dry run of __enter__ method")
             return
 
-        self._log.info("starting chromedriver")
-        options = Options()
-        options.add_argument("--headless")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--start-maximized")
-        options.add_argument("--incognito")
-        options.add_argument("--disable-dev-shm-usage")
-        self.webdriver = webdriver.Chrome(options=options)
-        self._log.info("chrome driver started")
+        if self._browser_pool is None:
+            self._browser_pool = BrowserPool(log=self._log)
+            self._owns_browser_pool = True
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self._dry_run:
             self._log.info("dry run of __exit__ method")
             return
-        self.webdriver.quit()
+        if self._owns_browser_pool and self._browser_pool is not None:
+            self._browser_pool.close()
+            self._browser_pool = None
+            self._owns_browser_pool = False
         self.webdriver = None
 
-    def _sleep(self, log=logger):
-        log.info("sleeping...")
-        time.sleep(self._sleep_interval)
+    @contextlib.contextmanager
+    def _browser(self, log=logger) -> Iterator:
+        """Borrows a logged in browser and makes it self.webdriver."""
+        if self._browser_pool is None:
+            raise RuntimeError("TwitterSelenium must be entered before use")
+        with self._browser_pool.browser() as driver:
+            self.webdriver = driver
+            if driver not in self._logged_in:
+                if not self._restore_session(log=log):
+                    self._login(log=log)
+                    self._save_session(log=log)
+                self._logged_in.add(driver)
+            yield driver
+
+    def _logged_in_page(self) -> bool:
+        """Waits for the current page to turn out to be either the logged in
+        home timeline or the login page."""
+        try:
+            self._wait(self._session_check_timeout).until(
+                expected_conditions.any_of(
+                    expected_conditions.url_contains("/login"),
+                    expected_conditions.presence_of_element_located(HOME_LINK),
+                )
+            )
+        except selenium.common.exceptions.TimeoutException:
+            return False
+        return "/login" not in self.webdriver.current_url
 
-    def _wait(self) -> WebDriverWait:
-        return WebDriverWait(self.webdriver, self._sleep_interval)
+    def _restore_session(self, log=logger) -> bool:
+        """Logs the browser in from session_file. Returns whether it worked."""
+        if self._session_file is None or not self._session_file.exists():
+            return False
+        try:
+            session = json.loads(self._session_file.read_text())
+            cookies = session["cookies"]
+        except (OSError, ValueError, KeyError):
+            log.warning("failed to read twitter session", exc_info=True)
+            return False
+        if not session_cookies_valid(cookies, time.time()):
+            log.info("stored twitter session has expired")
+            return False
+
+        start = time.monotonic()
+        # Cookies can only be set for the domain the browser is on
+        self.webdriver.get(TWITTER_URL)
+        for cookie in cookies:
+            self.webdriver.add_cookie(cookie)
+        self.webdriver.execute_script(
+            "for (const [key, value] of Object.entries(arguments[0]))"
+            " window.localStorage.setItem(key, value);",
+            session.get("local_storage", {}),
+        )
+        self.webdriver.get(HOME_URL)
+        if not self._logged_in_page():
+            log.info("stored twitter session was rejected")
+            return False
+        log.info("restored twitter session", duration=time.monotonic() - start)
+        return True
+
+    def _save_session(self, log=logger) -> None:
+        if self._session_file is None:
+            return
+        session = {
+            "cookies": self.webdriver.get_cookies(),
+            "local_storage": self.webdriver.execute_script(
+                "return Object.assign({}, window.localStorage);"
+            ),
+        }
+        # The session is as good as a password, so keep it private to the user
+        fd, tmp_name = tempfile.mkstemp(
+            dir=self._session_file.parent, prefix=self._session_file.name
+        )
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(session, file)
+            os.replace(tmp_name, self._session_file)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        log.info("saved twitter session", session_file=str(self._session_file))
+
+    @contextlib.contextmanager
+    def _step(self, step: str, log=logger) -> Iterator[None]:
+        """Logs how long a step of the login or tweet flow took."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            self.step_durations[step] = duration
+            log.info("step finished", step=step, duration=duration)
+
+    def _wait(self, timeout: float | None = None) -> WebDriverWait:
+        return WebDriverWait(
+            self.webdriver,
+            self._sleep_interval if timeout is None else timeout,
+            poll_frequency=POLL_FREQUENCY,
+        )
 
     def _wait_until_clickable(self, by: By, value: str):
         return self._wait().until(
             expected_conditions.element_to_be_clickable((by, value))
         )
 
-    def unusual_activity_challenge(self, log=logger):
+    def _wait_for_first_clickable(self, *locators: Locator) -> tuple[int, Any]:
         """
-        Twitter sometimes says:
+        Waits for whichever of locators becomes clickable first. Returns its
+        index in locators and the element.
+        """
+        conditions = [
+            expected_conditions.element_to_be_clickable(locator) for locator in locators
+        ]
 
-            There was unusual login activity on your account.
-            To help keep your account safe, please enter your phone number
-            or username to verify it's you.
+        def first_clickable(driver):
+            for index, condition in enumerate(conditions):
+                try:
+                    element = condition(driver)
+                except selenium.common.exceptions.WebDriverException:
+                    continue
+                if element:
+                    return index, element
+            return False
 
-        """
-        log.info("checking for unusual activity challenge prompt")
-        try:
-            phone_or_username_field = self._wait_until_clickable(
-                By.XPATH,
-                "/html/body/div/div/div/div[1]/div/div/div/div/div/div/div[2]/div[2]/div/div/div[2]/div[2]/div[1]/div/div[2]/label/div/div[2]/div/input",
-            )
-            log.info("unusual activity challenge exists")
-            phone_or_username_field.send_keys(
-                self._username if self._username is not None else self._phone_number
-            )
-            phone_or_username_field.send_keys(Keys.RETURN)
-        except selenium.common.exceptions.TimeoutException:
-            log.info("unusual activity challenge not present")
-            return
+        return self._wait().until(first_clickable)
 
     def login(self, log: structlog.stdlib.BoundLogger = logger):
+        """Warms up a logged in browser, so the first tweet doesn't wait on it."""
         if self._dry_run:
             log.info("dry run of login method")
             return
-        log.info("going to login page")
-
-        self.webdriver.get("https://twitter.com/login")
-
-        email = self._wait_until_clickable(
-            by=By.XPATH,
-            value="/html/body/div/div/div/div[1]/div/div/div/div/div/div/div[2]/div[2]/div/div/div[2]/div[2]/div/div/div/div[5]/label/div/div[2]/div/input",
-        )
-        log.info("sending email to twitter")
-        email.send_keys(self._email)
-        email.send_keys(Keys.RETURN)
+        with self._browser(log=log):
+            pass
 
-        self.unusual_activity_challenge(log=log)
+    def _login(self, log: structlog.stdlib.BoundLogger = logger):
+        log.info("going to login page")
+        with self._step("open login page", log=log):
+            self.webdriver.get("https://twitter.com/login")
+            email = self._wait_until_clickable(*EMAIL_INPUT)
+
+        with self._step("submit email", log=log):
+            log.info("sending email to twitter")
+            email.send_keys(self._email)
+            email.send_keys(Keys.RETURN)
+            # Twitter sometimes asks to confirm the username or phone number
+            # before the password. Rather than waiting out a timeout to learn
+            # the prompt is absent, wait for whichever input shows up first.
+            try:
+                index, element = self._wait_for_first_clickable(
+                    UNUSUAL_ACTIVITY_INPUT, *PASSWORD_INPUTS
+                )
+            except selenium.common.exceptions.TimeoutException:
+                raise RuntimeError("Failed to get password element, check xpaths")
+
+        if index == 0:
+            with self._step("unusual activity challenge", log=log):
+                log.info("unusual activity challenge exists")
+                self.unusual_activity_challenge(element)
+                try:
+                    _, element = self._wait_for_first_clickable(*PASSWORD_INPUTS)
+                except selenium.common.exceptions.TimeoutException:
+                    raise RuntimeError("Failed to get password element, check xpaths")
+        else:
+            log.info("unusual activity challenge not present")
 
-        password_xpaths = [
-            "/html/body/div/div/div/div[1]/div/div/div/div/div/div/div[2]/div[2]/div/div/div[2]/div[2]/div[1]/div/div/div[3]/div/label/div/div[2]/div[1]/input",
-            "/html/body/div[1]/div/div/div[1]/div/div/div/div/div/div/div[2]/div[2]/div/div/div[2]/div[2]/div[1]/div/div/div[3]/div/label/div/div[2]/div[1]/input",
-        ]
+        with self._step("submit password", log=log):
+            log.info("submitting password")
+            element.send_keys(self._password)
+            element.send_keys(Keys.RETURN)
+            try:
+                self._wait().until(
+                    expected_conditions.presence_of_element_located(HOME_LINK)
+                )
+            except selenium.common.exceptions.TimeoutException:
+                raise RuntimeError("login did not reach the home timeline")
 
-        log.info("getting password input")
+        log.info("login successful")
 
-        password = self._get_password(password_xpaths)
-        if password is None:
-            raise RuntimeError("Failed to get password element, check xpaths")
+    def unusual_activity_challenge(self, phone_or_username_field):
+        """
+        Twitter sometimes says:
 
-        log.info("submitting password")
-        password.send_keys(self._password)
-        password.send_keys(Keys.RETURN)
+            There was unusual login activity on your account.
+            To help keep your account safe, please enter your phone number
+            or username to verify it's you.
 
-        log.info("login successful")
+        """
+        phone_or_username_field.send_keys(
+            self._username if self._username is not None else self._phone_number
+        )
+        phone_or_username_field.send_keys(Keys.RETURN)
 
     def send(self, message: str, log=logger):
         """
-        Submits a tweet. Chrome driver must be instantiated and login flow must be complete.
+        Submits a tweet. TwitterSelenium must be entered; the browser used is
+        logged in first if it isn't already.
+
+        Returns once Twitter confirms the tweet was posted, either with its
+        "sent" toast or by clearing the composer. Once the Tweet button is
+        clicked the tweet may well be out, so a missing confirmation is only
+        logged; raising would have it retried and posted twice.
         """
         if self._dry_run:
             log.info("dry run of send method")
@@ -140,39 +340,37 @@ class TwitterSelenium(NotificationBackend):
             log.info(message)
             return
 
-        log.info("Writing text")
-        text_field_box = self._wait_until_clickable(By.CLASS_NAME, "DraftEditor-root")
-        text_field_box.click()
-
-        text_field = self._wait_until_clickable(
-            By.CLASS_NAME, "public-DraftEditorPlaceholder-root"
-        )
-        ActionChains(self.webdriver).move_to_element(text_field).send_keys(
-            message
-        ).perform()
-
-        log.info("clicking Tweet button")
-        tweet_button = self._wait().until(
-            expected_conditions.element_to_be_clickable(
-                (
-                    By.CSS_SELECTOR,
-                    "div[data-testid='tweetButtonInline']",
-                )
-            )
-        )
-        tweet_button.click()
-
-        log.info("tweet successful")
-        self._sleep()
-
-    def _get_password(self, xpaths: list):
-        for path in xpaths:
-            try:
-                return self._get_password_element(path)
-            except selenium.common.exceptions.TimeoutException:
-                continue
-
-        return None
-
-    def _get_password_element(self, xpath: str):
-        return self._wait_until_clickable(By.XPATH, xpath)
+        with self._browser(log=log) as driver:
+            with self._step("open composer", log=log):
+                # The browser may have been used for something else in between
+                if "twitter.com" not in driver.current_url:
+                    driver.get(HOME_URL)
+                text_field_box = self._wait_until_clickable(*COMPOSER)
+
+            with self._step("write text", log=log):
+                log.info("Writing text")
+                text_field_box.click()
+                text_field = self._wait_until_clickable(*COMPOSER_PLACEHOLDER)
+                ActionChains(self.webdriver).move_to_element(text_field).send_keys(
+                    message
+                ).perform()
+
+            with self._step("post tweet", log=log):
+                log.info("clicking Tweet button")
+                self._wait_until_clickable(*TWEET_BUTTON).click()
+                try:
+                    self._wait().until(
+                        expected_conditions.any_of(
+                            expected_conditions.visibility_of_element_located(
+                                TWEET_SENT_TOAST
+                            ),
+                            expected_conditions.presence_of_element_located(
+                                COMPOSER_PLACEHOLDER
+                            ),
+                        )
+                    )
+                except selenium.common.exceptions.TimeoutException:
+                    log.warning("Twitter did not confirm the tweet was sent")
+                    return
+
+            log.info("tweet successful")
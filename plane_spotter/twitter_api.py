@@ -0,0 +1,216 @@
+import collections
+from dataclasses import dataclass
+import importlib.util
+import threading
+import time
+
+import httpx
+from oauthlib import oauth1
+import structlog
+from structlog import get_logger
+
+from plane_spotter.notification import NotificationBackend
+
+logger: structlog.stdlib.BoundLogger = get_logger(__name__)
+
+DEFAULT_API_URL = "https://api.twitter.com"
+TWEETS_PATH = "/2/tweets"
+# Seconds to hold off after a 429 that doesn't say when the window resets
+DEFAULT_RATE_LIMIT_BACKOFF = 60.0
+RESET_MARGIN = 1.0
+# Seconds close() waits for queued tweets by default
+DEFAULT_CLOSE_TIMEOUT = 30.0
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """The rate limit window Twitter reported with the last response."""
+
+    limit: int
+    remaining: int
+    # Unix time the window resets at
+    reset: float
+
+    @classmethod
+    def from_headers(cls, headers: httpx.Headers) -> "RateLimit | None":
+        try:
+            return cls(
+                limit=int(headers["x-rate-limit-limit"]),
+                remaining=int(headers["x-rate-limit-remaining"]),
+                reset=float(headers["x-rate-limit-reset"]),
+            )
+        except (KeyError, ValueError):
+            return None
+
+    def exhausted(self, now: float) -> bool:
+        return self.remaining <= 0 and now < self.reset
+
+
+class TwitterAPI(NotificationBackend):
+    """
+    Posts tweets through the Twitter v2 API, authenticating as a user with
+    OAuth 1.0a. Requests share one pooled httpx client, over HTTP/2 when the
+    h2 package is installed.
+
+    The rate limit reported in each response's headers is tracked. While it
+    is exhausted, tweets are queued, up to max_queued, and posted in order
+    once the window resets. close() waits up to close_timeout seconds for
+    queued tweets to go out, and logs how many it had to drop.
+    """
+
+    def __init__(
+        self,
+        consumer_key: str,
+        consumer_secret: str,
+        access_token: str,
+        access_token_secret: str,
+        api_url: str = DEFAULT_API_URL,
+        timeout: float = 10.0,
+        max_queued: int = 100,
+        close_timeout: float = DEFAULT_CLOSE_TIMEOUT,
+        dry_run: bool = True,
+        log=logger,
+    ):
+        self._oauth = oauth1.Client(
+            consumer_key,
+            client_secret=consumer_secret,
+            resource_owner_key=access_token,
+            resource_owner_secret=access_token_secret,
+        )
+        self._url = api_url.rstrip("/") + TWEETS_PATH
+        self._dry_run = dry_run
+        self._log = log.bind(class_name="TwitterAPI")
+        self._max_queued = max_queued
+        self._close_timeout = close_timeout
+        self._client = httpx.Client(
+            http2=importlib.util.find_spec("h2") is not None,
+            timeout=timeout,
+        )
+        self.rate_limit: RateLimit | None = None
+        self._queue: collections.deque[tuple[str, structlog.stdlib.BoundLogger]] = (
+            collections.deque()
+        )
+        self._lock = threading.Lock()
+        # Whether the drainer is posting a tweet it took off the queue
+        self._posting_queued = False
+        self._drainer: threading.Thread | None = None
+        self._closed = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue) + self._posting_queued
+
+    def _rate_limited(self) -> bool:
+        return self.rate_limit is not None and self.rate_limit.exhausted(time.time())
+
+    def _post(self, message: str, log) -> bool:
+        """Posts a tweet. Returns False if it was refused for the rate limit."""
+        url, headers, body = self._oauth.sign(
+            self._url, http_method="POST", headers={"Content-Type": "application/json"}
+        )
+        start = time.monotonic()
+        response = self._client.post(url, headers=headers, json={"text": message})
+        self.rate_limit = RateLimit.from_headers(response.headers) or self.rate_limit
+        if response.status_code == 429:
+            if not self._rate_limited():
+                self.rate_limit = RateLimit(
+                    limit=0,
+                    remaining=0,
+                    reset=time.time() + DEFAULT_RATE_LIMIT_BACKOFF,
+                )
+            log.warning("twitter rate limit reached", rate_limit=self.rate_limit)
+            return False
+        response.raise_for_status()
+        log.info(
+            "tweet successful",
+            tweet_id=response.json()["data"]["id"],
+            duration=time.monotonic() - start,
+            rate_limit_remaining=(
+                self.rate_limit.remaining if self.rate_limit is not None else None
+            ),
+        )
+        return True
+
+    def send(self, message: str, log=logger):
+        if self._dry_run:
+            log.info("dry run of send method")
+            log.info("would have sent message:")
+            log.info(message)
+            return
+
+        with self._lock:
+            # Queued tweets go first, so tweets stay in order
+            if self.queued or self._rate_limited():
+                self._enqueue(message, log)
+                return
+        if not self._post(message, log):
+            with self._lock:
+                self._enqueue(message, log)
+
+    def _enqueue(self, message: str, log) -> None:
+        if len(self._queue) >= self._max_queued:
+            log.error("tweet queue is full, dropping tweet", message=message)
+            return
+        self._queue.append((message, log))
+        log.info("rate limited, tweet queued", queued=len(self._queue))
+        if self._drainer is None:
+            self._drainer = threading.Thread(
+                target=self._drain, name="twitter-api-drainer", daemon=True
+            )
+            self._drainer.start()
+
+    def _drain(self) -> None:
+        """Posts queued tweets as the rate limit allows. Tweets are posted
+        without holding the lock, so send() never waits on the network."""
+        while True:
+            with self._lock:
+                if not self._queue:
+                    # The next tweet queued starts a new drainer
+                    self._drainer = None
+                    return
+                if self._rate_limited():
+                    assert self.rate_limit is not None
+                    # Resets are whole seconds, so allow for clock differences
+                    delay = max(0.0, self.rate_limit.reset - time.time()) + RESET_MARGIN
+                else:
+                    message, log = self._queue.popleft()
+                    self._posting_queued = True
+                    delay = None
+            if delay is not None:
+                if self._closed.wait(delay):
+                    return
+                continue
+
+            try:
+                posted = self._post(message, log)
+            except Exception:
+                log.exception("failed to post queued tweet, dropping it")
+                posted = True
+            with self._lock:
+                self._posting_queued = False
+                if not posted:
+                    self._queue.appendleft((message, log))
+
+    def close(self) -> None:
+        drainer = self._drainer
+        if drainer is not None:
+            self._log.info(
+                "waiting for queued tweets",
+                queued=self.queued,
+                timeout=self._close_timeout,
+            )
+            drainer.join(self._close_timeout)
+        self._closed.set()
+        if self.queued:
+            self._log.error(
+                "close timeout expired, dropping queued tweets",
+                dropped=self.queued,
+                timeout=self._close_timeout,
+            )
+        self._client.close()
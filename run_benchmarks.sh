@@ -0,0 +1,24 @@
+#!/bin/bash
+# Runs the benchmarks in benchmarks/ and compares them with the newest
+# baseline recorded for this machine under benchmarks/baseline. The run fails
+# if any benchmark's mean time regressed by more than BENCHMARK_MAX_REGRESSION
+# (default 25%). Results are written to BENCHMARK_JSON (default
+# benchmark_results.json) for CI to pick up.
+#
+# Record a new baseline with:
+#   bash ./run_benchmarks.sh --save
+
+set -e
+
+args=(
+    --benchmark-storage="file://./benchmarks/baseline"
+    --benchmark-json="${BENCHMARK_JSON:-benchmark_results.json}"
+    --benchmark-sort=name
+)
+if [ "$1" == "--save" ]; then
+    pytest ./benchmarks/ "${args[@]}" --benchmark-save=baseline
+else
+    pytest ./benchmarks/ "${args[@]}" \
+        --benchmark-compare \
+        --benchmark-compare-fail="mean:${BENCHMARK_MAX_REGRESSION:-25%}"
+fi
@@ -1,8 +1,14 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
 from pathlib import Path
 import pytest
+import threading
+import time
 import structlog
 from textwrap import dedent
 from unittest.mock import Mock
+from pytest_httpserver import HTTPServer
+from werkzeug import Request, Response
 
 from plane_spotter.adsb import ADSBExchange
 from plane_spotter.notification import NotificationBackend
@@ -48,3 +54,129 @@ def write_airport_csv(
     text: str = DEFAULT_AIRPORT_CSV,
 ) -> None:
     path.write_text(text)
+
+
+class KeepAliveHTTPServer(ThreadingHTTPServer):
+    """
+    Minimal HTTP/1.1 server that keeps connections open and counts how many
+    it accepted. pytest_httpserver always closes the connection after each
+    response, so it cannot show whether a client reuses connections.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, body: dict):
+        self.body = json.dumps(body).encode()
+        self.connections = 0
+        self.requests = 0
+        super().__init__(("localhost", 0), _KeepAliveHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: KeepAliveHTTPServer
+
+    def handle(self):
+        self.server.connections += 1
+        super().handle()
+
+    def do_GET(self):
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def keepalive_server():
+    server = KeepAliveHTTPServer(body={"hex": "badc0de"})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def threaded_httpserver():
+    """
+    A multi-threaded HTTPServer, for tests that make concurrent requests. The
+    shared httpserver fixture handles one request at a time.
+    """
+    server = HTTPServer(threaded=True)
+    server.start()
+    yield server
+    server.clear()
+    server.stop()
+
+
+class TwitterAPIStub:
+    """
+    Stands in for the Twitter v2 tweets endpoint on a pytest_httpserver.
+    Allows `limit` tweets per window of `window` seconds and reports the
+    remaining budget in the x-rate-limit-* headers, like Twitter does.
+    """
+
+    def __init__(self, server: HTTPServer, limit: int = 100, window: float = 900):
+        self.server = server
+        self.limit = limit
+        self.window = window
+        self.reset = time.time() + window
+        self.remaining = limit
+        self.tweets: list[str] = []
+        self.refused = 0
+        self._lock = threading.Lock()
+        server.expect_request("/2/tweets", method="POST").respond_with_handler(
+            self._handle
+        )
+
+    @property
+    def url(self) -> str:
+        return self.server.url_for("/")
+
+    def _handle(self, request: Request) -> Response:
+        if not request.headers.get("Authorization", "").startswith("OAuth "):
+            return Response(status=401)
+        with self._lock:
+            now = time.time()
+            if now >= self.reset:
+                self.reset = now + self.window
+                self.remaining = self.limit
+            headers = {
+                "x-rate-limit-limit": str(self.limit),
+                "x-rate-limit-reset": str(self.reset),
+            }
+            if self.remaining <= 0:
+                self.refused += 1
+                headers["x-rate-limit-remaining"] = "0"
+                return Response(
+                    json.dumps({"title": "Too Many Requests"}),
+                    status=429,
+                    headers=headers,
+                    content_type="application/json",
+                )
+            self.remaining -= 1
+            headers["x-rate-limit-remaining"] = str(self.remaining)
+            text = request.get_json()["text"]
+            self.tweets.append(text)
+            body = {"data": {"id": str(len(self.tweets)), "text": text}}
+        return Response(
+            json.dumps(body),
+            status=201,
+            headers=headers,
+            content_type="application/json",
+        )
+
+
+@pytest.fixture
+def twitter_api_stub(httpserver: HTTPServer) -> TwitterAPIStub:
+    return TwitterAPIStub(httpserver)
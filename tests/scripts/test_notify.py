@@ -3,11 +3,14 @@ import pytest
 from unittest import mock
 
 from freezegun import freeze_time
-from plane_spotter.adsb import ADSBExchange
-from plane_spotter.geolocator import Airport, Geolocator
+from plane_spotter.adsb import ADSBExchange, AsyncADSBExchange
+from plane_spotter.geolocator import Airport, AirportDiscovery, Geolocator
+from plane_spotter.loop import HASHTAGS
 from plane_spotter.notification import plane_landed_message, plane_stationed_at_message
-from plane_spotter.scripts.notify import _main_loop, AirportDiscovery, HASHTAGS
+from plane_spotter.state import StateStore
+from plane_spotter.scripts.notify import _fleet_main_loop, _main_loop
 from pytest_httpserver import HTTPServer
+from testfixtures import compare
 
 from tests.conftest import write_airport_csv
 
@@ -125,6 +128,46 @@ def test_main_loop_airplane_starts_at_airport(
     )
 
 
+@freeze_time("2022-01-01")
+def test_main_loop_restart_resumes_state(
+    notification_stub,
+    adsb_exchange: ADSBExchange,
+    geolocator: Geolocator,
+    httpserver: HTTPServer,
+    tmp_path,
+    log,
+):
+    httpserver.expect_request("/v2/hex/BADC0DE/").respond_with_json(
+        {
+            "alt_baro": "ground",
+            "lat": 38.704022,
+            "lon": -101.473911,
+        }
+    )
+
+    for _ in range(2):
+        with StateStore(tmp_path / "state.sqlite3") as state_store:
+            _main_loop(
+                adsb_backend=adsb_exchange,
+                geolocator=geolocator,
+                notification_backend=notification_stub,
+                search_radius=100,
+                icao_hex_id="BADC0DE",
+                loop_interval=0,
+                num_loops=1,
+                state_store=state_store,
+            )
+
+    # The restarted loop already knows where the airplane is stationed
+    notification_stub.send.assert_called_once()
+    assert {
+        "event": "restored tracker state",
+        "level": "info",
+        "in_flight": False,
+        "last_landed_airport": "00AA",
+    } in log.events
+
+
 @freeze_time("2022-01-01")
 def test_main_loop_airplane_starts_in_air_then_lands(
     notification_stub, geolocator, httpserver: HTTPServer, log
@@ -246,3 +289,52 @@ def test_main_loop_airplane_full_flight(
             mock.call(message=landed_message, log=mock.ANY),
         ]
     )
+
+
+@freeze_time("2022-01-01")
+def test_fleet_main_loop(notification_stub, geolocator, httpserver: HTTPServer, log):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    httpserver.expect_request("/v2/hex/A1/").respond_with_json(
+        {"alt_baro": "ground", "lat": 38.704022, "lon": -101.473911}
+    )
+    httpserver.expect_request("/v2/hex/A2/").respond_with_json(
+        {"alt_baro": "ground", "lat": 59.94919968, "lon": -151.695999146}
+    )
+    adsb = AsyncADSBExchange(
+        key="foo", hostname="localhost", port=httpserver.port, https=False
+    )
+
+    _fleet_main_loop(
+        adsb_backend=adsb,
+        geolocator=geolocator,
+        notification_backend=notification_stub,
+        search_radius=100,
+        icao_hex_ids=["A1", "A2"],
+        loop_interval=0,
+        num_loops=2,
+    )
+
+    assert adsb._client.is_closed
+    notification_stub.send.assert_has_calls(
+        [
+            mock.call(
+                message=plane_stationed_at_message(
+                    airport=AirportDiscovery(
+                        airport=aero_b_ranch_airport(), discovery_time=now
+                    ),
+                    hashtags=HASHTAGS,
+                ),
+                log=mock.ANY,
+            ),
+            mock.call(
+                message=plane_stationed_at_message(
+                    airport=AirportDiscovery(
+                        airport=lowell_field(), discovery_time=now
+                    ),
+                    hashtags=HASHTAGS,
+                ),
+                log=mock.ANY,
+            ),
+        ]
+    )
+    compare(expected=2, actual=notification_stub.send.call_count)
@@ -0,0 +1,84 @@
+import time
+
+import pytest
+from pytest_httpserver import HTTPServer
+import requests
+from testfixtures import compare
+from werkzeug import Request, Response
+
+from plane_spotter.adsb import ADSBExchange
+from tests.conftest import KeepAliveHTTPServer
+
+
+def adsb_exchange(server, **kwargs) -> ADSBExchange:
+    return ADSBExchange(
+        key="foo",
+        hostname="localhost",
+        port=server.port,
+        https=False,
+        **kwargs,
+    )
+
+
+def test_connections_are_reused(keepalive_server: KeepAliveHTTPServer):
+    with adsb_exchange(keepalive_server) as adsb:
+        for _ in range(5):
+            response = adsb.aircraft_last_position_by_hex_id(hex_id="BADC0DE")
+            compare(expected={"hex": "badc0de"}, actual=response.json())
+
+    compare(expected=5, actual=keepalive_server.requests)
+    compare(expected=1, actual=keepalive_server.connections)
+
+
+def test_rapidapi_headers_are_sent(httpserver: HTTPServer):
+    httpserver.expect_request(
+        "/v2/registration/N628TS/",
+        headers={"X-RapidAPI-Key": "foo", "X-RapidAPI-Host": "localhost"},
+    ).respond_with_json({"ac": []})
+
+    with adsb_exchange(httpserver) as adsb:
+        response = adsb.position_by_registration(registration="N628TS")
+
+    compare(expected={"ac": []}, actual=response.json())
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_honor_retry_after(httpserver: HTTPServer, status):
+    httpserver.expect_ordered_request("/v2/hex/BADC0DE/").respond_with_data(
+        "slow down", status=status, headers={"Retry-After": "1"}
+    )
+    httpserver.expect_ordered_request("/v2/hex/BADC0DE/").respond_with_json(
+        {"hex": "badc0de"}
+    )
+
+    with adsb_exchange(httpserver, backoff_factor=0, backoff_jitter=0) as adsb:
+        start = time.monotonic()
+        response = adsb.aircraft_last_position_by_hex_id(hex_id="BADC0DE")
+        elapsed = time.monotonic() - start
+
+    compare(expected={"hex": "badc0de"}, actual=response.json())
+    assert elapsed >= 1
+
+
+def test_gives_up_after_retries(httpserver: HTTPServer):
+    httpserver.expect_request("/v2/hex/BADC0DE/").respond_with_data("down", status=502)
+
+    with adsb_exchange(
+        httpserver, retries=2, backoff_factor=0, backoff_jitter=0
+    ) as adsb:
+        response = adsb.aircraft_last_position_by_hex_id(hex_id="BADC0DE")
+
+    compare(expected=502, actual=response.status_code)
+    compare(expected=3, actual=len(httpserver.log))
+
+
+def test_read_timeout(httpserver: HTTPServer):
+    def hang(request: Request) -> Response:
+        time.sleep(1)
+        return Response("{}")
+
+    httpserver.expect_request("/v2/hex/BADC0DE/").respond_with_handler(hang)
+
+    with adsb_exchange(httpserver, read_timeout=0.1, retries=0) as adsb:
+        with pytest.raises(requests.exceptions.RequestException):
+            adsb.aircraft_last_position_by_hex_id(hex_id="BADC0DE")
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+from pytest_httpserver import HTTPServer
+from testfixtures import compare
+from werkzeug import Request, Response
+
+from plane_spotter.adsb import ADSBExchange, AsyncADSBExchange, position_time
+from plane_spotter.adsb_cache import AsyncResponseCache, ResponseCache
+from plane_spotter.clock import VirtualClock
+
+
+def adsb_kwargs(server) -> dict:
+    return dict(key="foo", hostname="localhost", port=server.port, https=False)
+
+
+def requests_to(server: HTTPServer, path: str) -> int:
+    # A handler still running from an earlier test may land in the log too
+    return sum(1 for request, _ in server.log if request.path == path)
+
+
+def slow_handler(calls: list, delay: float = 0.2):
+    def handler(request: Request) -> Response:
+        calls.append(request.path)
+        time.sleep(delay)
+        return Response('{"hex": "badc0de"}', content_type="application/json")
+
+    return handler
+
+
+def test_responses_are_cached_until_ttl(httpserver: HTTPServer):
+    httpserver.expect_request("/v2/hex/A835AF/").respond_with_json({"hex": "a835af"})
+    clock = VirtualClock()
+    cache: ResponseCache[requests.Response] = ResponseCache(
+        ttl=10, clock=clock.monotonic
+    )
+
+    with ADSBExchange(**adsb_kwargs(httpserver), cache=cache) as adsb:
+        for _ in range(3):
+            response = adsb.aircraft_last_position_by_hex_id(hex_id="A835AF")
+            compare(expected={"hex": "a835af"}, actual=response.json())
+        compare(expected=1, actual=requests_to(httpserver, "/v2/hex/A835AF/"))
+
+        clock.advance(10)
+        adsb.aircraft_last_position_by_hex_id(hex_id="A835AF")
+        compare(expected=2, actual=requests_to(httpserver, "/v2/hex/A835AF/"))
+
+
+def test_errors_are_not_cached(httpserver: HTTPServer):
+    httpserver.expect_request("/v2/hex/A835AF/").respond_with_data(
+        "not found", status=404
+    )
+    cache: ResponseCache[requests.Response] = ResponseCache(ttl=10)
+
+    with ADSBExchange(**adsb_kwargs(httpserver), cache=cache) as adsb:
+        adsb.aircraft_last_position_by_hex_id(hex_id="A835AF")
+        adsb.aircraft_last_position_by_hex_id(hex_id="A835AF")
+
+    compare(expected=2, actual=requests_to(httpserver, "/v2/hex/A835AF/"))
+    compare(expected=0, actual=len(cache))
+
+
+def test_least_recently_used_is_evicted():
+    cache: ResponseCache[requests.Response] = ResponseCache(ttl=10, max_entries=2)
+    fetched = []
+
+    def fetch(hex_id):
+        fetched.append(hex_id)
+        return httpx.Response(200, json={"hex": hex_id})
+
+    for hex_id in ["a", "b", "a", "c", "a", "b"]:
+        cache.get(["hex", hex_id], lambda: fetch(hex_id))
+
+    # c evicted b, which had been used less recently than a
+    compare(expected=["a", "b", "c", "b"], actual=fetched)
+    compare(expected=2, actual=len(cache))
+
+
+def test_concurrent_requests_share_one_request(httpserver: HTTPServer):
+    calls: list[str] = []
+    httpserver.expect_request("/v2/hex/BADC0DE/").respond_with_handler(
+        slow_handler(calls)
+    )
+    cache: ResponseCache[requests.Response] = ResponseCache(ttl=10)
+    results = []
+
+    with ADSBExchange(**adsb_kwargs(httpserver), cache=cache) as adsb:
+
+        def poll():
+            results.append(adsb.aircraft_last_position_by_hex_id("BADC0DE").json())
+
+        threads = [threading.Thread(target=poll) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    compare(expected=["/v2/hex/BADC0DE/"], actual=calls)
+    compare(expected=[{"hex": "badc0de"}] * 5, actual=results)
+
+
+def test_failed_request_is_raised_to_every_waiter():
+    cache: ResponseCache[requests.Response] = ResponseCache(ttl=10)
+    started = threading.Event()
+    errors = []
+
+    def fetch():
+        started.set()
+        time.sleep(0.2)
+        raise httpx.ConnectError("down")
+
+    def waiter():
+        started.wait()
+        try:
+            cache.get(["hex", "a"], fetch)
+        except httpx.ConnectError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    with pytest.raises(httpx.ConnectError):
+        cache.get(["hex", "a"], fetch)
+    thread.join()
+
+    compare(expected=1, actual=len(errors))
+    compare(expected=0, actual=len(cache))
+
+
+def test_async_concurrent_requests_share_one_request(httpserver: HTTPServer):
+    calls: list[str] = []
+    httpserver.expect_request("/v2/hex/BADC0DE/").respond_with_handler(
+        slow_handler(calls)
+    )
+
+    async def poll_all():
+        cache = AsyncResponseCache(ttl=10)
+        async with AsyncADSBExchange(**adsb_kwargs(httpserver), cache=cache) as adsb:
+            responses = await asyncio.gather(
+                *(adsb.aircraft_last_position_by_hex_id("BADC0DE") for _ in range(5))
+            )
+            # Answered from the cache once the shared request is done
+            responses.append(await adsb.aircraft_last_position_by_hex_id("BADC0DE"))
+        return [response.json() for response in responses]
+
+    compare(expected=[{"hex": "badc0de"}] * 6, actual=asyncio.run(poll_all()))
+    compare(expected=["/v2/hex/BADC0DE/"], actual=calls)
+
+
+@pytest.mark.parametrize(
+    "adsb_data,expected",
+    [
+        ({"ctime": 1671668713823, "seen_pos": 60.179, "seen": 60}, 1671668653.6),
+        ({"ctime": 1671668713823, "seen": 60}, 1671668653.8),
+        ({"seen_pos": 60.179}, None),
+        ({}, None),
+    ],
+)
+def test_position_time(adsb_data, expected):
+    compare(expected=expected, actual=position_time(adsb_data))
@@ -0,0 +1,88 @@
+import csv
+import io
+
+from testfixtures import compare
+
+from plane_spotter.airport_db import (
+    TEXT_FIELDS,
+    AirportDatabase,
+    build_airport_database,
+    default_database_path,
+    file_sha256,
+    load_airport_database,
+)
+from plane_spotter.geolocator import Geolocator
+from tests.conftest import DEFAULT_AIRPORT_CSV, write_airport_csv
+
+UNICODE_AIRPORT_CSV = (
+    DEFAULT_AIRPORT_CSV
+    + 'SBGR,large_airport,"Guarulhos - Governador André Franco Montoro International Airport",2459,SA,BR,BR-SP,São Paulo,SBGR,GRU,,"-23.435556, -46.473056"\n'
+)
+
+
+def test_build_airport_database_round_trip(airport_csv_path, tmp_path):
+    write_airport_csv(airport_csv_path, UNICODE_AIRPORT_CSV)
+    database_file = tmp_path.joinpath("airports.bin")
+
+    build_airport_database(airport_csv_path, database_file)
+    database = AirportDatabase(database_file)
+
+    rows = list(csv.DictReader(io.StringIO(UNICODE_AIRPORT_CSV)))
+    compare(expected=len(rows), actual=len(database))
+    compare(
+        expected=[{field: row[field] for field in TEXT_FIELDS} for row in rows],
+        actual=[database.row(i) for i in range(len(database))],
+    )
+    compare(expected=[row["type"] for row in rows], actual=database.column("type"))
+    compare(
+        expected=[-23.435556],
+        actual=database.latitudes[2:].tolist(),
+    )
+    compare(expected=file_sha256(airport_csv_path), actual=database.csv_sha256)
+
+
+def test_load_airport_database_rebuilds_when_csv_changes(airport_csv_path):
+    write_airport_csv(airport_csv_path)
+    database = load_airport_database(airport_csv_path)
+    compare(expected=2, actual=len(database))
+    assert default_database_path(airport_csv_path).exists()
+
+    write_airport_csv(airport_csv_path, UNICODE_AIRPORT_CSV)
+    database = load_airport_database(airport_csv_path)
+    compare(expected=3, actual=len(database))
+    compare(expected="SBGR", actual=database.value("ident", 2))
+
+
+def test_load_airport_database_rebuilds_corrupt_file(airport_csv_path):
+    write_airport_csv(airport_csv_path)
+    default_database_path(airport_csv_path).write_bytes(b"not a database")
+
+    database = load_airport_database(airport_csv_path)
+    compare(expected=2, actual=len(database))
+
+
+def test_geolocator_reuses_database(airport_csv_path):
+    write_airport_csv(airport_csv_path)
+    Geolocator(airport_code_file=airport_csv_path)
+    database_file = default_database_path(airport_csv_path)
+    mtime = database_file.stat().st_mtime_ns
+
+    geolocator = Geolocator(airport_code_file=airport_csv_path)
+    match = geolocator.lookup_airport(
+        coordinates=(38.704022, -101.473911), max_distance=1
+    )
+
+    compare(expected=mtime, actual=database_file.stat().st_mtime_ns)
+    compare(expected="Aero B Ranch Airport", actual=match.airport.name)
+    compare(expected=(38.704022, -101.473911), actual=match.airport.coordinates)
+
+
+def test_categorical_fields_are_shared(airport_csv_path):
+    write_airport_csv(airport_csv_path, UNICODE_AIRPORT_CSV)
+    database = load_airport_database(airport_csv_path)
+
+    compare(
+        expected=("small_airport", "large_airport"), actual=database.dictionary("type")
+    )
+    compare(expected=[0, 0, 1], actual=database.codes("type").tolist())
+    assert database.row(0)["iso_country"] is database.row(1)["iso_country"]
@@ -0,0 +1,175 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+from testfixtures import compare
+
+from plane_spotter.browser_pool import BrowserPool, process_rss_bytes
+from plane_spotter.selenium import adsb_exchange_screenshot
+
+
+class FakeDriver:
+    def __init__(self):
+        self.alive = True
+        self.quit_called = False
+        self.memory = 10 * 2**20
+        self.visited: list[str] = []
+        self.screenshots: list = []
+        self.current_url = "about:blank"
+
+    def execute_script(self, script: str):
+        if not self.alive:
+            raise WebDriverException("chrome not reachable")
+        return 1
+
+    def get(self, url: str):
+        self.current_url = url
+        self.visited.append(url)
+
+    def set_window_size(self, width: int, height: int):
+        pass
+
+    def save_screenshot(self, path):
+        self.screenshots.append(path)
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeDriverFactory:
+    def __init__(self):
+        self.drivers: list[FakeDriver] = []
+
+    def __call__(self) -> FakeDriver:
+        driver = FakeDriver()
+        self.drivers.append(driver)
+        return driver
+
+
+@pytest.fixture
+def factory() -> FakeDriverFactory:
+    return FakeDriverFactory()
+
+
+def test_browsers_are_reused_and_set_up_once(factory):
+    setups = []
+    with BrowserPool(factory=factory, setup=setups.append) as pool:
+        for _ in range(3):
+            with pool.browser() as driver:
+                assert driver is factory.drivers[0]
+        compare(expected=factory.drivers, actual=setups)
+        assert pool.idle == 1
+    assert factory.drivers[0].quit_called
+
+
+def test_warm(factory):
+    with BrowserPool(factory=factory, max_browsers=2) as pool:
+        pool.warm(5)
+        assert pool.idle == 2
+        assert pool.alive == 2
+
+
+def test_recycles_after_max_uses(factory):
+    with BrowserPool(factory=factory, max_uses=2) as pool:
+        for _ in range(5):
+            with pool.browser():
+                pass
+    assert len(factory.drivers) == 3
+    assert all(driver.quit_called for driver in factory.drivers)
+
+
+def test_recycles_on_memory_growth(factory):
+    with BrowserPool(
+        factory=factory,
+        max_memory_growth_mb=100,
+        memory_probe=lambda driver: driver.memory,
+    ) as pool:
+        with pool.browser() as driver:
+            pass
+        with pool.browser() as driver:
+            driver.memory += 50 * 2**20
+        with pool.browser() as driver:
+            assert driver is factory.drivers[0]
+            driver.memory += 100 * 2**20
+        with pool.browser() as driver:
+            assert driver is factory.drivers[1]
+    assert factory.drivers[0].quit_called
+
+
+def test_process_rss_bytes():
+    psutil = pytest.importorskip("psutil")
+    driver = FakeDriver()
+    assert process_rss_bytes(driver) is None
+
+    # This process stands in for chromedriver
+    child = subprocess.Popen([sys.executable, "-c", "input()"], stdin=subprocess.PIPE)
+    try:
+        driver.service = SimpleNamespace(process=SimpleNamespace(pid=os.getpid()))
+        rss = process_rss_bytes(driver)
+        assert rss is not None
+        own = psutil.Process().memory_info().rss
+        of_child = psutil.Process(child.pid).memory_info().rss
+        # Allowing for the interpreter's memory changing a little in between
+        assert rss > own + of_child / 2
+    finally:
+        child.communicate(b"\n")
+
+
+def test_replaces_unhealthy_and_failed_browsers(factory):
+    with BrowserPool(factory=factory) as pool:
+        with pool.browser() as driver:
+            pass
+        driver.alive = False
+        with pool.browser() as driver:
+            assert driver is factory.drivers[1]
+        with pytest.raises(WebDriverException):
+            with pool.browser():
+                raise WebDriverException("tab crashed")
+        with pool.browser() as driver:
+            assert driver is factory.drivers[2]
+        assert pool.alive == 1
+    assert factory.drivers[0].quit_called
+    assert factory.drivers[1].quit_called
+
+
+def test_caps_concurrent_browsers(factory):
+    in_use = []
+    peak = []
+    lock = threading.Lock()
+
+    def borrow(pool: BrowserPool):
+        with pool.browser() as driver:
+            with lock:
+                in_use.append(driver)
+                peak.append(len(in_use))
+            time.sleep(0.05)
+            with lock:
+                in_use.remove(driver)
+
+    with BrowserPool(factory=factory, max_browsers=2) as pool:
+        threads = [threading.Thread(target=borrow, args=(pool,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert max(peak) == 2
+    assert len(factory.drivers) == 2
+
+
+def test_screenshot_borrows_from_pool(factory, tmp_path):
+    with BrowserPool(factory=factory) as pool:
+        for hex_id in ("A835AF", "A2AE0A"):
+            adsb_exchange_screenshot(hex_id, tmp_path / f"{hex_id}.png", pool)
+    compare(
+        expected=[
+            "https://globe.adsbexchange.com/?icao=a835af",
+            "https://globe.adsbexchange.com/?icao=a2ae0a",
+        ],
+        actual=factory.drivers[0].visited,
+    )
+    assert len(factory.drivers) == 1
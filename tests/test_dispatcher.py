@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+from testfixtures import compare
+
+from plane_spotter.dispatcher import NotificationDispatcher
+from plane_spotter.notification import NotificationBackend
+
+
+class RecordingBackend(NotificationBackend):
+    def __init__(self, delay: float = 0.0, failures: int = 0):
+        self.delay = delay
+        self.failures = failures
+        self.sent: list[tuple[float, str]] = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def send(self, message: str, log):
+        self.release.wait()
+        time.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("browser crashed")
+        self.sent.append((time.monotonic(), message))
+
+
+def messages(backend: RecordingBackend) -> list[str]:
+    return [message for _, message in backend.sent]
+
+
+def test_send_does_not_block_and_close_drains():
+    backend = RecordingBackend(delay=0.1)
+    dispatcher = NotificationDispatcher(backend)
+
+    start = time.monotonic()
+    for i in range(5):
+        dispatcher.send(f"message {i}")
+    assert time.monotonic() - start < 0.1
+
+    dispatcher.close()
+    compare(expected=[f"message {i}" for i in range(5)], actual=messages(backend))
+    with pytest.raises(RuntimeError):
+        dispatcher.send("too late")
+
+
+def test_retries_failed_sends(log):
+    backend = RecordingBackend(failures=2)
+    with NotificationDispatcher(backend, retries=2, retry_backoff=0) as dispatcher:
+        dispatcher.send("hello")
+    compare(expected=["hello"], actual=messages(backend))
+    assert sum(e["event"] == "notification failed, retrying" for e in log.events) == 2
+
+
+def test_gives_up_after_retries(log):
+    backend = RecordingBackend(failures=5)
+    with NotificationDispatcher(backend, retries=1, retry_backoff=0) as dispatcher:
+        dispatcher.send("hello")
+        dispatcher.send("world")
+    # The first message used up two failures, the second the next two
+    compare(expected=[], actual=messages(backend))
+    assert sum(e["event"] == "giving up on notification" for e in log.events) == 2
+
+
+def test_rate_limit():
+    backend = RecordingBackend()
+    with NotificationDispatcher(backend, workers=2, min_interval=0.1) as dispatcher:
+        for i in range(4):
+            dispatcher.send(f"message {i}")
+    times = sorted(sent for sent, _ in backend.sent)
+    assert len(times) == 4
+    assert all(b - a >= 0.09 for a, b in zip(times, times[1:]))
+
+
+def test_drops_messages_when_full(log):
+    backend = RecordingBackend()
+    backend.release.clear()
+    dispatcher = NotificationDispatcher(backend, queue_size=1)
+    assert dispatcher.send("taken by the worker")
+    # Wait for the worker to take the first message off the queue
+    while dispatcher.qsize():
+        time.sleep(0.01)
+    assert dispatcher.send("queued")
+    assert not dispatcher.send("dropped")
+    backend.release.set()
+    dispatcher.close()
+
+    compare(expected=["taken by the worker", "queued"], actual=messages(backend))
+    assert {
+        "event": "notification queue is full, dropping message",
+        "level": "error",
+        "message": "dropped",
+    } in log.events
@@ -1,9 +1,14 @@
+import dataclasses
+import random
+
 import pytest
 
-from plane_spotter.geolocator import Geolocator
+from plane_spotter.geolocator import AirportFilter, Geolocator, IncrementalGeolocator
 from plane_spotter.package import airport_code_path
 from testfixtures import compare
 
+from tests.conftest import DEFAULT_AIRPORT_CSV, write_airport_csv
+
 
 @pytest.mark.parametrize(
     ("coordinates", "distance", "expected"),
@@ -28,6 +33,317 @@ from testfixtures import compare
 )
 def test_lookup_airport(coordinates, distance, expected):
     geolocator = Geolocator(airport_code_file=airport_code_path())
-    airport = geolocator.lookup_airport(coordinates=coordinates, max_distance=distance)
+    match = geolocator.lookup_airport(coordinates=coordinates, max_distance=distance)
+
+    compare(expected=expected, actual=match.airport.name if match is not None else None)
+
+
+def random_airport_csv(num_airports: int, seed: int = 0) -> str:
+    rand = random.Random(seed)
+    lines = [DEFAULT_AIRPORT_CSV.splitlines()[0]]
+    for i in range(num_airports):
+        lat = rand.uniform(-90, 90)
+        lon = rand.uniform(-180, 180)
+        lines.append(
+            f'R{i:04d},small_airport,Airport {i},0,NA,US,US-KS,,,,,"{lat}, {lon}"'
+        )
+    # Airports straddling the antimeridian and near the poles
+    lines.append('EDGE1,small_airport,East,0,OC,FJ,FJ-E,,,,,"-16.5, 179.99"')
+    lines.append('EDGE2,small_airport,West,0,OC,FJ,FJ-W,,,,,"-16.5, -179.99"')
+    lines.append('EDGE3,small_airport,North,0,NA,CA,CA-NU,,,,,"89.9, 12.0"')
+    lines.append('EDGE4,small_airport,South,0,AN,AQ,AQ-U-A,,,,,"-89.9, -100.0"')
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def random_airport_csv_path(airport_csv_path):
+    write_airport_csv(airport_csv_path, random_airport_csv(num_airports=1000))
+    return airport_csv_path
+
+
+@pytest.mark.parametrize("max_distance", [1, 50, 300, 2500, 30000])
+def test_lookup_airport_index_matches_linear(random_airport_csv_path, max_distance):
+    indexed = Geolocator(airport_code_file=random_airport_csv_path)
+    linear = Geolocator(airport_code_file=random_airport_csv_path, spatial_index=False)
+
+    rand = random.Random(max_distance)
+    points = [(rand.uniform(-90, 90), rand.uniform(-180, 180)) for _ in range(100)]
+    points += [(-16.5, 180.0), (-16.5, -180.0), (90.0, 0.0), (-90.0, 0.0)]
+    for point in points:
+        compare(
+            expected=linear.lookup_airport(
+                coordinates=point, max_distance=max_distance
+            ),
+            actual=indexed.lookup_airport(coordinates=point, max_distance=max_distance),
+        )
+
+
+def test_lookup_airport_across_antimeridian(random_airport_csv_path):
+    geolocator = Geolocator(airport_code_file=random_airport_csv_path)
+    match = geolocator.lookup_airport(coordinates=(-16.5, -179.999), max_distance=5)
+
+    compare(expected="EDGE2", actual=match.airport.ident if match is not None else None)
+
+
+@pytest.mark.parametrize("spatial_index", [True, False])
+@pytest.mark.parametrize("max_distance", [1, 300, 30000])
+def test_lookup_airports_matches_lookup_airport(
+    random_airport_csv_path, spatial_index, max_distance
+):
+    geolocator = Geolocator(
+        airport_code_file=random_airport_csv_path, spatial_index=spatial_index
+    )
+
+    rand = random.Random(max_distance)
+    points = [(rand.uniform(-90, 90), rand.uniform(-180, 180)) for _ in range(100)]
+    points.append((38.704022, -101.473911))
+    compare(
+        expected=[
+            geolocator.lookup_airport(coordinates=point, max_distance=max_distance)
+            for point in points
+        ],
+        actual=geolocator.lookup_airports(coords=points, max_distance=max_distance),
+    )
+
+
+def test_lookup_airport_result_is_immutable(random_airport_csv_path):
+    geolocator = Geolocator(airport_code_file=random_airport_csv_path)
+
+    first = geolocator.lookup_airport(coordinates=(-16.5, 179.99), max_distance=1)
+    second = geolocator.lookup_airport(coordinates=(-16.5, 179.98), max_distance=5)
+
+    assert first is not None and second is not None
+    assert first.airport is second.airport
+    compare(expected=0.0, actual=first.distance)
+    assert second.distance > 0
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        first.airport.name = "changed"  # type: ignore[misc]
+
+
+def test_incremental_skips_lookup_until_moved(random_airport_csv_path, monkeypatch):
+    geolocator = Geolocator(airport_code_file=random_airport_csv_path)
+    incremental = IncrementalGeolocator(geolocator, min_movement=0.1, taxi_radius=0)
+    first = incremental.lookup_airport("a1", (-16.5, 179.99), max_distance=5)
+    assert first is not None
+
+    lookups = []
+    monkeypatch.setattr(
+        geolocator, "lookup_airport", lambda *args, **kwargs: lookups.append(args)
+    )
+    # About 50 meters, and another aircraft parked in the same spot
+    assert incremental.lookup_airport("a1", (-16.5, 179.9905), 5) is first
+    assert incremental.lookup_airport("a2", (-16.5, 179.99), 5) is None
+    # Searched again for a different radius
+    assert incremental.lookup_airport("a1", (-16.5, 179.9905), 10) is None
+    compare(expected=2, actual=len(lookups))
+
+
+@pytest.mark.parametrize("taxi_radius", [0, 5, 50])
+def test_incremental_matches_lookup_airport(airport_csv_path, taxi_radius):
+    # A cluster of airports a few kilometers apart for the aircraft to taxi
+    # between
+    rand = random.Random(taxi_radius)
+    csv = random_airport_csv(num_airports=500).splitlines()
+    for i in range(50):
+        lat = 38.7 + rand.uniform(-0.2, 0.2)
+        lon = -101.5 + rand.uniform(-0.2, 0.2)
+        csv.append(
+            f'C{i:03d},small_airport,Cluster {i},0,NA,US,US-KS,,,,,"{lat}, {lon}"'
+        )
+    write_airport_csv(airport_csv_path, "\n".join(csv) + "\n")
+    geolocator = Geolocator(airport_code_file=airport_csv_path)
+    incremental = IncrementalGeolocator(
+        geolocator, min_movement=0, taxi_radius=taxi_radius
+    )
+
+    position = (38.7, -101.5)
+    track = []
+    for _ in range(200):
+        position = (
+            position[0] + rand.uniform(-0.01, 0.01),
+            position[1] + rand.uniform(-0.01, 0.01),
+        )
+        track.append(position)
+    for point in track:
+        compare(
+            expected=geolocator.lookup_airport(coordinates=point, max_distance=300),
+            actual=incremental.lookup_airport("a1", point, max_distance=300),
+        )
+    compare(
+        expected=geolocator.lookup_airports(coords=track[::-1], max_distance=300),
+        actual=incremental.lookup_airports(
+            keys=range(len(track)), coords=track[::-1], max_distance=300
+        ),
+    )
+
+
+def test_incremental_taxiing_uses_no_new_masks(airport_csv_path, monkeypatch):
+    write_airport_csv(airport_csv_path, random_airport_csv(num_airports=500))
+    geolocator = Geolocator(airport_code_file=airport_csv_path)
+    geolocator.proximity_masks(300)
+    masks = sorted(airport_csv_path.parent.glob("*.mask"))
+    compare(expected=1, actual=len(masks))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("mask loaded for an ad-hoc radius")
+
+    monkeypatch.setattr("plane_spotter.geolocator.load_proximity_mask", fail)
+    incremental = IncrementalGeolocator(geolocator, min_movement=0, taxi_radius=50)
+    start = geolocator.lookup_airport((0.0, 0.0), max_distance=20000)
+    assert start is not None
+    position = start.airport.coordinates
+    assert position is not None
+    rand = random.Random(0)
+    for _ in range(30):
+        position = (
+            position[0] + rand.uniform(-0.01, 0.01),
+            position[1] + rand.uniform(-0.01, 0.01),
+        )
+        incremental.lookup_airport("a1", position, max_distance=300)
+        incremental.lookup_airport("a2", position, max_distance=20000)
+
+    compare(expected=masks, actual=sorted(airport_csv_path.parent.glob("*.mask")))
+
+
+# Airports a few kilometers apart around (38.7, -101.5)
+FILTER_AIRPORT_CSV = "\n".join(
+    [
+        DEFAULT_AIRPORT_CSV.splitlines()[0],
+        'BIG,large_airport,Big,0,NA,US,US-KS,,,BIG,,"38.75, -101.5"',
+        'MED,medium_airport,Medium,0,NA,US,US-CO,,,,,"38.72, -101.5"',
+        'STRIP,small_airport,Strip,0,NA,US,US-KS,,,,,"38.701, -101.5"',
+        'HELI,heliport,Heliport,0,NA,US,US-KS,,,,,"38.7, -101.5"',
+        'CAN,small_airport,Canada,0,NA,CA,CA-ON,,,CAN,,"38.705, -101.5"',
+    ]
+)
+FILTER_RUNWAY_CSV = """\
+id,airport_ref,airport_ident,length_ft,width_ft,surface,lighted,closed,le_ident
+1,1,BIG,12000,150,ASP,1,0,09
+2,1,BIG,15000,150,ASP,1,1,18
+3,2,MED,6000,100,ASP,1,0,09
+4,3,STRIP,1800,30,TURF,0,0,09
+5,3,STRIP,,30,TURF,0,0,18
+"""
+
+
+@pytest.fixture
+def filter_airport_csv_path(airport_csv_path):
+    write_airport_csv(airport_csv_path, FILTER_AIRPORT_CSV + "\n")
+    return airport_csv_path
+
+
+def nearest_ident(geolocator, max_distance=100):
+    match = geolocator.lookup_airport(
+        coordinates=(38.7, -101.5), max_distance=max_distance
+    )
+    return match.airport.ident if match is not None else None
+
+
+@pytest.mark.parametrize(
+    ("airport_filter", "expected"),
+    [
+        (AirportFilter(), "STRIP"),
+        (AirportFilter(exclude_types=frozenset()), "HELI"),
+        (AirportFilter(types=frozenset(["medium_airport", "large_airport"])), "MED"),
+        (AirportFilter(countries=frozenset(["CA"])), "CAN"),
+        (AirportFilter(regions=frozenset(["US-CO"])), "MED"),
+        (
+            AirportFilter(countries=frozenset(["CA"]), regions=frozenset(["US-CO"])),
+            "CAN",
+        ),
+        (AirportFilter(require_iata_code=True), "CAN"),
+        (
+            AirportFilter(require_iata_code=True, countries=frozenset(["US"])),
+            "BIG",
+        ),
+    ],
+)
+def test_airport_filter(filter_airport_csv_path, airport_filter, expected):
+    geolocator = Geolocator(
+        airport_code_file=filter_airport_csv_path, airport_filter=airport_filter
+    )
+
+    compare(expected=expected, actual=nearest_ident(geolocator))
+
+
+@pytest.mark.parametrize(
+    ("min_runway_length_ft", "expected"),
+    [(1000, "STRIP"), (5000, "MED"), (13000, None)],
+)
+def test_airport_filter_by_runway_length(
+    filter_airport_csv_path, tmp_path, min_runway_length_ft, expected
+):
+    runway_file = tmp_path / "runways.csv"
+    runway_file.write_text(FILTER_RUNWAY_CSV)
+    airport_filter = AirportFilter(min_runway_length_ft=min_runway_length_ft)
+
+    if expected is None:
+        # Only BIG's closed runway is that long, so nothing is left
+        with pytest.raises(ValueError):
+            Geolocator(
+                airport_code_file=filter_airport_csv_path,
+                airport_filter=airport_filter,
+                runway_file=runway_file,
+            )
+        return
+    geolocator = Geolocator(
+        airport_code_file=filter_airport_csv_path,
+        airport_filter=airport_filter,
+        runway_file=runway_file,
+    )
+    compare(expected=expected, actual=nearest_ident(geolocator))
+
+
+def test_airport_filter_by_runway_length_needs_runways(filter_airport_csv_path):
+    with pytest.raises(ValueError):
+        Geolocator(
+            airport_code_file=filter_airport_csv_path,
+            airport_filter=AirportFilter(min_runway_length_ft=1000),
+        )
+
+
+@pytest.mark.parametrize("spatial_index", [True, False])
+def test_tiered_lookup(filter_airport_csv_path, spatial_index):
+    geolocator = Geolocator(
+        airport_code_file=filter_airport_csv_path,
+        spatial_index=spatial_index,
+        tiers=[["large_airport"], ["medium_airport"]],
+    )
+
+    compare(expected="BIG", actual=nearest_ident(geolocator))
+    # Small airports only when no larger one is in range
+    compare(expected="MED", actual=nearest_ident(geolocator, max_distance=3))
+    compare(expected="STRIP", actual=nearest_ident(geolocator, max_distance=1))
+    compare(
+        expected=[0, 1, 2],
+        actual=[
+            geolocator.tier(geolocator.lookup_airport((38.7, -101.5), d).airport)
+            for d in (100, 3, 1)
+        ],
+    )
+    compare(
+        expected=[
+            geolocator.lookup_airport(coordinates=(38.7, -101.5), max_distance=d)
+            for d in (100, 3, 1, 0.01)
+        ],
+        actual=[
+            geolocator.lookup_airports(coords=[(38.7, -101.5)], max_distance=d)[0]
+            for d in (100, 3, 1, 0.01)
+        ],
+    )
+
+
+def test_incremental_taxiing_with_tiers(filter_airport_csv_path):
+    geolocator = Geolocator(
+        airport_code_file=filter_airport_csv_path,
+        tiers=[["large_airport", "medium_airport"]],
+    )
+    incremental = IncrementalGeolocator(geolocator, min_movement=0, taxi_radius=50)
+
+    # Matched to the strip with nothing larger in range, then a larger
+    # airport comes in range while still near the strip
+    first = incremental.lookup_airport("a1", (38.701, -101.5), max_distance=2)
+    second = incremental.lookup_airport("a1", (38.705, -101.5), max_distance=2)
 
-    compare(expected=expected, actual=airport.name if airport is not None else None)
+    compare(expected="STRIP", actual=first.airport.ident)
+    compare(expected="MED", actual=second.airport.ident)
@@ -0,0 +1,87 @@
+"""
+Guards startup cost. Each module is imported in a fresh interpreter, timed
+with python -X importtime, and checked for the slow imports that are meant to
+stay out of startup.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative import time budgets in milliseconds, generous so that only real
+# regressions fail. Scale them with IMPORT_BUDGET_SCALE on slow machines.
+IMPORT_BUDGETS_MS = {
+    "plane_spotter.scripts.notify": 1500,
+}
+# Only imported once the notify config selects them
+LAZY_MODULES = (
+    "httpx",
+    "oauthlib",
+    "selenium",
+    "tweepy",
+    "plane_spotter.browser_pool",
+    "plane_spotter.selenium",
+    "plane_spotter.twitter",
+    "plane_spotter.twitter_api",
+)
+
+
+def imported_modules(module: str) -> list[str]:
+    """Every module in sys.modules after importing `module`."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import json, sys, {module}; print(json.dumps(list(sys.modules)))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def cumulative_import_ms(module: str) -> float:
+    """Cumulative time python -X importtime reports for importing `module`, in
+    milliseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and line.split("|")[-1].strip() == module:
+            return int(line.split("|")[1]) / 1000
+    raise AssertionError(f"{module} missing from -X importtime output")
+
+
+@pytest.mark.parametrize("module", IMPORT_BUDGETS_MS)
+def test_import_time_budget(module):
+    budget = IMPORT_BUDGETS_MS[module] * float(
+        os.environ.get("IMPORT_BUDGET_SCALE", "1")
+    )
+    # The best of a few runs, so a busy machine doesn't fail the test
+    elapsed = min(cumulative_import_ms(module) for _ in range(3))
+    assert elapsed <= budget, f"importing {module} took {elapsed:.0f} ms"
+
+
+def eager(imported: list[str], lazy_modules: tuple[str, ...]) -> list[str]:
+    return [
+        name
+        for name in imported
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in lazy_modules)
+    ]
+
+
+def test_notify_does_not_import_backends():
+    imported = imported_modules("plane_spotter.scripts.notify")
+    assert eager(imported, LAZY_MODULES) == []
+
+
+@pytest.mark.parametrize("module", ["plane_spotter.loop", "plane_spotter.replay"])
+def test_does_not_import_hydra_or_backends(module):
+    assert eager(imported_modules(module), LAZY_MODULES + ("hydra",)) == []
@@ -0,0 +1,102 @@
+import importlib.util
+import json
+
+import pytest
+import structlog
+from structlog.testing import CapturingLogger
+from testfixtures import compare
+
+from plane_spotter.geolocator import Airport
+from plane_spotter.logs import RepeatedEventSampler, configure_logging
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def configured_logger(monkeypatch, **kwargs):
+    """A logger set up the way configure_logging(**kwargs) configures
+    structlog, writing to a CapturingLogger."""
+    config = {}
+    monkeypatch.setattr(structlog, "configure", lambda **kw: config.update(kw))
+    configure_logging(**kwargs)
+    output = CapturingLogger()
+    log = structlog.wrap_logger(
+        output,
+        processors=config["processors"],
+        wrapper_class=config["wrapper_class"],
+    )
+    return log, output
+
+
+def test_sampler_drops_repeats_per_aircraft():
+    clock = FakeClock()
+    sampler = RepeatedEventSampler(interval=60, clock=clock)
+
+    def let_through(event, **fields):
+        try:
+            return sampler(None, "info", {"event": event, **fields})
+        except structlog.DropEvent:
+            return None
+
+    assert let_through("airplane hasn't moved", icao_hex_id="A835AF")
+    assert let_through("airplane hasn't moved", icao_hex_id="A2AE0A")
+    assert let_through("tweet successful")
+    for _ in range(3):
+        clock.now += 10
+        assert let_through("airplane hasn't moved", icao_hex_id="A835AF") is None
+        assert let_through("tweet successful")
+    clock.now += 60
+    compare(
+        expected={
+            "event": "airplane hasn't moved",
+            "icao_hex_id": "A835AF",
+            "suppressed": 3,
+        },
+        actual=let_through("airplane hasn't moved", icao_hex_id="A835AF"),
+    )
+
+
+@pytest.mark.parametrize("orjson", [True, False], ids=["orjson", "json"])
+def test_json_format(monkeypatch, orjson):
+    if not orjson:
+        find_spec = importlib.util.find_spec
+        monkeypatch.setattr(
+            importlib.util,
+            "find_spec",
+            lambda name: None if name == "orjson" else find_spec(name),
+        )
+    elif importlib.util.find_spec("orjson") is None:
+        pytest.skip("orjson is not installed")
+
+    log, output = configured_logger(monkeypatch, format="json")
+    log.info(
+        "nearest airport info",
+        adsb_data={"alt_baro": "ground", "lat": 37.7},
+        airport=Airport(ident="00AA", coordinates=(38.7, -101.5)),
+    )
+
+    (call,) = output.calls
+    record = json.loads(call.args[0])
+    compare(expected={"alt_baro": "ground", "lat": 37.7}, actual=record["adsb_data"])
+    assert record["airport"]["ident"] == "00AA"
+    assert record["level"] == "info"
+
+
+def test_filtered_records_are_not_serialized(monkeypatch):
+    class Unserializable:
+        def __repr__(self):
+            raise AssertionError("serialized a filtered record")
+
+    log, output = configured_logger(monkeypatch, format="json", level="WARNING")
+    log.info("adsb info", adsb_data=Unserializable())
+    assert output.calls == []
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        configure_logging(format="xml")
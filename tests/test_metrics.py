@@ -0,0 +1,155 @@
+from unittest import mock
+import urllib.request
+
+import pytest
+from pytest_httpserver import HTTPServer
+
+from plane_spotter.adsb import ADSBExchange
+from plane_spotter.clock import VirtualClock
+from plane_spotter.dispatcher import NotificationDispatcher
+from plane_spotter.geolocator import Geolocator
+from plane_spotter.loop import main_loop
+from plane_spotter.metrics import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsServer,
+    Registry,
+    TextfileExporter,
+    _Metric,
+)
+from tests.conftest import NotificationStub, write_airport_csv
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    REGISTRY.reset()
+    yield
+    REGISTRY.reset()
+
+
+def test_render():
+    registry = Registry()
+    requests = Counter("requests", "Requests made.", ("endpoint",), registry)
+    depth = Gauge("depth", "Queue depth.", registry=registry)
+    latency = Histogram(
+        "latency_seconds", "Latency.", buckets=(0.1, 1), registry=registry
+    )
+
+    requests.labels(endpoint="hex").inc()
+    requests.labels(endpoint="hex").inc(2)
+    requests.labels(endpoint='we"ird').inc()
+    depth.set(3)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+
+    assert registry.render() == (
+        "# HELP requests Requests made.\n"
+        "# TYPE requests counter\n"
+        'requests_total{endpoint="hex"} 3.0\n'
+        'requests_total{endpoint="we\\"ird"} 1.0\n'
+        "# HELP depth Queue depth.\n"
+        "# TYPE depth gauge\n"
+        "depth 3.0\n"
+        "# HELP latency_seconds Latency.\n"
+        "# TYPE latency_seconds histogram\n"
+        'latency_seconds_bucket{le="0.1"} 1.0\n'
+        'latency_seconds_bucket{le="1.0"} 2.0\n'
+        'latency_seconds_bucket{le="+Inf"} 3.0\n'
+        "latency_seconds_sum 5.55\n"
+        "latency_seconds_count 3.0\n"
+    )
+
+
+def test_labels_must_match():
+    counter = Counter("things", "Things.", ("kind",), registry=None)
+    with pytest.raises(ValueError):
+        counter.labels(other="x")
+    with pytest.raises(ValueError):
+        counter.inc()
+
+
+def test_metrics_must_implement_samples():
+    class Incomplete(_Metric):
+        kind = "untyped"
+
+        def _child(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "Incomplete.", registry=None)
+
+
+def test_adsb_requests_are_recorded(httpserver: HTTPServer):
+    httpserver.expect_request("/v2/hex/A835AF/").respond_with_json({})
+    httpserver.expect_request("/v2/callsign/N628TS/").respond_with_data(status=404)
+    with ADSBExchange(
+        key="foo", hostname="localhost", port=httpserver.port, https=False, retries=0
+    ) as adsb:
+        adsb.aircraft_last_position_by_hex_id("A835AF")
+        adsb.aircraft_by_callsign("N628TS")
+
+    text = REGISTRY.render()
+    assert 'plane_spotter_adsb_responses_total{endpoint="hex",status="200"} 1.0' in text
+    assert (
+        'plane_spotter_adsb_responses_total{endpoint="callsign",status="404"} 1.0'
+        in text
+    )
+    assert 'plane_spotter_adsb_request_seconds_count{endpoint="hex"} 1' in text
+
+
+def test_notifications_are_recorded():
+    with NotificationDispatcher(NotificationStub()) as dispatcher:
+        dispatcher.send("Airplane landed")
+    text = REGISTRY.render()
+    assert (
+        'plane_spotter_notifications_total{backend="NotificationStub",outcome="sent"}'
+        " 1.0" in text
+    )
+    assert "plane_spotter_notification_queue_depth 0.0" in text
+
+
+def test_main_loop_lag_is_zero_on_schedule(airport_csv_path, notification_stub):
+    write_airport_csv(airport_csv_path)
+    clock = VirtualClock()
+
+    def poll(hex_id):
+        # Each poll takes a while, which mustn't count as lag
+        clock.advance(5)
+        return mock.Mock(
+            json=lambda: {"alt_baro": "ground", "lat": 38.704022, "lon": -101.473911}
+        )
+
+    adsb_backend = mock.Mock(aircraft_last_position_by_hex_id=poll)
+    main_loop(
+        adsb_backend=adsb_backend,
+        geolocator=Geolocator(airport_code_file=airport_csv_path),
+        notification_backend=notification_stub,
+        search_radius=100,
+        icao_hex_id="a835af",
+        loop_interval=120,
+        num_loops=3,
+        clock=clock,
+    )
+
+    # Three polls and the two waits between them
+    assert clock.monotonic() == 3 * 5 + 2 * 120
+    assert 'plane_spotter_loop_lag_seconds{loop="main"} 0.0' in REGISTRY.render()
+
+
+def test_exporters(tmp_path):
+    Counter("exported", "Exported.", registry=REGISTRY).inc()
+    try:
+        with MetricsServer(port=0) as server:
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{server.port}/metrics"
+            ) as response:
+                assert "exported_total 1.0" in response.read().decode()
+
+        metrics_file = tmp_path / "plane_spotter.prom"
+        with TextfileExporter(metrics_file, interval=60):
+            pass
+        assert "exported_total 1.0" in metrics_file.read_text()
+    finally:
+        REGISTRY._metrics.pop("exported")
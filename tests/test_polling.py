@@ -0,0 +1,183 @@
+import asyncio
+import json
+import re
+import time
+
+from pytest_httpserver import HTTPServer
+from testfixtures import compare
+from werkzeug import Request, Response
+
+from plane_spotter.adsb import AsyncADSBExchange
+from plane_spotter.clock import VirtualClock
+from plane_spotter.polling import (
+    Area,
+    RateLimiter,
+    poll_aircraft,
+    poll_aircraft_bulk,
+    poll_fleet,
+)
+
+
+def async_adsb_exchange(server: HTTPServer, **kwargs) -> AsyncADSBExchange:
+    return AsyncADSBExchange(
+        key="foo", hostname="localhost", port=server.port, https=False, **kwargs
+    )
+
+
+def slow_aircraft(request: Request) -> Response:
+    time.sleep(0.2)
+    hex_id = request.path.split("/")[-2]
+    return Response(f'{{"hex": "{hex_id}"}}', content_type="application/json")
+
+
+def test_poll_fleet_cycle_time_is_flat(threaded_httpserver: HTTPServer):
+    threaded_httpserver.expect_request(re.compile("/v2/hex/.*")).respond_with_handler(
+        slow_aircraft
+    )
+    hex_ids = [f"A{i:05X}" for i in range(20)]
+    observed: dict[str, dict] = {}
+
+    async def run():
+        async with async_adsb_exchange(threaded_httpserver, pool_maxsize=20) as adsb:
+            await poll_fleet(
+                adsb_backend=adsb,
+                hex_ids=hex_ids,
+                handle_observations=observed.update,
+                concurrency=20,
+                num_loops=1,
+            )
+
+    start = time.monotonic()
+    asyncio.run(run())
+    elapsed = time.monotonic() - start
+
+    compare(expected={hex_id: {"hex": hex_id} for hex_id in hex_ids}, actual=observed)
+    # Polled one at a time this would take 20 * 0.2 = 4 seconds
+    assert elapsed < 2
+
+
+def test_poll_aircraft_retries_and_skips_failures(httpserver: HTTPServer):
+    httpserver.expect_ordered_request("/v2/hex/A1/").respond_with_data(
+        "busy", status=503
+    )
+    httpserver.expect_ordered_request("/v2/hex/A1/").respond_with_json({"hex": "a1"})
+    httpserver.expect_request("/v2/hex/A2/").respond_with_data("missing", status=404)
+
+    async def run():
+        async with async_adsb_exchange(
+            httpserver, backoff_factor=0, backoff_jitter=0
+        ) as adsb:
+            return await poll_aircraft(
+                adsb, ["A1", "A2"], semaphore=asyncio.Semaphore(1)
+            )
+
+    compare(expected={"A1": {"hex": "a1"}}, actual=asyncio.run(run()))
+
+
+def test_rate_limiter():
+    async def run():
+        limiter = RateLimiter(rate=20, burst=1)
+        for _ in range(10):
+            await limiter.acquire()
+
+    start = time.monotonic()
+    asyncio.run(run())
+    # The first request starts immediately, the other nine 1/20 s apart
+    assert time.monotonic() - start >= 0.4
+
+
+def test_rate_limiter_waits_on_clock():
+    clock = VirtualClock()
+
+    async def run():
+        limiter = RateLimiter(rate=1, burst=1, clock=clock)
+        for _ in range(10):
+            await limiter.acquire()
+
+    start = time.monotonic()
+    asyncio.run(run())
+    # Waited out on the virtual clock, not in real time
+    compare(expected=9.0, actual=clock.monotonic())
+    assert time.monotonic() - start < 1
+
+
+def bulk_aircraft(request: Request) -> Response:
+    hex_ids = request.path.split("/")[-2].split(",")
+    aircraft = [{"hex": hex_id.lower()} for hex_id in hex_ids if hex_id != "MISSING"]
+    return Response(json.dumps({"ac": aircraft}), content_type="application/json")
+
+
+def test_poll_aircraft_bulk(httpserver: HTTPServer):
+    httpserver.expect_oneshot_request(
+        "/v2/lat/30.0/lon/-97.0/dist/250/"
+    ).respond_with_json(
+        {"ac": [{"hex": "a00000", "alt_baro": 9000}, {"hex": "ffffff"}]}
+    )
+    httpserver.expect_request(re.compile("/v2/hex/.*")).respond_with_handler(
+        bulk_aircraft
+    )
+    hex_ids = ["A00000"] + [f"A{i:05X}" for i in range(1, 250)] + ["MISSING"]
+
+    async def run():
+        async with async_adsb_exchange(httpserver) as adsb:
+            return await poll_aircraft_bulk(
+                adsb,
+                hex_ids,
+                semaphore=asyncio.Semaphore(2),
+                areas=[Area(lat=30.0, lon=-97.0, dist=250)],
+                max_hex_ids_per_request=100,
+            )
+
+    observations = asyncio.run(run())
+
+    # Results are keyed by the hex ids as requested
+    compare(expected=hex_ids[:-1], actual=sorted(observations))
+    compare(expected={"hex": "a00000", "alt_baro": 9000}, actual=observations["A00000"])
+    # One area request, then the 250 aircraft not in it in three batches
+    requests = [request.path for request, _ in httpserver.log]
+    assert len(requests) == 4
+    assert all("A00000" not in path for path in requests[1:])
+
+
+def test_poll_aircraft_bulk_keeps_response_time(httpserver: HTTPServer):
+    httpserver.expect_request("/v2/hex/A1,A2/").respond_with_json(
+        {
+            "ac": [{"hex": "a1", "seen_pos": 1.5}, {"hex": "a2", "ctime": 5000}],
+            "ctime": 1671668713823,
+        }
+    )
+
+    async def run():
+        async with async_adsb_exchange(httpserver) as adsb:
+            return await poll_aircraft_bulk(
+                adsb, ["A1", "A2"], semaphore=asyncio.Semaphore(1)
+            )
+
+    observations = asyncio.run(run())
+    compare(
+        expected={
+            "A1": {"hex": "a1", "seen_pos": 1.5, "ctime": 1671668713823},
+            "A2": {"hex": "a2", "ctime": 5000},
+        },
+        actual=observations,
+    )
+
+
+def test_poll_fleet_bulk_skips_failures(httpserver: HTTPServer):
+    httpserver.expect_request("/v2/hex/A1,A2/").respond_with_data("busy", status=500)
+    observed: list[dict] = []
+
+    async def run():
+        async with async_adsb_exchange(
+            httpserver, retries=0, backoff_factor=0, backoff_jitter=0
+        ) as adsb:
+            await poll_fleet(
+                adsb_backend=adsb,
+                hex_ids=["A1", "A2"],
+                handle_observations=observed.append,
+                bulk=True,
+                num_loops=1,
+            )
+
+    asyncio.run(run())
+    compare(expected=[{}], actual=observed)
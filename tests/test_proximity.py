@@ -0,0 +1,92 @@
+import random
+
+import numpy as np
+import pytest
+from testfixtures import compare
+
+from plane_spotter.geolocator import Geolocator
+from plane_spotter.proximity import (
+    ProximityMask,
+    coordinates_sha256,
+    load_proximity_mask,
+    mask_path,
+)
+from tests.conftest import write_airport_csv
+from tests.test_geolocator import random_airport_csv
+
+
+@pytest.fixture
+def random_airport_csv_path(airport_csv_path):
+    write_airport_csv(airport_csv_path, random_airport_csv(num_airports=1000))
+    return airport_csv_path
+
+
+@pytest.mark.parametrize("radius", [1, 50, 300, 2500, 30000])
+def test_mask_never_rejects_reachable_points(random_airport_csv_path, radius):
+    linear = Geolocator(airport_code_file=random_airport_csv_path, spatial_index=False)
+    masked = Geolocator(airport_code_file=random_airport_csv_path)
+    (mask,) = masked.proximity_masks(radius)
+
+    rand = random.Random(radius)
+    points = [(rand.uniform(-90, 90), rand.uniform(-180, 180)) for _ in range(200)]
+    points += [(-16.5, 180.0), (-16.5, -180.0), (90.0, 0.0), (-90.0, 0.0)]
+    for point in points:
+        match = linear.lookup_airport(coordinates=point, max_distance=radius)
+        if match is not None:
+            assert mask.may_be_near(point), (point, match)
+        compare(
+            expected=match,
+            actual=masked.lookup_airport(coordinates=point, max_distance=radius),
+        )
+
+
+def test_mask_rejects_far_points():
+    # Two airports either side of the antimeridian
+    mask = ProximityMask.build(
+        np.array([-16.5, -16.5]), np.array([179.99, -179.99]), 50
+    )
+
+    assert mask.may_be_near((-16.5, 179.8))
+    assert mask.may_be_near((-16.5, -179.8))
+    assert not mask.may_be_near((-16.5, 170.0))
+    assert not mask.may_be_near((0.0, 0.0))
+    # Only a few cells around the airports are set
+    assert mask.cells.sum() < 50
+
+
+def test_mask_is_cached(tmp_path, monkeypatch):
+    latitudes = np.array([38.704022, 59.94919968])
+    longitudes = np.array([-101.473911, -151.695999146])
+    digest = coordinates_sha256(latitudes, longitudes)
+    path = mask_path(tmp_path / "airport-codes.bin", 100, digest)
+    compare(
+        expected=tmp_path / f"airport-codes.{digest.hex()[:16]}.100km.mask",
+        actual=path,
+    )
+
+    built = load_proximity_mask(latitudes, longitudes, 100, path=path)
+    assert path.exists()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("mask rebuilt")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ProximityMask, "build", fail)
+        loaded = load_proximity_mask(latitudes, longitudes, 100, path=path)
+    compare(expected=built.cells.tolist(), actual=loaded.cells.tolist())
+
+    # Rebuilt for other airports
+    moved = load_proximity_mask(latitudes + 1, longitudes, 100, path=path)
+    assert moved.may_be_near((39.704022, -101.473911))
+    assert ProximityMask.load(
+        path, 100, moved.cell_degrees, coordinates_sha256(latitudes + 1, longitudes)
+    )
+
+
+def test_mask_cache_is_optional(tmp_path):
+    path = tmp_path / "missing" / "airport-codes.100km.mask"
+
+    mask = load_proximity_mask(np.array([0.0]), np.array([0.0]), 100, path=path)
+
+    assert mask.may_be_near((0.0, 0.0))
+    assert not path.exists()
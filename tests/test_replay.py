@@ -0,0 +1,256 @@
+import asyncio
+import datetime
+import gzip
+import json
+import time
+
+import pytest
+from pytest_httpserver import HTTPServer
+from testfixtures import compare
+
+from plane_spotter.adsb import ADSBExchange, AsyncADSBExchange
+from plane_spotter.clock import VirtualClock
+from plane_spotter.geolocator import Geolocator
+from plane_spotter.notification import TOOK_OFF_MESSAGE
+from plane_spotter.replay import (
+    AsyncReplayADSBExchange,
+    ReplayADSBExchange,
+    TraceRecorder,
+    read_trace,
+)
+from plane_spotter.loop import fleet_main_loop, main_loop
+from plane_spotter.tracks import TrackStore
+from tests.conftest import write_airport_csv
+
+START = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+AERO_B_RANCH = (38.704022, -101.473911)
+LOWELL_FIELD = (59.94919968, -151.695999146)
+
+
+@pytest.fixture
+def geolocator(airport_csv_path) -> Geolocator:
+    write_airport_csv(airport_csv_path)
+    return Geolocator(airport_code_file=airport_csv_path)
+
+
+def adsb_data(hex_id: str, alt_baro, position: tuple[float, float]) -> dict:
+    return {"hex": hex_id, "alt_baro": alt_baro, "lat": position[0], "lon": position[1]}
+
+
+def write_trace(path, records: list[tuple[float, list[str], dict]]) -> None:
+    with gzip.open(path, "wt") as file:
+        for time_, path_, body in records:
+            record = {
+                "time": time_,
+                "path": path_,
+                "status": 200,
+                "body": json.dumps(body),
+            }
+            file.write(json.dumps(record) + "\n")
+
+
+def round_trip(hex_id: str, start: float) -> list[tuple[float, dict]]:
+    """Parked at Aero B Ranch, then a four hour flight to Lowell Field."""
+    return [
+        (start, adsb_data(hex_id, "ground", AERO_B_RANCH)),
+        (start + 3600, adsb_data(hex_id, 40000, AERO_B_RANCH)),
+        (start + 5 * 3600, adsb_data(hex_id, "ground", LOWELL_FIELD)),
+    ]
+
+
+def test_recorder_writes_every_response(httpserver: HTTPServer, tmp_path):
+    httpserver.expect_request("/v2/hex/a835af/").respond_with_json(
+        adsb_data("a835af", "ground", AERO_B_RANCH)
+    )
+    httpserver.expect_request("/v2/hex/BADC0DE/").respond_with_data(
+        "not found", status=404
+    )
+    clock = VirtualClock(start=START)
+    with TraceRecorder(tmp_path / "trace.jsonl.gz", clock=clock) as recorder:
+        with ADSBExchange(
+            key="foo",
+            hostname="localhost",
+            port=httpserver.port,
+            https=False,
+            recorder=recorder,
+        ) as adsb:
+            adsb.aircraft_last_position_by_hex_id("a835af")
+            clock.advance(60)
+            adsb.aircraft_last_position_by_hex_id("BADC0DE")
+
+    records = list(read_trace(tmp_path / "trace.jsonl.gz"))
+    compare(
+        expected=[
+            (START, ["hex", "a835af"], 200),
+            (START + 60, ["hex", "BADC0DE"], 404),
+        ],
+        actual=[(r["time"], r["path"], r["status"]) for r in records],
+    )
+    compare(
+        expected=adsb_data("a835af", "ground", AERO_B_RANCH),
+        actual=json.loads(records[0]["body"]),
+    )
+    assert records[1]["body"] == "not found"
+
+
+def test_async_recorder_skips_retried_responses(httpserver: HTTPServer, tmp_path):
+    httpserver.expect_oneshot_request("/v2/hex/a835af/").respond_with_data(
+        "unavailable", status=503
+    )
+    httpserver.expect_request("/v2/hex/a835af/").respond_with_json(
+        adsb_data("a835af", "ground", AERO_B_RANCH)
+    )
+
+    async def poll(recorder: TraceRecorder) -> None:
+        async with AsyncADSBExchange(
+            key="foo",
+            hostname="localhost",
+            port=httpserver.port,
+            https=False,
+            backoff_factor=0,
+            backoff_jitter=0,
+            recorder=recorder,
+        ) as adsb:
+            await adsb.aircraft_last_position_by_hex_id("a835af")
+
+    with TraceRecorder(tmp_path / "trace.jsonl.gz") as recorder:
+        asyncio.run(poll(recorder))
+
+    # Only the response the caller got, like ADSBExchange records
+    compare(
+        expected=[200],
+        actual=[r["status"] for r in read_trace(tmp_path / "trace.jsonl.gz")],
+    )
+
+
+def test_replay_serves_latest_observation(tmp_path):
+    trace = tmp_path / "trace.jsonl.gz"
+    write_trace(
+        trace,
+        [
+            (START, ["hex", "a835af,a2ae0a"], {"ac": [adsb_data("a835af", 1, (1, 1))]}),
+            (START + 60, ["hex", "a835af"], adsb_data("a835af", 2, (2, 2))),
+        ],
+    )
+    clock = VirtualClock(start=START - 1)
+    replay = ReplayADSBExchange(trace, clock=clock)
+    compare(expected=(START, START + 60), actual=(replay.start_time, replay.end_time))
+    compare(expected=["a835af"], actual=replay.hex_ids)
+
+    assert replay.aircraft_last_position_by_hex_id("A835AF").status_code == 404
+    clock.advance(1)
+    assert replay.aircraft_last_position_by_hex_id("A835AF").json()["alt_baro"] == 1
+    clock.advance(90)
+    assert replay.aircraft_last_position_by_hex_id("A835AF").json()["alt_baro"] == 2
+    compare(
+        expected={"ac": [adsb_data("a835af", 2, (2, 2))]},
+        actual=replay.aircraft_by_hex_ids(["a835af", "a2ae0a"]).json(),
+    )
+
+
+def test_main_loop_replays_flight(tmp_path, geolocator, notification_stub):
+    trace = tmp_path / "trace.jsonl.gz"
+    write_trace(
+        trace,
+        [(t, ["hex", "a835af"], data) for t, data in round_trip("a835af", START)],
+    )
+    clock = VirtualClock(start=START)
+
+    main_loop(
+        adsb_backend=ReplayADSBExchange(trace, clock=clock),
+        geolocator=geolocator,
+        notification_backend=notification_stub,
+        search_radius=100,
+        icao_hex_id="a835af",
+        loop_interval=120,
+        num_loops=6 * 30,
+        clock=clock,
+    )
+
+    messages = [call.kwargs["message"] for call in notification_stub.send.mock_calls]
+    assert len(messages) == 3
+    assert messages[0].startswith("Airplane is stationed at Aero B Ranch Airport")
+    assert messages[1] == TOOK_OFF_MESSAGE
+    assert messages[2].startswith("Airplane landed at Lowell Field")
+    # Flight time counts from when the airplane was found parked
+    assert "Flight Time: 5:00:00" in messages[2]
+    assert clock.time() == START + (6 * 30 - 1) * 120
+
+
+def test_main_loop_stores_track(tmp_path, geolocator, notification_stub):
+    trace = tmp_path / "trace.jsonl.gz"
+    write_trace(
+        trace,
+        [(t, ["hex", "a835af"], data) for t, data in round_trip("a835af", START)],
+    )
+    clock = VirtualClock(start=START)
+    track_store = TrackStore(tmp_path / "tracks")
+
+    main_loop(
+        adsb_backend=ReplayADSBExchange(trace, clock=clock),
+        geolocator=geolocator,
+        notification_backend=notification_stub,
+        search_radius=100,
+        icao_hex_id="a835af",
+        loop_interval=120,
+        num_loops=6 * 30,
+        track_store=track_store,
+        clock=clock,
+    )
+
+    compare(
+        expected=6 * 30, actual=len(track_store.track("a835af", START, clock.time()))
+    )
+    landed = notification_stub.send.mock_calls[2].kwargs["message"]
+    # Jumps straight from Aero B Ranch to Lowell Field
+    assert "Distance Flown: 4191 km" in landed
+    assert "Max Altitude: 40000 ft" in landed
+
+
+def test_fleet_replay_is_faster_than_real_time(tmp_path, geolocator, notification_stub):
+    """A week of flights for a hundred aircraft replays in a few seconds."""
+    hex_ids = [f"a{i:05x}" for i in range(100)]
+    days = 7
+    records = []
+    for day in range(days):
+        flights = [round_trip(hex_id, START + day * 86400) for hex_id in hex_ids]
+        for step in range(3):
+            time_ = flights[0][step][0]
+            records.append(
+                (
+                    time_,
+                    ["hex", ",".join(hex_ids)],
+                    {"ac": [f[step][1] for f in flights]},
+                )
+            )
+        # Fly back overnight so every day has the same round trip
+        back = START + day * 86400 + 12 * 3600
+        records.append(
+            (
+                back,
+                ["hex", ",".join(hex_ids)],
+                {"ac": [adsb_data(h, 40000, LOWELL_FIELD) for h in hex_ids]},
+            )
+        )
+    write_trace(tmp_path / "trace.jsonl.gz", records)
+    clock = VirtualClock(start=START)
+
+    start = time.perf_counter()
+    fleet_main_loop(
+        adsb_backend=AsyncReplayADSBExchange(tmp_path / "trace.jsonl.gz", clock=clock),
+        geolocator=geolocator,
+        notification_backend=notification_stub,
+        search_radius=100,
+        icao_hex_ids=hex_ids,
+        loop_interval=600,
+        num_loops=days * 24 * 6,
+        bulk=True,
+        clock=clock,
+    )
+    assert time.perf_counter() - start < 30
+
+    messages = [call.kwargs["message"] for call in notification_stub.send.mock_calls]
+    landings = [m for m in messages if m.startswith("Airplane landed")]
+    # Each day lands at Lowell Field, and from the second day on at Aero B
+    # Ranch too
+    assert len(landings) == len(hex_ids) * (2 * days - 1)
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from pytest_httpserver import HTTPServer
+from testfixtures import compare
+
+from plane_spotter.adsb import AsyncADSBExchange
+from plane_spotter.polling import poll_scheduled
+from plane_spotter.scheduler import (
+    FlightPhase,
+    PollIntervals,
+    PollScheduler,
+    flight_phase,
+    vertical_rate,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.parametrize(
+    "adsb_data,near_airport,rate,expected",
+    [
+        ({"alt_baro": "ground", "gs": 0}, True, None, FlightPhase.PARKED),
+        ({"alt_baro": "ground"}, True, None, FlightPhase.PARKED),
+        ({"alt_baro": "ground", "gs": 15}, True, None, FlightPhase.TAXIING),
+        ({"alt_baro": 43000}, False, 0, FlightPhase.CRUISE),
+        ({"alt_baro": 3000}, True, None, FlightPhase.APPROACH),
+        ({"alt_baro": 9000}, False, -1200, FlightPhase.DESCENDING),
+        ({"alt_baro": 3000}, True, -800, FlightPhase.DESCENDING),
+        ({"alt_baro": 3000}, True, 1500, FlightPhase.APPROACH),
+    ],
+)
+def test_flight_phase(adsb_data, near_airport, rate, expected):
+    assert flight_phase(adsb_data, near_airport, rate) is expected
+
+
+def test_vertical_rate():
+    # Reported rates take precedence over the altitude trend
+    assert vertical_rate({"alt_baro": 5000, "baro_rate": -640}, (0, 9000), 60) == -640
+    assert vertical_rate({"alt_baro": 5000, "geom_rate": 128}, None, 60) == 128
+    assert vertical_rate({"alt_baro": 5000}, (0, 6000), 120) == -500
+    assert vertical_rate({"alt_baro": 5000}, None, 120) is None
+    assert vertical_rate({"alt_baro": "ground"}, (0, 500), 120) is None
+
+
+def test_scheduler_orders_by_due_time():
+    clock = Clock()
+    intervals = PollIntervals(parked=600, cruise=120, descending=20)
+    scheduler = PollScheduler(intervals, clock=clock)
+    scheduler.add(["parked", "cruise", "descending"])
+    compare(expected=["parked", "cruise", "descending"], actual=scheduler.pop_due())
+    assert scheduler.time_until_due() is None
+
+    scheduler.observe("parked", {"alt_baro": "ground", "gs": 0})
+    scheduler.observe("cruise", {"alt_baro": 40000, "baro_rate": 0})
+    scheduler.observe("descending", {"alt_baro": 8000, "baro_rate": -1500})
+    assert scheduler.time_until_due() == 20
+
+    clock.now = 119
+    compare(expected=["descending"], actual=scheduler.pop_due())
+    clock.now = 600
+    compare(expected=["cruise", "parked"], actual=scheduler.pop_due())
+
+
+def test_scheduler_reschedules_and_detects_descent_from_altitude():
+    clock = Clock()
+    scheduler = PollScheduler(PollIntervals(cruise=120, descending=20), clock=clock)
+    assert scheduler.observe("a835af", {"alt_baro": 40000}) is FlightPhase.CRUISE
+    clock.now = 120
+    assert scheduler.observe("a835af", {"alt_baro": 38000}) is FlightPhase.DESCENDING
+    # Only the latest schedule counts
+    assert len(scheduler) == 1
+    assert scheduler.next_due() == 140
+
+    scheduler.failed("a835af")
+    assert scheduler.next_due() == 150
+
+
+def test_scheduler_approach_uses_near_airport():
+    near = {"a835af"}
+    scheduler = PollScheduler(
+        PollIntervals(),
+        near_airport=lambda hex_id: hex_id in near,
+        clock=Clock(),
+    )
+    assert scheduler.observe("a835af", {"alt_baro": 3000}) is FlightPhase.APPROACH
+    assert scheduler.observe("a2ae0a", {"alt_baro": 3000}) is FlightPhase.CRUISE
+
+
+def test_poll_scheduled_polls_due_aircraft(httpserver: HTTPServer):
+    httpserver.expect_request("/v2/hex/A1/").respond_with_json(
+        {"alt_baro": 8000, "baro_rate": -1500}
+    )
+    httpserver.expect_request("/v2/hex/A2/").respond_with_json({"alt_baro": "ground"})
+    intervals = PollIntervals(parked=60, descending=0.1)
+    scheduler = PollScheduler(intervals)
+    scheduler.add(["A1", "A2"])
+    batches: list[list[str]] = []
+
+    async def run():
+        async with AsyncADSBExchange(
+            key="foo", hostname="localhost", port=httpserver.port, https=False
+        ) as adsb:
+            await poll_scheduled(
+                adsb_backend=adsb,
+                scheduler=scheduler,
+                handle_observations=lambda obs: batches.append(sorted(obs)),
+                num_loops=3,
+            )
+
+    asyncio.run(run())
+
+    # The descending aircraft is polled again while the parked one waits
+    compare(expected=[["A1", "A2"], ["A1"], ["A1"]], actual=batches)
+    compare(
+        expected={"A1": FlightPhase.DESCENDING, "A2": FlightPhase.PARKED},
+        actual=scheduler.phases,
+    )
@@ -0,0 +1,80 @@
+import datetime
+import sqlite3
+
+import pytest
+from testfixtures import compare
+
+from plane_spotter.geolocator import Airport, AirportDiscovery
+from plane_spotter.state import StateStore
+from plane_spotter.tracker import AircraftTracker, TrackerState, unknown_airport
+
+NOW = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+AIRPORT = Airport(
+    ident="00AA",
+    type="small_airport",
+    name="Aero B Ranch Airport",
+    coordinates=(38.704022, -101.473911),
+)
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    return tmp_path / "state.sqlite3"
+
+
+def test_state_store_round_trip(state_path):
+    tracker = AircraftTracker(icao_hex_id="a835af", now=NOW)
+    tracker.update(
+        {"alt_baro": "ground"},
+        AirportDiscovery(airport=AIRPORT, discovery_time=NOW),
+    )
+    with StateStore(state_path) as store:
+        store.save(tracker)
+        store.save(AircraftTracker(icao_hex_id="a2ae0a", now=NOW))
+
+    with StateStore(state_path) as store:
+        compare(
+            expected={
+                "a835af": TrackerState(
+                    icao_hex_id="a835af",
+                    last_landed_airport=AirportDiscovery(
+                        airport=AIRPORT, discovery_time=NOW
+                    ),
+                    in_flight=False,
+                    last_observation={"alt_baro": "ground"},
+                ),
+                "a2ae0a": TrackerState(
+                    icao_hex_id="a2ae0a",
+                    last_landed_airport=unknown_airport(NOW),
+                    in_flight=False,
+                ),
+            },
+            actual=store.states,
+        )
+        restored = AircraftTracker(icao_hex_id="a835af")
+        assert store.restore(restored)
+        compare(expected=tracker.state(), actual=restored.state())
+        assert not store.restore(AircraftTracker(icao_hex_id="ffffff"))
+
+
+def test_state_store_batches_writes(state_path):
+    with StateStore(state_path, flush_interval=60) as store:
+        tracker = AircraftTracker(icao_hex_id="a835af", now=NOW)
+        for altitude in range(1000, 5000, 1000):
+            tracker.update({"alt_baro": altitude}, unknown_airport(NOW))
+            store.save(tracker)
+        # Nothing is written until the flush interval passes or the store closes
+        rows = sqlite3.connect(state_path).execute("SELECT * FROM aircraft")
+        compare(expected=[], actual=rows.fetchall())
+
+    with StateStore(state_path) as store:
+        assert store.states["a835af"].in_flight
+        compare(
+            expected={"alt_baro": 4000},
+            actual=store.states["a835af"].last_observation,
+        )
+
+
+def test_state_store_rejects_unknown_synchronous(state_path):
+    with pytest.raises(ValueError):
+        StateStore(state_path, synchronous="sometimes")
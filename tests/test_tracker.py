@@ -0,0 +1,179 @@
+import datetime
+
+import pytest
+from testfixtures import compare
+
+from plane_spotter.geolocator import Airport, AirportDiscovery, Geolocator
+from plane_spotter.tracker import (
+    AircraftTracker,
+    FleetTracker,
+    Landed,
+    Stationed,
+    TookOff,
+    unknown_airport,
+)
+from tests.conftest import write_airport_csv
+
+NOW = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+AERO_B_RANCH = (38.704022, -101.473911)
+LOWELL_FIELD = (59.94919968, -151.695999146)
+
+
+@pytest.fixture
+def geolocator(airport_csv_path) -> Geolocator:
+    write_airport_csv(airport_csv_path)
+    return Geolocator(airport_code_file=airport_csv_path)
+
+
+def observation(coordinates: tuple[float, float], alt_baro="ground", **fields) -> dict:
+    return {
+        "alt_baro": alt_baro,
+        "lat": coordinates[0],
+        "lon": coordinates[1],
+        **fields,
+    }
+
+
+def at(ident: str) -> AirportDiscovery:
+    return AirportDiscovery(airport=Airport(ident=ident), discovery_time=NOW)
+
+
+def test_aircraft_tracker_full_flight():
+    tracker = AircraftTracker(icao_hex_id="a835af", now=NOW)
+
+    compare(
+        expected=[Stationed(icao_hex_id="a835af", airport=at("00AA"))],
+        actual=tracker.update({"alt_baro": "ground"}, at("00AA")),
+    )
+    compare(expected=[], actual=tracker.update({"alt_baro": "ground"}, at("00AA")))
+    compare(
+        expected=[TookOff(icao_hex_id="a835af", source=at("00AA"))],
+        actual=tracker.update({"alt_baro": 43000}, at("00AA")),
+    )
+    compare(
+        expected=[], actual=tracker.update({"alt_baro": 43000}, unknown_airport(NOW))
+    )
+    compare(
+        expected=[
+            Landed(icao_hex_id="a835af", source=at("00AA"), destination=at("00AK"))
+        ],
+        actual=tracker.update({"alt_baro": "ground"}, at("00AK")),
+    )
+    assert not tracker.in_flight
+    compare(expected=at("00AK"), actual=tracker.last_landed_airport)
+
+
+def test_aircraft_tracker_starts_in_flight():
+    tracker = AircraftTracker(icao_hex_id="a835af", now=NOW)
+
+    compare(expected=[], actual=tracker.update({"alt_baro": 43000}, at("00AA")))
+    assert tracker.in_flight
+    compare(
+        expected=[
+            Landed(
+                icao_hex_id="a835af",
+                source=unknown_airport(NOW),
+                destination=at("00AK"),
+            )
+        ],
+        actual=tracker.update({"alt_baro": "ground"}, at("00AK")),
+    )
+
+
+def test_fleet_tracker_tracks_aircraft_independently(geolocator):
+    fleet = FleetTracker(
+        geolocator=geolocator, search_radius=100, icao_hex_ids=["a1", "a2"]
+    )
+
+    events = fleet.update(
+        {"a1": observation(AERO_B_RANCH), "a2": observation(LOWELL_FIELD, 3000)},
+        now=NOW,
+    )
+    compare(expected=["a1"], actual=[event.icao_hex_id for event in events])
+    assert isinstance(events[0], Stationed)
+
+    events = fleet.update(
+        {"a1": observation(AERO_B_RANCH, 1000), "a2": observation(LOWELL_FIELD)},
+        now=NOW,
+    )
+    compare(
+        expected=[(TookOff, "a1"), (Landed, "a2")],
+        actual=[(type(event), event.icao_hex_id) for event in events],
+    )
+    compare(expected="Lowell Field", actual=events[1].destination.airport.name)
+    compare(expected=2, actual=len(fleet))
+
+
+def test_fleet_tracker_starts_tracking_new_aircraft(geolocator):
+    fleet = FleetTracker(geolocator=geolocator, search_radius=100)
+
+    fleet.update({"a3": observation(LOWELL_FIELD)}, now=NOW)
+
+    assert "a3" in fleet
+    compare(expected="00AK", actual=fleet["a3"].last_landed_airport.airport.ident)
+
+
+def test_fleet_tracker_skips_aircraft_without_position(geolocator, log):
+    fleet = FleetTracker(geolocator=geolocator, search_radius=100)
+
+    events = fleet.update(
+        {
+            "a1": observation(AERO_B_RANCH),
+            "a2": {"alt_baro": "ground"},
+            "a3": {"alt_baro": 43000, "lat": None, "lon": None},
+            "a4": observation(LOWELL_FIELD),
+        },
+        now=NOW,
+    )
+
+    compare(
+        expected=[(Stationed, "a1"), (Stationed, "a4")],
+        actual=[(type(e), e.icao_hex_id) for e in events],
+    )
+    assert "a2" not in fleet and "a3" not in fleet
+    assert {
+        "event": "skipping aircraft without a position",
+        "level": "info",
+        "icao_hex_ids": ["a2", "a3"],
+    } in log.events
+
+
+def test_aircraft_tracker_is_repeat():
+    tracker = AircraftTracker(icao_hex_id="a835af", now=NOW)
+    first = observation(AERO_B_RANCH, ctime=1671668713823, seen_pos=60.179)
+
+    assert not tracker.is_repeat(first)
+    tracker.update(first, at("00AA"))
+    # The same position served again ten seconds later
+    assert tracker.is_repeat(
+        observation(AERO_B_RANCH, ctime=1671668723823, seen_pos=70.179)
+    )
+    assert not tracker.is_repeat(
+        observation(AERO_B_RANCH, ctime=1671668723823, seen_pos=0.5)
+    )
+    # Without the fields nothing counts as a repeat
+    assert not tracker.is_repeat(observation(AERO_B_RANCH))
+
+
+def test_fleet_tracker_skips_repeated_positions(geolocator, monkeypatch):
+    fleet = FleetTracker(geolocator=geolocator, search_radius=100)
+    parked = observation(AERO_B_RANCH, ctime=1671668713823, seen_pos=1.0)
+    fleet.update({"a1": parked}, now=NOW)
+
+    looked_up = []
+    lookup_airports = geolocator.lookup_airports
+
+    def spy(coords, max_distance):
+        looked_up.extend(coords)
+        return lookup_airports(coords=coords, max_distance=max_distance)
+
+    monkeypatch.setattr(geolocator, "lookup_airports", spy)
+    repeat = observation(AERO_B_RANCH, 1000, ctime=1671668773823, seen_pos=61.0)
+    events = fleet.update({"a1": repeat, "a2": observation(LOWELL_FIELD)}, now=NOW)
+
+    # a1 taking off isn't noticed, the position report is the same one
+    compare(
+        expected=[(Stationed, "a2")], actual=[(type(e), e.icao_hex_id) for e in events]
+    )
+    compare(expected=[LOWELL_FIELD], actual=looked_up)
+    assert not fleet["a1"].in_flight
@@ -0,0 +1,136 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+from testfixtures import compare
+
+from plane_spotter.geolocator import Airport, AirportDiscovery
+from plane_spotter.tracks import (
+    GROUND,
+    MISSING,
+    TRACK_DTYPE,
+    TrackStore,
+    decode_chunk,
+    encode_chunk,
+    observation_record,
+)
+
+START = datetime.datetime(2022, 1, 1, 22, tzinfo=datetime.timezone.utc)
+
+
+def position(i: int, alt_baro=30000) -> dict:
+    return {"lat": 38.0 + i * 0.01, "lon": -101.0, "alt_baro": alt_baro, "gs": 400.5}
+
+
+def test_observation_record():
+    record = observation_record(
+        {"lat": 38.704022, "lon": -101.473911, "alt_baro": "ground", "track": 171.56},
+        time=1671668653.644,
+    )
+    assert record is not None
+    compare(
+        expected=(1671668653644, 38704022, -101473911, GROUND, MISSING, 17156),
+        actual=record[0].item(),
+    )
+    assert observation_record({"alt_baro": "ground"}, time=0) is None
+
+
+def test_chunk_round_trip():
+    rng = np.random.default_rng(0)
+    records = np.zeros(1000, dtype=TRACK_DTYPE)
+    records["time"] = 1671668653644 + np.cumsum(rng.integers(0, 120_000, 1000))
+    for name in ("lat", "lon", "alt_baro", "gs", "heading"):
+        records[name] = rng.integers(MISSING, 2**31 - 1, 1000)
+
+    compare(
+        expected=records.tolist(), actual=decode_chunk(encode_chunk(records)).tolist()
+    )
+    compare(expected=[], actual=decode_chunk(encode_chunk(records[:0])).tolist())
+
+
+def test_track_range_reads_across_days(tmp_path):
+    store = TrackStore(tmp_path)
+    start = START.timestamp()
+    for i in range(240):
+        assert store.append("A835AF", position(i), time=start + i * 60)
+
+    # The first day was compacted once positions moved on to the next
+    compare(
+        expected=["2022-01-01.trackz", "2022-01-02.track"],
+        actual=sorted(os.listdir(tmp_path / "a835af")),
+    )
+    track = store.track(
+        "a835af", START + datetime.timedelta(minutes=90), start + 150 * 60
+    )
+    compare(expected=61, actual=len(track))
+    compare(expected=start + 90 * 60, actual=track.times[0])
+    compare(expected=38.9, actual=track.latitudes[0])
+    compare(expected=400.5, actual=track.ground_speeds[0])
+    compare(expected=0, actual=len(store.track("a835af", 0, start - 1)))
+
+
+def test_repeated_positions_are_dropped(tmp_path):
+    store = TrackStore(tmp_path)
+    parked = {**position(0), "ctime": 1671668713823, "seen_pos": 60.179}
+
+    assert store.append("a835af", parked, time=1671668713.8)
+    assert not store.append(
+        "a835af",
+        {**parked, "ctime": 1671668723823, "seen_pos": 70.179},
+        time=1671668723.8,
+    )
+    # Also after a restart
+    assert not TrackStore(tmp_path).append("a835af", parked, time=1671668733.8)
+    compare(expected=1, actual=len(store.track("a835af", 0, 2e9)))
+
+
+def test_torn_record_is_ignored(tmp_path):
+    store = TrackStore(tmp_path)
+    store.append("a835af", position(0), time=START.timestamp())
+    with open(tmp_path / "a835af" / "2022-01-01.track", "ab") as file:
+        file.write(b"\x00" * 5)
+
+    compare(expected=1, actual=len(store.track("a835af", 0, 2e9)))
+
+
+def test_compact_closed_days(tmp_path):
+    store = TrackStore(tmp_path)
+    for i in range(10):
+        store.append("a1", position(i), time=START.timestamp() + i)
+    before = store.track("a1", START, START + datetime.timedelta(hours=1)).records
+
+    compare(expected=0, actual=store.compact(before=datetime.date(2022, 1, 1)))
+    compare(expected=1, actual=store.compact(before=datetime.date(2022, 1, 2)))
+    compare(expected=["2022-01-01.trackz"], actual=os.listdir(tmp_path / "a1"))
+    compare(
+        expected=before.tolist(),
+        actual=store.track(
+            "a1", START, START + datetime.timedelta(hours=1)
+        ).records.tolist(),
+    )
+
+
+def test_flight_stats(tmp_path):
+    store = TrackStore(tmp_path)
+    start = START.timestamp()
+    store.append("a1", position(0, alt_baro="ground"), time=start)
+    store.append("a1", position(100, alt_baro=41000), time=start + 3600)
+    store.append("a1", position(200, alt_baro="ground"), time=start + 7200)
+    # After landing
+    store.append("a1", position(300, alt_baro="ground"), time=start + 9000)
+
+    source = AirportDiscovery(airport=Airport(ident="00AA"), discovery_time=START)
+    destination = AirportDiscovery(
+        airport=Airport(ident="00AK"),
+        discovery_time=START + datetime.timedelta(hours=2),
+    )
+    stats = store.flight("a1", source, destination).stats()
+
+    assert stats is not None
+    compare(expected=3, actual=stats.points)
+    # Two degrees of latitude
+    assert stats.distance_km == pytest.approx(222.4, abs=0.1)
+    compare(expected=datetime.timedelta(hours=2), actual=stats.duration)
+    compare(expected=41000.0, actual=stats.max_altitude_ft)
+    compare(expected=400.5, actual=stats.max_ground_speed_kt)
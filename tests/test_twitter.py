@@ -0,0 +1,306 @@
+import json
+import threading
+import time
+from unittest import mock
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.keys import Keys
+from testfixtures import compare
+
+from plane_spotter.browser_pool import BrowserPool
+from plane_spotter.twitter import (
+    COMPOSER,
+    COMPOSER_PLACEHOLDER,
+    EMAIL_INPUT,
+    HOME_LINK,
+    HOME_URL,
+    PASSWORD_INPUTS,
+    TWEET_BUTTON,
+    TWEET_SENT_TOAST,
+    UNUSUAL_ACTIVITY_INPUT,
+    TwitterSelenium,
+    session_cookies_valid,
+)
+
+AUTH_COOKIE = {"name": "auth_token", "value": "secret", "domain": ".twitter.com"}
+
+
+class FakeTwitterDriver:
+    """Pretends to be a browser on twitter.com, logged in once it has a valid
+    auth_token cookie."""
+
+    def __init__(self, accept_session: bool = True):
+        self.accept_session = accept_session
+        self.cookies: list[dict] = []
+        self.local_storage: dict[str, str] = {}
+        self.current_url = "about:blank"
+
+    def get(self, url: str):
+        logged_in = self.accept_session and any(
+            cookie["name"] == "auth_token" for cookie in self.cookies
+        )
+        if url == HOME_URL and not logged_in:
+            url = "https://twitter.com/i/flow/login"
+        self.current_url = url
+
+    def add_cookie(self, cookie: dict):
+        self.cookies.append(cookie)
+
+    def get_cookies(self) -> list[dict]:
+        return self.cookies
+
+    def execute_script(self, script: str, *args):
+        if "setItem" in script:
+            self.local_storage.update(args[0])
+        elif "localStorage" in script:
+            return dict(self.local_storage)
+        return 1
+
+    def find_element(self, by, value):
+        if self.current_url != HOME_URL:
+            raise NoSuchElementException(value)
+        return object()
+
+    def quit(self):
+        pass
+
+
+def twitter(session_file, driver: FakeTwitterDriver) -> TwitterSelenium:
+    return TwitterSelenium(
+        email="elon@example.com",
+        password="hunter2",
+        dry_run=False,
+        browser_pool=BrowserPool(factory=lambda: driver),
+        session_file=session_file,
+        session_check_timeout=1,
+    )
+
+
+def fake_login(twitter_selenium: TwitterSelenium):
+    def login(log):
+        twitter_selenium.webdriver.cookies.append(AUTH_COOKIE)
+        twitter_selenium.webdriver.local_storage["theme"] = "dark"
+
+    return mock.Mock(side_effect=login)
+
+
+@pytest.mark.parametrize(
+    "cookies,expected",
+    [
+        ([], False),
+        ([{"name": "guest_id", "value": "1"}], False),
+        ([AUTH_COOKIE], True),
+        ([dict(AUTH_COOKIE, expiry=2000)], True),
+        ([dict(AUTH_COOKIE, expiry=500)], False),
+    ],
+)
+def test_session_cookies_valid(cookies, expected):
+    assert session_cookies_valid(cookies, now=1000) is expected
+
+
+def test_login_saves_session_then_restores_it(tmp_path, monkeypatch):
+    session_file = tmp_path / "session.json"
+
+    first = twitter(session_file, FakeTwitterDriver())
+    first.__enter__()
+    first_login = fake_login(first)
+    monkeypatch.setattr(first, "_login", first_login)
+    first.login()
+    first_login.assert_called_once()
+    compare(
+        expected={"cookies": [AUTH_COOKIE], "local_storage": {"theme": "dark"}},
+        actual=json.loads(session_file.read_text()),
+    )
+    assert session_file.stat().st_mode & 0o077 == 0
+
+    driver = FakeTwitterDriver()
+    second = twitter(session_file, driver)
+    second.__enter__()
+    second_login = fake_login(second)
+    monkeypatch.setattr(second, "_login", second_login)
+    second.login()
+    second_login.assert_not_called()
+    compare(expected=[AUTH_COOKIE], actual=driver.cookies)
+    compare(expected={"theme": "dark"}, actual=driver.local_storage)
+    assert driver.current_url == HOME_URL
+
+
+@pytest.mark.parametrize(
+    "session,accept_session",
+    [
+        ({"cookies": [dict(AUTH_COOKIE, expiry=1)]}, True),
+        ({"cookies": [AUTH_COOKIE]}, False),
+        ("not json", True),
+    ],
+    ids=["expired", "rejected", "corrupt"],
+)
+def test_full_login_when_session_unusable(
+    tmp_path, monkeypatch, session, accept_session
+):
+    session_file = tmp_path / "session.json"
+    session_file.write_text(
+        json.dumps(session) if isinstance(session, dict) else session
+    )
+
+    twitter_selenium = twitter(session_file, FakeTwitterDriver(accept_session))
+    twitter_selenium.__enter__()
+    login = fake_login(twitter_selenium)
+    monkeypatch.setattr(twitter_selenium, "_login", login)
+    start = time.monotonic()
+    twitter_selenium.login()
+    login.assert_called_once()
+    # A rejected session is noticed as soon as Twitter redirects to login
+    assert time.monotonic() - start < 1
+
+
+class FakeElement:
+    def __init__(self, on_return=None, on_click=None):
+        self.keys: list[str] = []
+        self.on_return = on_return
+        self.on_click = on_click
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def send_keys(self, *keys):
+        self.keys.extend(keys)
+        if Keys.RETURN in keys and self.on_return is not None:
+            self.on_return()
+
+    def click(self):
+        if self.on_click is not None:
+            self.on_click()
+
+
+class FakePageDriver(FakeTwitterDriver):
+    """Shows only the elements in self.page."""
+
+    def __init__(self):
+        super().__init__()
+        self.page: dict[tuple[str, str], FakeElement] = {}
+
+    def get(self, url: str):
+        self.current_url = url
+
+    def find_element(self, by, value):
+        try:
+            return self.page[(by, value)]
+        except KeyError:
+            raise NoSuchElementException(value)
+
+
+def login_page(driver: FakePageDriver, challenge: bool) -> dict[str, FakeElement]:
+    elements = {
+        "email": FakeElement(),
+        "challenge": FakeElement(),
+        "password": FakeElement(),
+    }
+
+    def show(name, locator):
+        return lambda: driver.page.update({locator: elements[name]})
+
+    elements["email"].on_return = (
+        show("challenge", UNUSUAL_ACTIVITY_INPUT)
+        if challenge
+        else show("password", PASSWORD_INPUTS[1])
+    )
+    elements["challenge"].on_return = show("password", PASSWORD_INPUTS[0])
+    elements["password"].on_return = lambda: driver.page.update(
+        {HOME_LINK: FakeElement()}
+    )
+    driver.page[EMAIL_INPUT] = elements["email"]
+    return elements
+
+
+@pytest.mark.parametrize("challenge", [False, True])
+def test_login_does_not_wait_out_timeouts(challenge):
+    driver = FakePageDriver()
+    elements = login_page(driver, challenge=challenge)
+    twitter_selenium = TwitterSelenium(
+        email="elon@example.com",
+        password="hunter2",
+        username="elonmusk",
+        sleep_interval=5,
+        dry_run=False,
+        browser_pool=BrowserPool(factory=lambda: driver),
+    )
+    twitter_selenium.__enter__()
+
+    start = time.monotonic()
+    twitter_selenium.login()
+    assert time.monotonic() - start < 1
+
+    compare(expected=["hunter2", Keys.RETURN], actual=elements["password"].keys)
+    compare(
+        expected=["elonmusk", Keys.RETURN] if challenge else [],
+        actual=elements["challenge"].keys,
+    )
+    expected_steps = {"open login page", "submit email", "submit password"}
+    if challenge:
+        expected_steps.add("unusual activity challenge")
+    compare(expected=expected_steps, actual=set(twitter_selenium.step_durations))
+
+
+def logged_in_twitter(
+    driver: FakePageDriver, monkeypatch: pytest.MonkeyPatch, sleep_interval=5
+) -> TwitterSelenium:
+    twitter_selenium = TwitterSelenium(
+        email="elon@example.com",
+        password="hunter2",
+        sleep_interval=sleep_interval,
+        dry_run=False,
+        browser_pool=BrowserPool(factory=lambda: driver),
+    )
+    twitter_selenium.__enter__()
+    monkeypatch.setattr(twitter_selenium, "_login", mock.Mock())
+    driver.current_url = HOME_URL
+    driver.page[COMPOSER] = FakeElement()
+    driver.page[COMPOSER_PLACEHOLDER] = FakeElement()
+    return twitter_selenium
+
+
+def typing_hides_placeholder(action_chains: mock.Mock, driver: FakePageDriver):
+    chain = action_chains.return_value.move_to_element.return_value
+    chain.send_keys.return_value.perform.side_effect = lambda: driver.page.pop(
+        COMPOSER_PLACEHOLDER
+    )
+
+
+@mock.patch("plane_spotter.twitter.ActionChains")
+def test_send_waits_for_confirmation(action_chains, monkeypatch):
+    driver = FakePageDriver()
+    twitter_selenium = logged_in_twitter(driver, monkeypatch)
+    typing_hides_placeholder(action_chains, driver)
+    # Twitter confirms the tweet a bit after it is posted
+    driver.page[TWEET_BUTTON] = FakeElement(
+        on_click=lambda: threading.Timer(
+            0.3, driver.page.update, [{TWEET_SENT_TOAST: FakeElement()}]
+        ).start()
+    )
+
+    start = time.monotonic()
+    twitter_selenium.send("Airplane landed")
+    assert 0.3 <= time.monotonic() - start < 1
+    compare(
+        expected=["open composer", "write text", "post tweet"],
+        actual=list(twitter_selenium.step_durations),
+    )
+
+
+@mock.patch("plane_spotter.twitter.ActionChains")
+def test_send_warns_without_confirmation(action_chains, monkeypatch, log):
+    driver = FakePageDriver()
+    twitter_selenium = logged_in_twitter(driver, monkeypatch, sleep_interval=0.3)
+    typing_hides_placeholder(action_chains, driver)
+    driver.page[TWEET_BUTTON] = FakeElement()
+
+    # Not raised, the dispatcher would retry and tweet it again
+    twitter_selenium.send("Airplane landed")
+    assert {
+        "event": "Twitter did not confirm the tweet was sent",
+        "level": "warning",
+    } in log.events
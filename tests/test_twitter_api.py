@@ -0,0 +1,112 @@
+import threading
+import time
+
+from testfixtures import compare
+
+from plane_spotter.twitter_api import RateLimit, TwitterAPI
+from tests.conftest import TwitterAPIStub
+
+
+def twitter_api(stub: TwitterAPIStub, **kwargs) -> TwitterAPI:
+    return TwitterAPI(
+        consumer_key="key",
+        consumer_secret="secret",
+        access_token="token",
+        access_token_secret="token secret",
+        api_url=stub.url,
+        dry_run=False,
+        **kwargs,
+    )
+
+
+def test_send(twitter_api_stub: TwitterAPIStub, log):
+    with twitter_api(twitter_api_stub) as api:
+        api.send("Airplane landed")
+        api.send("Aircraft has taken off!")
+        compare(expected=99 - 1, actual=api.rate_limit.remaining)
+    compare(
+        expected=["Airplane landed", "Aircraft has taken off!"],
+        actual=twitter_api_stub.tweets,
+    )
+    assert [e["tweet_id"] for e in log.events if e["event"] == "tweet successful"] == [
+        "1",
+        "2",
+    ]
+
+
+def test_queues_while_rate_limited(twitter_api_stub: TwitterAPIStub):
+    twitter_api_stub.limit = twitter_api_stub.remaining = 2
+    twitter_api_stub.window = 0.5
+    twitter_api_stub.reset = time.time() + 0.5
+
+    with twitter_api(twitter_api_stub, close_timeout=10) as api:
+        start = time.monotonic()
+        for i in range(5):
+            api.send(f"tweet {i}")
+        # Sending never waits for the window to reset
+        assert time.monotonic() - start < 0.5
+        assert api.queued == 3
+
+    # The first limited send learns the limit from the headers; after that
+    # tweets are held back instead of being sent to be refused.
+    compare(expected=[f"tweet {i}" for i in range(5)], actual=twitter_api_stub.tweets)
+    assert twitter_api_stub.refused == 0
+
+
+def test_send_does_not_wait_for_queued_posts(
+    twitter_api_stub: TwitterAPIStub, monkeypatch
+):
+    posting = threading.Event()
+    release = threading.Event()
+
+    with twitter_api(twitter_api_stub, close_timeout=10) as api:
+        post = api._post
+
+        def slow_post(message, log):
+            if message == "queued":
+                posting.set()
+                release.wait()
+            return post(message, log)
+
+        monkeypatch.setattr(api, "_post", slow_post)
+        api.rate_limit = RateLimit(limit=1, remaining=0, reset=time.time() + 0.1)
+        api.send("queued")
+        assert posting.wait(5)
+
+        # Released regardless, so a send() that waits fails rather than hangs
+        threading.Timer(1, release.set).start()
+        start = time.monotonic()
+        api.send("next")
+        assert time.monotonic() - start < 0.5
+        release.set()
+
+    # Held back behind the queued tweet rather than overtaking it
+    compare(expected=["queued", "next"], actual=twitter_api_stub.tweets)
+
+
+def test_close_logs_dropped_tweets(twitter_api_stub: TwitterAPIStub, log):
+    with twitter_api(twitter_api_stub, close_timeout=0.1) as api:
+        api.rate_limit = RateLimit(limit=1, remaining=0, reset=time.time() + 60)
+        api.send("tweet 0")
+        api.send("tweet 1")
+
+    compare(expected=[], actual=twitter_api_stub.tweets)
+    assert {
+        "event": "close timeout expired, dropping queued tweets",
+        "level": "error",
+        "class_name": "TwitterAPI",
+        "dropped": 2,
+        "timeout": 0.1,
+    } in log.events
+
+
+def test_dry_run(twitter_api_stub: TwitterAPIStub):
+    with TwitterAPI(
+        consumer_key="key",
+        consumer_secret="secret",
+        access_token="token",
+        access_token_secret="token secret",
+        api_url=twitter_api_stub.url,
+    ) as api:
+        api.send("Airplane landed")
+    compare(expected=[], actual=twitter_api_stub.tweets)